@@ -26,6 +26,7 @@ import nltk
 import os
 import requests
 import string 
+import sys
 
 ### NLTK Download
 # Note: To download nltk products, you need to run the nltk downloader. If you 
@@ -42,75 +43,24 @@ from nltk.stem import WordNetLemmatizer
 # ----------------------------------------------------------------------------
 #%% Loop through our data folder (note: in Spyder you'll have to open a project
 # in our working directory to do this) and read in all of our files
-# Initialize an empty dataframe to hold all of our text
-text_df = pd.DataFrame(columns = ["lines", "essay"])
 
 # Note that we need to go back one folder to the parent directory so that we can actually access the Data/ folder
 parent_dir = os.path.realpath('')
 
-# List all of the files in our Data folder
-files = os.listdir(parent_dir + "/Data/")
+# The loading lives in Code/corpus.py so every module numbers the lines the
+# same way: every non-blank line of every essay, in sorted file order, with a
+# line_index counting across the corpus. (We used to read each file with
+# pd.read_csv(delimiter = '\n'), which skipped "bad" lines and treated '"' as a
+# quote character, so its line numbers drifted from essay 9 on.)
+sys.path.append(parent_dir + "/Code")
+import corpus
 
-# We may have non-text files in here, so let's remove these from our lists
-txt_files = filter(lambda x: x[-5:] == '.txt', files)
-
-txt_files = [x for x in files if x[-4:] == '.txt']
-print(txt_files)  # only text files
-
-
-# Loop through all text files and read them into singular dataframe
-for text_file in txt_files:
-    
-    print(f"\n============================")
-    print(f"About to load {text_file} in")
-    print(f"============================")
-        
-    temp_df = pd.read_csv(parent_dir + '/Data/' + text_file, # Read the text file in our data folder
-                          delimiter = '\n', # Looks like every line ends with \n
-                          header = None, # Read from the first line
-                          names = ["lines"], # Column header
-                          error_bad_lines = False) # Skip bad lines (there are like 6 across all essays)
-    
-    # Add the file name in so we have the essay number for reference
-    temp_df['essay'] = text_file
-    
-    # Append the temporary dataframe with all corresponding text into our master dataframe
-    text_df = text_df.append(temp_df)
+text_df = corpus.load_lines(parent_dir + "/Data/")
 
 # Take a look at our data
 print(text_df.head(10))
 
 
-#%% Lemmatization
-# Because a lot of the words are similar, but not exactly (like state and states), 
-# we'll use a lemmatization method to find the canonical version of each.
-lemmatizer = nltk.stem.WordNetLemmatizer()
-
-# Initialize two dataframes:
-    # 1. Error DataFrame | This will keep track of any words that have issues in
-    #                       the lemmatizer
-    # 2. Lemmatized DataFrame | This will be a copy of our original dataframe
-error_df = pd.DataFrame(columns = ['idx', 'word', 'line', 'essay'])
-
-#%%
-# The following function would map the treebank tags to WordNet part of speech names
-# This specifically helps with lemmatizing based on the word's part of speech
-from nltk.corpus import wordnet
-
-def get_wordnet_pos(treebank_tag):
-
-    if treebank_tag.startswith('J'):
-        return wordnet.ADJ
-    elif treebank_tag.startswith('V'):
-        return wordnet.VERB
-    elif treebank_tag.startswith('N'):
-        return wordnet.NOUN
-    elif treebank_tag.startswith('R'):
-        return wordnet.ADV
-    else:
-        return ''
-    
-
 #%% It's important to ensure that the text we keep is meaningful.
 # To assist with this, we want to filter out any stop words, which don't
 # mean much to us
@@ -122,150 +72,84 @@ stop.extend(['would', 'may', 'yet', 'must', 'shall', 'not', 'still', 'let',
              'much'])
 
 
-#%% Define a word check that returns what we'd like
-def lemmatize_words(word, pos):
-    '''
-    A function to lemmatize a word and, if not, return the lowercase version
-    of the original word
-    
-    Parameters
-    ----------
-    word : string
-        word to be lemmatized.
-    pos : string
-        part of speech of the word.
-
-    Returns
-    -------
-    lemmatized_word : string
-        lemmatized word.
-
-    '''
-    
-    # Make everything lowercase and lemmatize based on pos                    
-    try:
-        # Lemmatize our word using the predefined function in the previous cell
-        lemmatized_word = lemmatizer.lemmatize(word.lower(), pos = get_wordnet_pos(pos))
-    # For some words, the lemmatizer isn't working. Let's log these and revisit
-    # them later
-    except:
-        # If we hit an error, let's just keep the word as is
-        lemmatized_word = word.lower()
-    
-    print(f"\t\t* Keeping\t{word} \t-->\t\t{lemmatized_word}")
-        
-    return lemmatized_word
-
 # ----------------------------------------------------------------------------
-#%%                              Part of Speech Tagging
+#%%                      Part of Speech Tagging + Lemmatization
 # ----------------------------------------------------------------------------
-# Next, we'll try to build out a dataframe, simultaneously taking out stop words
-# and tagging the parts of speech.
-
-# Initialize empty lists for each of the columns we'll want
-index_list = []
-essay_list = []
-line_list = []
-word_list = []
-lemmatized_word_list = []
-part_of_speech_list = []
-
-
-# Start by converting our two columns to lists so they're easier to work with
-lines = list(text_df['lines'])
-essays = list(text_df['essay'])
-
-
-# Let's zip the lists together so we can simultaneously iterate through them
-for idx, item in enumerate(zip(lines, essays)):
-    # if idx > 100:
-    #     break
-    print("\n\n===========================================")
-    print(f"\t\t\t\tIndex {idx}:")
-    print("===========================================")
-    
-    # Build a list of tokens for the given line
-    tokens = nltk.word_tokenize(item[0])
-        
-    # Figure out the parts of speech for each word in our line
-    pos_tags = nltk.pos_tag(tokens)
-    print(f"{item}\n")
-    
-    # Loop through our words and parts of speech to lemmatize and remove stop words
-    for word, pos in pos_tags:
-        # Filter out any stop words (all lowercase) or punctuation
-        if word.lower() in stop or word in string.punctuation or not word.isalpha():
-            print(f"Removing '{word}'")
-            continue
-        else:
-            lemmatized_word = lemmatize_words(word, pos)
-        
-        # Now we can append our results to our lists above
-        index_list.append(idx)
-        essay_list.append(item[1])
-        line_list.append(item[0])
-        word_list.append(word)
-        lemmatized_word_list.append(lemmatized_word)
-        part_of_speech_list.append(pos)
-
-
-#%% Append results to dataframe
-cleaned_df = pd.DataFrame(list(zip(index_list, essay_list, line_list, word_list, 
-                      lemmatized_word_list, part_of_speech_list)),
-               columns = ['line_index', 'essay', 'lines', 'word', 'lemmatized_word', 
-                          'part_of_speech'])
+# Next, we'll build out our tokens, simultaneously taking out stop words,
+# tagging the parts of speech and lemmatizing each word. Because a lot of the
+# words are similar, but not exactly (like state and states), we use WordNet's
+# lemmatizer (told the word's part of speech) to find the canonical version of
+# each; words it can't handle are kept lowercase as they are.
+#
+# The loop lives in pos_tagging.tag_corpus() so pipeline.py builds exactly the
+# same table. It tags and appends one essay at a time, so we never hold the
+# (word, tag) pairs for the whole corpus at once.
 
+# Pick the part of speech tagger (see Code/pos_tagging.py):
+    # 'nltk'       | nltk.pos_tag on every line (the original behaviour)
+    # 'perceptron' | same tagger and tags, loaded once and run an essay at a time
+    # 'lookup'     | much faster lookup + suffix tagger, less accurate
+TAGGER_BACKEND = 'perceptron'
 
+# The lines are hard-wrapped, so tagging them one at a time hands the tagger
+# sentence fragments. With this on, we rebuild whole sentences first, tag those
+# and hand the tags back line by line (see Code/sentences.py)
+SENTENCE_TAGGING = True
 
-# ----------------------------------------------------------------------------
-#                                   Data Cleaning
-# ----------------------------------------------------------------------------
-#%% The essays come in in the format 'Essay22.txt', and we'd prefer if it just 
-# said 'Essay 22'
-# Remove .txt first
-cleaned_df['essay'] = cleaned_df['essay'].str.replace('.txt', '')
+import pos_tagging
+
+# The tokens go in a compact token table rather than a list per column (typed
+# arrays plus one copy of each distinct string, see Code/token_table.py).
+# With sentence tagging we also keep the tagged sentences for the stylometry
+# features below, so the corpus is only tagged once.
+tagged = pos_tagging.tag_corpus(text_df,
+                                backend = TAGGER_BACKEND,
+                                sentence_tagging = SENTENCE_TAGGING,
+                                data_dir = parent_dir + "/Data/",
+                                stop = set(stop),
+                                verbose = True,
+                                return_sentences = SENTENCE_TAGGING)
 
-# Put a space in between 'essay' and the number of the essay
-cleaned_df['essay'] = cleaned_df['essay'].str.replace('essay', 'Essay ')
+if SENTENCE_TAGGING:
+    tokens_table, fed_sentences = tagged
+else:
+    tokens_table = tagged
 
-# We may also have None (NA) types in the dataframe. Let's drop these
-cleaned_df['lines'].dropna(how = 'any')
 
-# Reset the index column for reference
-cleaned_df.reset_index(drop = True, inplace = True)
+# ----------------------------------------------------------------------------
+#%%                           Stylometry Features
+# ----------------------------------------------------------------------------
+# Sentence lengths and POS n-gram shares per essay (see Code/sentences.py),
+# from the sentences we just tagged.
+if SENTENCE_TAGGING:
+    import sentences
 
-# Because I use a Mac, some rows are .DS_Store, so let's filter those out
-cleaned_df_filtered = cleaned_df[cleaned_df['essay'] != '.DS_Store']
+    stylometry_df = sentences.stylometry_features(fed_sentences)
+    print(stylometry_df.iloc[:, :6].head(10))
+    stylometry_df.to_csv(parent_dir + "/Data/stylometry_features.csv")
 
 
 
-print(cleaned_df_filtered.head(10))
+# ----------------------------------------------------------------------------
+#                                   Data Cleaning
+# ----------------------------------------------------------------------------
+#%% The essays come in in the format 'essay22.txt', and we'd prefer if it just 
+# said 'Essay 22' (no leading zeros) so they match up to the authors_clean
+# dataframe when merging. corpus.load_lines() already named them that way with
+# corpus.essay_name(), which also copes with files that have no number in them.
+
+print(f"Tagged {len(tokens_table)} tokens in {tokens_table.nbytes / 1e6:.1f} MB")
 
 
 # ----------------------------------------------------------------------------
 #                                Tokenization
 # ----------------------------------------------------------------------------
-#%% Now that the data's looking generally clean, let's tokenize our data. That is,
-# our data is currently in the format such that each line in the text is a row
-# in our dataframe. We'd prefer that every row is a word
-
-# Start by creating a new copy of our dataframe
-tokenized_df = cleaned_df_filtered.copy()
-
-#Renamed the column here to "Essay" so that we can perform an inner join. 
-tokenized_df = tokenized_df.rename(columns = {'essay': 'Essay', 'word':'Word', 'lines': 'Lines'}) \
-    .reset_index(drop = True)
-
-#Rnamed all the Essays so that they would match up to the authors_clean dataframe when merging. 
-tokenized_df = tokenized_df.replace("Essay 01", "Essay 1") \
-    .replace("Essay 02", "Essay 2") \
-    .replace("Essay 03", "Essay 3") \
-    .replace("Essay 04", "Essay 4") \
-    .replace("Essay 05", "Essay 5") \
-    .replace("Essay 06", "Essay 6") \
-    .replace("Essay 07", "Essay 8") \
-    .replace("Essay 08", "Essay 8") \
-    .replace("Essay 09", "Essay 9")
+#%% Now that the data's looking generally clean, let's turn our token table
+# into a dataframe where every row is a word. The column names are the ones we
+# need to perform an inner join with the authorship data.
+tokenized_df = tokens_table.to_pandas()
+
+print(tokenized_df.head(10))
 
 
 
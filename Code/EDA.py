@@ -14,6 +14,10 @@ import numpy as np
 import nltk
 import seaborn as sns
 import matplotlib.pyplot as plt
+import sys
+
+# The helper modules (keyness.py) live next to this script in Code/
+sys.path.append("Code")
 
 ### NLTK Download
 # Note: To download nltk products, you need to run the nltk downloader. If you 
@@ -49,7 +53,7 @@ fed_nonstop = fed_nonstop[~fed_nonstop['Word'].isin(stop_Words)]
 #lemmatizer = nltk.stem.WordNetLemmatizer()
 
 #def lemmatize_text(text):
-    return [lemmatizer.lemmatize(w) for w in w_tokenizer.tokenize(text)]
+#    return [lemmatizer.lemmatize(w) for w in w_tokenizer.tokenize(text)]
 
 #fed_nonstop_words['lemmatized_text'] = fed_nonstop_words.apply(lemmatize_text)
 #print(fed_nonstop['text_lemmatized'])
@@ -349,100 +353,38 @@ viz8.figure.savefig("Viz/Word_Frequency_by_Document_Frequency.png")
 
 #%%
 # ----------------------------------------------------------------------------
-#                                   TF-IDF
+#                         Viz 9: Most Distinctive Words
 # ----------------------------------------------------------------------------
-# Building on our analysis above, we'll now look into the TF-IDF for each Word.
-####W should look for key Words that would are unique to each author. Eventually do TF-IDF code here. 
-
-# Let's start by calculating term frequency. While we've mostly been looking at the Word counts
-# across all documents, for term frequency, we care about the propoortion of times
-# the Word appears in a given document. Ex: If a sentence is 10 Words long and 
-# 'constitution' appears 3 times, its term frequency is .3 (30%).
-fed_analysis = merged_counts.copy()
-
-# Calculate the length of each Essay
-doc_lengths = fed_nonstop.groupby(['Essay']) \
-    .size() \
-    .reset_index(name = 'doc_length') \
-    .reset_index(drop = True)
-    
-# Now let's figure out how many times a Word appears in a given Essay
-Word_frequency = fed_nonstop.groupby(['Word', 'Essay']) \
-    .size() \
-    .reset_index(name = 'Word_freq') \
-    .sort_values('Word') \
-    .reset_index(drop = True)
-
-# With these two dataframes, we can bring them together to calculate our tf score
-merged_tf = pd.merge(Word_frequency, 
-                     doc_lengths, 
-                     left_on = 'Essay',
-                     right_on = 'Essay',
-                     how = 'inner')
-
-merged_tf['tf'] = merged_tf['Word_freq'] / merged_tf['doc_length']
-
-
-# We can pull the inverse document frequency from our merged_counts dataframe above
-fed_analysis['idf'] = np.log(85 / fed_analysis['doc_count'])
-
-# Let's merge these (again) into one big dataframe
-tf_idf_df = pd.merge(merged_tf,
-                     fed_analysis,
-                     left_on = 'Word',
-                     right_on = 'Word',
-                     how = 'inner')
+# Let's see which Words each author uses most distinctively. This will help us
+# identify the style of each author. Rather than ranking TF-IDF scores
+# (grouping on a float score mixes up Words that tie), we compare each author's
+# Word counts against everyone else's with a keyness statistic (Dunning's
+# log-likelihood), all authors at once. See Code/keyness.py.
+import keyness
 
-tf_idf_df['tf_idf'] = tf_idf_df['tf'] * tf_idf_df['idf']
+authors_top_words = keyness.top_keywords(fed_nonstop,
+                                         k = 10,
+                                         measure = 'log_likelihood',
+                                         group = 'Author',
+                                         term = 'Word')
 
-
-#%%
-# ----------------------------------------------------------------------------
-#                                Viz 9: Top TF-IDF
-# ----------------------------------------------------------------------------
-# Let's see which Words have the highest TF-IDF scores by author. This will
-# help us identify the style of each author by looking at the Words that they
-# use most uniquely.
-
-authors = fed_nonstop[['Essay', 'Author']].drop_duplicates()
-
-merged_df = tf_idf_df.merge(authors,
-                            left_on = 'Essay',
-                            right_on = 'Essay')
-
-authors_tf = merged_df.groupby(['tf_idf', 'Author', 'Word']) \
-    .size() \
-    .reset_index(name = 'tfidf') \
-    .sort_values('tf_idf', ascending = False) \
-    .reset_index(drop = True)
-    
-# Find our top 10 Words for each author
-authors_top_tf = authors_tf.groupby('Author')['tf_idf'] \
-    .nlargest(10, keep = 'first') \
-    .reset_index(name = "tf_idf")
-
-# Unfortunately this drops the actual Word, so let's merge it back on
-authors_top_tf = authors_top_tf.merge(authors_tf,
-                                      left_on = ['Author', 'tf_idf'],
-                                      right_on = ['Author', 'tf_idf'])
+print(authors_top_words)
 
 # Set the theme
 sns.set_style('white')
 sns.set_context('notebook')
 
 # Build the visualization
-viz9 = sns.FacetGrid(authors_top_tf, 
+viz9 = sns.FacetGrid(authors_top_words, 
                      col = "Author", 
                      sharex = False, 
                      sharey = False)
-viz9.map(sns.barplot, "tf_idf", "Word")
+viz9.map(sns.barplot, "log_likelihood", "Word")
 
 
 # Set our labels
-# Set our labels
-viz9.set(xlabel='tf_idf', ylabel='Word')
+viz9.set(xlabel='Log-likelihood', ylabel='Word')
 plt.show()
 
 # Save our plot to the Viz folder 
-viz9.savefig("Viz/Top_TF_IDF.png")
-
+viz9.savefig("Viz/Top_Keyness.png")
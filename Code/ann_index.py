@@ -0,0 +1,475 @@
+##ANN Index - Approximate nearest neighbours for essay similarity at scale
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to find similar documents without the exact
+# linear_kernel scan of text_analysis.py, which compares a query with every
+# document. That's fine for 85 essays but not for an archive of tens of
+# thousands of pamphlets and letters to compare the Unknown essays against.
+#
+# LSHIndex is a random-projection (SimHash) index for cosine similarity:
+#   1. every vector is projected onto n_tables * n_bits random directions and
+#      each table keys the vector by the signs of its n_bits projections, so
+#      vectors at a small angle tend to land in the same bucket,
+#   2. a query looks up its bucket in every table, plus (multi-probe) the
+#      buckets one bit flip away on its least certain bits, and
+#   3. the candidates are re-ranked exactly by cosine similarity.
+# More tables or probes find more of the true neighbours (recall) at the cost
+# of more candidates to score (latency); more bits per table do the opposite.
+# tradeoff() measures recall@k against the exact scan for a grid of settings.
+#
+# Vectors can be the sparse TF-IDF rows (similarity_service.build_model()) or
+# the dense LSA embeddings (lsa.build_lsa()). New vectors are added to small
+# delta buckets and folded into the sorted base tables once the delta has grown
+# by merge_ratio, the same amortized scheme as incremental.py.
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.metrics.pairwise import linear_kernel
+
+
+# ----------------------------------------------------------------------------
+#                                  Index
+# ----------------------------------------------------------------------------
+class LSHIndex:
+    '''
+    Random-projection LSH index over l2 normalised vectors.
+
+    Parameters
+    ----------
+    dim : int
+        number of dimensions of the vectors.
+    n_tables : int
+        number of hash tables. More tables, better recall, more candidates.
+    n_bits : int
+        bits per table key (at most 62). More bits, smaller buckets, fewer
+        candidates, lower recall.
+    n_probes : int
+        default number of extra buckets to look in per table (each one flips
+        one of the query's least certain bits).
+    merge_ratio : float
+        fold the delta buckets into the base tables once they hold this
+        fraction of the base.
+    random_state : int
+        seed for the projections.
+
+    '''
+
+    def __init__(self, dim, n_tables = 8, n_bits = 12, n_probes = 0, merge_ratio = 0.25,
+                 random_state = 0):
+        if not 0 < n_bits <= 62:
+            raise ValueError("n_bits must be between 1 and 62")
+
+        self.dim = dim
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.n_probes = n_probes
+        self.merge_ratio = merge_ratio
+
+        rng = np.random.default_rng(random_state)
+        self.planes = rng.standard_normal((dim, n_tables * n_bits)).astype(np.float32)
+        self._weights = (1 << np.arange(n_bits, dtype = np.int64))
+
+        # Vectors: the base rows stacked at the last merge, newer ones in
+        # blocks (one per add()) that are stacked when a query needs them
+        self._base = None
+        self._blocks = []
+        self._stacked = None
+        self.labels = []
+
+        # Base tables: for every table, keys sorted with the matching row ids
+        self._keys = np.empty((n_tables, 0), dtype = np.int64)
+        self._ids = np.empty((n_tables, 0), dtype = np.int64)
+        # Delta tables: key -> list of row ids, for rows added since the merge
+        self._delta = [{} for _ in range(n_tables)]
+        self._delta_keys = []
+        self._n_base = 0
+
+    def __len__(self):
+        return len(self.labels)
+
+    @classmethod
+    def from_model(cls, model, mode = 'tfidf', **kwargs):
+        '''
+        Index the rows of a similarity model.
+
+        Parameters
+        ----------
+        model : dict
+            from similarity_service.build_model() (and lsa.build_lsa() for
+            mode 'lsa').
+        mode : string
+            'tfidf' for the sparse TF-IDF rows, 'lsa' for the embeddings.
+        kwargs :
+            passed on to LSHIndex().
+
+        '''
+        vectors = model['embeddings'] if mode == 'lsa' else model['matrix']
+        index = cls(vectors.shape[1], **kwargs)
+        index.add(vectors, model['essays'])
+
+        return index
+
+    # ------------------------------------------------------------------------
+    #                                Hashing
+    # ------------------------------------------------------------------------
+    def _project(self, vectors):
+        projections = vectors @ self.planes
+        return np.asarray(projections).reshape(-1, self.n_tables, self.n_bits)
+
+    def _keys_of(self, projections):
+        # n_vectors x n_tables bucket keys from the signs of the projections
+        return ((projections > 0) * self._weights).sum(axis = 2)
+
+    @staticmethod
+    def _stack(blocks):
+        if sp.issparse(blocks[0]):
+            return sp.vstack(blocks, format = 'csr')
+        return np.vstack(blocks)
+
+    def _delta_vectors(self):
+        # The rows added since the last merge, stacked once per change
+        if self._stacked is None and self._blocks:
+            self._stacked = self._stack(self._blocks)
+            self._blocks = [self._stacked]
+
+        return self._stacked
+
+    def vectors(self):
+        '''
+        Every indexed vector, stacked in row order.
+        '''
+        blocks = ([] if self._base is None else [self._base]) + self._blocks
+        if not blocks:
+            return np.empty((0, self.dim), dtype = np.float32)
+
+        return self._stack(blocks)
+
+    def _scores(self, query, ids):
+        # Cosine similarity of one dense query row with the given rows, taking
+        # the base and delta rows from their own blocks
+        base = ids < self._n_base
+        scores = np.empty(len(ids))
+        if base.any():
+            scores[base] = np.asarray(self._base[ids[base]] @ query).ravel()
+        if not base.all():
+            scores[~base] = np.asarray(self._delta_vectors()[ids[~base] - self._n_base] @ query).ravel()
+
+        return scores
+
+    # ------------------------------------------------------------------------
+    #                              Adding Vectors
+    # ------------------------------------------------------------------------
+    def add(self, vectors, labels = None):
+        '''
+        Add vectors to the index. Cost is proportional to the vectors added
+        (plus, now and then, an amortized merge of the delta tables).
+
+        Parameters
+        ----------
+        vectors : array or sparse matrix
+            n x dim, l2 normalised rows.
+        labels : list, optional
+            label of each row (defaults to its row number).
+
+        Returns
+        -------
+        ids : array
+            row ids given to the new vectors.
+
+        '''
+        if sp.issparse(vectors):
+            vectors = sp.csr_matrix(vectors, dtype = np.float32)
+        else:
+            vectors = np.ascontiguousarray(vectors, dtype = np.float32)
+            if vectors.ndim == 1:
+                vectors = vectors[None, :]
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim} dimensions, got {vectors.shape[1]}")
+
+        start = len(self)
+        ids = np.arange(start, start + vectors.shape[0])
+        self._blocks.append(vectors)
+        self._stacked = None
+        self.labels.extend(ids if labels is None else labels)
+
+        keys = self._keys_of(self._project(vectors))
+        self._delta_keys.append(keys)
+
+        # Big enough to merge straight away, so no need to fill the delta buckets
+        if len(self) - self._n_base > max(self._n_base * self.merge_ratio, 256):
+            self.merge()
+            return ids
+
+        for t in range(self.n_tables):
+            bucket = self._delta[t]
+            for key, row in zip(keys[:, t].tolist(), ids.tolist()):
+                bucket.setdefault(key, []).append(row)
+
+        return ids
+
+    def merge(self):
+        '''
+        Fold the delta buckets into the sorted base tables.
+        '''
+        if not self._delta_keys:
+            return
+
+        new_keys = np.concatenate(self._delta_keys).T
+        new_ids = np.broadcast_to(np.arange(self._n_base, len(self)), new_keys.shape)
+
+        keys = np.concatenate([self._keys, new_keys], axis = 1)
+        ids = np.concatenate([self._ids, new_ids], axis = 1)
+        order = np.argsort(keys, axis = 1, kind = 'stable')
+
+        self._keys = np.take_along_axis(keys, order, axis = 1)
+        self._ids = np.take_along_axis(ids, order, axis = 1)
+        self._delta = [{} for _ in range(self.n_tables)]
+        self._delta_keys = []
+        self._n_base = len(self)
+
+        self._base = self.vectors()
+        self._blocks = []
+        self._stacked = None
+
+    # ------------------------------------------------------------------------
+    #                                Querying
+    # ------------------------------------------------------------------------
+    def _probe_keys(self, projections, n_probes):
+        # The query's own key per table, then keys with one of its n_probes
+        # least certain bits (smallest |projection|) flipped
+        keys = self._keys_of(projections[None])[0]
+        probes = [keys[:, None]]
+        if n_probes:
+            uncertain = np.argsort(np.abs(projections), axis = 1)[:, :n_probes]
+            probes.append(keys[:, None] ^ self._weights[uncertain])
+
+        return np.concatenate(probes, axis = 1)
+
+    def candidates(self, projections, n_probes = None):
+        '''
+        Row ids in the buckets a query (given by its projections) probes.
+        '''
+        n_probes = self.n_probes if n_probes is None else n_probes
+        probe_keys = self._probe_keys(projections, n_probes)
+
+        found = []
+        for t in range(self.n_tables):
+            keys = probe_keys[t]
+            lo = np.searchsorted(self._keys[t], keys, side = 'left')
+            hi = np.searchsorted(self._keys[t], keys, side = 'right')
+            found.extend(self._ids[t, a:b] for a, b in zip(lo, hi) if b > a)
+
+            bucket = self._delta[t]
+            if bucket:
+                found.extend(np.asarray(bucket[key]) for key in keys.tolist() if key in bucket)
+
+        if not found:
+            return np.empty(0, dtype = np.int64)
+
+        return np.unique(np.concatenate(found))
+
+    def query(self, vectors, k = 5, n_probes = None, exclude_self = False):
+        '''
+        Approximate k nearest neighbours (by cosine similarity) of each query.
+
+        Parameters
+        ----------
+        vectors : array or sparse matrix
+            n x dim, l2 normalised query rows.
+        k : int
+            neighbours per query.
+        n_probes : int, optional
+            extra buckets per table; defaults to the index's n_probes.
+        exclude_self : bool
+            leave out exact duplicates of the query (score 1), for querying
+            with vectors that are already in the index.
+
+        Returns
+        -------
+        ids : list
+            array of row ids per query, most similar first (can be shorter
+            than k if few candidates were found).
+        scores : list
+            the matching cosine similarities.
+        n_candidates : array
+            candidates scored for each query.
+
+        '''
+        if sp.issparse(vectors):
+            vectors = sp.csr_matrix(vectors, dtype = np.float32)
+        else:
+            vectors = np.atleast_2d(np.asarray(vectors, dtype = np.float32))
+
+        projections = self._project(vectors)
+
+        all_ids, all_scores, n_candidates = [], [], []
+        for i in range(vectors.shape[0]):
+            candidates = self.candidates(projections[i], n_probes)
+            n_candidates.append(len(candidates))
+
+            # One dense query row against the candidates' rows (a sparse-dense
+            # product, much cheaper than sparse-sparse)
+            query = vectors[i].toarray().ravel() if sp.issparse(vectors) else vectors[i]
+            scores = self._scores(query, candidates)
+            if exclude_self:
+                # float32 sums leave a vector's score with itself a few 1e-6
+                # short of 1
+                keep = scores < 1 - 1e-4
+                candidates, scores = candidates[keep], scores[keep]
+
+            n = min(k, len(candidates))
+            top = np.argpartition(-scores, n - 1)[:n] if n else np.empty(0, dtype = int)
+            top = top[np.argsort(-scores[top], kind = 'stable')]
+            all_ids.append(candidates[top])
+            all_scores.append(scores[top])
+
+        return all_ids, all_scores, np.array(n_candidates)
+
+
+# ----------------------------------------------------------------------------
+#                           Exact Search / Recall
+# ----------------------------------------------------------------------------
+def exact_neighbors(stored, vectors, k = 5, exclude_self = False, block_size = 256):
+    '''
+    The exact k nearest neighbours, by a blocked linear_kernel scan.
+    '''
+    ids = []
+    for start in range(0, vectors.shape[0], block_size):
+        scores = np.asarray(linear_kernel(vectors[start:start + block_size], stored))
+        if exclude_self:
+            scores[scores >= 1 - 1e-4] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis = 1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis = 1), axis = 1, kind = 'stable')
+        ids.extend(np.take_along_axis(top, order, axis = 1))
+
+    return ids
+
+
+def recall_at_k(approx_ids, exact_ids):
+    '''
+    Mean share of the exact k neighbours that the approximate search found.
+    '''
+    return float(np.mean([len(np.intersect1d(a, e)) / len(e) for a, e in zip(approx_ids, exact_ids)]))
+
+
+def synthetic_archive(matrix, n_documents, n_noise_terms = 50, random_state = 0):
+    '''
+    Make an archive-sized set of documents from the essays, to test at scale
+    before the real archive is loaded: each document mixes two random essays
+    with random weights and adds some random terms.
+
+    Parameters
+    ----------
+    matrix : sparse matrix
+        the essays' TF-IDF rows.
+    n_documents : int
+        documents to make.
+    n_noise_terms : int
+        random terms added to each document.
+    random_state : int
+        seed.
+
+    Returns
+    -------
+    archive : sparse matrix
+        n_documents x n_terms, l2 normalised rows.
+
+    '''
+    rng = np.random.default_rng(random_state)
+    matrix = sp.csr_matrix(matrix)
+    n_essays, n_terms = matrix.shape
+
+    first = rng.integers(n_essays, size = n_documents)
+    second = rng.integers(n_essays, size = n_documents)
+    weight = rng.uniform(0.2, 0.8, size = n_documents)
+
+    mix = sp.csr_matrix((np.r_[weight, 1 - weight],
+                         (np.r_[np.arange(n_documents), np.arange(n_documents)], np.r_[first, second])),
+                        shape = (n_documents, n_essays))
+    noise = sp.csr_matrix((rng.uniform(0, 0.1, size = n_documents * n_noise_terms),
+                           (np.repeat(np.arange(n_documents), n_noise_terms),
+                            rng.integers(n_terms, size = n_documents * n_noise_terms))),
+                          shape = (n_documents, n_terms))
+
+    archive = sp.csr_matrix(mix @ matrix + noise)
+    norms = np.sqrt(np.asarray(archive.multiply(archive).sum(axis = 1))).ravel()
+
+    return sp.csr_matrix(sp.diags(1 / np.maximum(norms, 1e-12)) @ archive)
+
+
+def tradeoff(stored, queries, k = 10, settings = None, random_state = 0):
+    '''
+    Measure recall@k and latency against the exact scan for several settings.
+
+    Parameters
+    ----------
+    stored : array or sparse matrix
+        vectors to index.
+    queries : array or sparse matrix
+        query vectors.
+    k : int
+        neighbours per query.
+    settings : list, optional
+        (n_tables, n_bits, n_probes) tuples to try.
+    random_state : int
+        seed for the projections.
+
+    Returns
+    -------
+    results : DataFrame
+        one row per setting with build seconds, ms per query, mean candidates
+        scored and recall@k, plus an 'exact' row for the full scan.
+
+    '''
+    if settings is None:
+        settings = [(4, 16, 0), (8, 16, 0), (8, 14, 2), (16, 14, 2), (16, 12, 4), (32, 12, 4)]
+
+    started = time.perf_counter()
+    exact = exact_neighbors(stored, queries, k)
+    n_queries = queries.shape[0]
+    rows = [{'setting': 'exact', 'build_s': 0.0,
+             'ms_per_query': 1e3 * (time.perf_counter() - started) / n_queries,
+             'candidates': stored.shape[0], 'recall_at_k': 1.0}]
+
+    for n_tables, n_bits, n_probes in settings:
+        started = time.perf_counter()
+        index = LSHIndex(stored.shape[1], n_tables, n_bits, n_probes, random_state = random_state)
+        index.add(stored)
+        index.merge()
+        built = time.perf_counter() - started
+
+        started = time.perf_counter()
+        ids, _, n_candidates = index.query(queries, k)
+        elapsed = time.perf_counter() - started
+
+        rows.append({'setting': f"{n_tables} tables x {n_bits} bits, {n_probes} probes",
+                     'build_s': built,
+                     'ms_per_query': 1e3 * elapsed / n_queries,
+                     'candidates': n_candidates.mean(),
+                     'recall_at_k': recall_at_k(ids, exact)})
+
+    return pd.DataFrame(rows).round(3)
+
+
+#%%
+if __name__ == '__main__':
+    import similarity_service
+
+    fed_model = similarity_service.build_model()
+
+    # Stand-in archive built from the essays, queried with the Unknown essays
+    archive = synthetic_archive(fed_model['matrix'], 20000)
+    unknown = [i for i, author in enumerate(fed_model['authors']) if author == 'Unknown']
+    fed_queries = fed_model['matrix'][unknown or list(range(len(fed_model['essays'])))]
+
+    print(tradeoff(archive, fed_queries, k = 10).to_string(index = False))
+
+    # Adding to the index as new documents come in
+    fed_index = LSHIndex.from_model(fed_model, n_tables = 16, n_bits = 12, n_probes = 2)
+    fed_index.add(archive[:1000], [f"Archive {i}" for i in range(1000)])
+    ids, scores, _ = fed_index.query(fed_queries[:1], k = 5, exclude_self = True)
+    print([(fed_index.labels[i], round(float(s), 3)) for i, s in zip(ids[0], scores[0])])
@@ -0,0 +1,328 @@
+##Collocations - Sparse co-occurrence counts and PMI collocations per author
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to find the word pairs each author habitually
+# puts together. The token table from Data Load Script.py keeps the words in
+# text order, so for every word we count the words that follow it within a
+# small window (never across essays) in a word-by-word sparse matrix.
+#
+# The pairs are gathered as COO triplets a chunk at a time and folded into a
+# CSR matrix whenever the chunk fills up, so memory is bounded by the chunk
+# size plus the distinct pairs seen, not by the length of the corpus. The
+# association scores are then computed over the non-zeros all at once:
+#   1. PMI      | log2 p(x, y) / p(x) p(y), how much more often the pair turns up
+#                 than chance. Overrates rare pairs, hence min_count.
+#   2. NPMI     | PMI / -log2 p(x, y), squeezed into [-1, 1].
+#   3. t-score  | (observed - expected) / sqrt(observed), which favours frequent
+#                 pairs we can be confident about.
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+import corpus
+
+
+MEASURES = ('npmi', 'pmi', 't_score')
+TOKEN_COLUMNS = ['Essay', 'Author', 'Word', 'lemmatized_word']
+
+
+# ----------------------------------------------------------------------------
+#                           Co-occurrence Counts
+# ----------------------------------------------------------------------------
+class CooccurrenceCounter:
+    '''
+    Windowed co-occurrence counts over a stream of integer-coded documents.
+
+    Entry (x, y) counts how often word y comes within `window` tokens after
+    word x in the same document.
+
+    Parameters
+    ----------
+    vocab_size : int
+        number of distinct codes.
+    window : int
+        how many following tokens count as co-occurring.
+    chunk_size : int
+        number of pairs to gather before folding them into the matrix. Caps
+        the scratch memory.
+
+    '''
+
+    def __init__(self, vocab_size, window = 5, chunk_size = 1 << 20):
+        self.vocab_size = vocab_size
+        self.window = window
+        self.chunk_size = chunk_size
+
+        self.counts = sp.csr_matrix((vocab_size, vocab_size), dtype = np.int64)
+        self.unigrams = np.zeros(vocab_size, dtype = np.int64)
+        self._rows = []
+        self._cols = []
+        self._pending = 0
+
+    def add_document(self, codes):
+        '''
+        Count the pairs in one document.
+        '''
+        codes = np.asarray(codes, dtype = np.int32)
+        self.unigrams += np.bincount(codes, minlength = self.vocab_size)
+
+        # Long documents are taken a piece at a time (each piece overlapping the
+        # next by the window) so one document can't blow through the chunk size
+        step = max(self.chunk_size // self.window, 1)
+        for start in range(0, len(codes), step):
+            piece = codes[start:start + step + self.window]
+            n_left = min(step, len(piece))
+
+            for d in range(1, self.window + 1):
+                n = min(n_left, len(piece) - d)
+                if n <= 0:
+                    break
+                self._rows.append(piece[:n])
+                self._cols.append(piece[d:d + n])
+                self._pending += n
+
+            if self._pending >= self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        '''
+        Fold the gathered pairs into the count matrix.
+        '''
+        if not self._pending:
+            return
+
+        rows = np.concatenate(self._rows)
+        cols = np.concatenate(self._cols)
+        # Converting to CSR adds up the duplicate pairs
+        chunk = sp.csr_matrix((np.ones(len(rows), dtype = np.int64), (rows, cols)),
+                              shape = (self.vocab_size, self.vocab_size))
+        self.counts = self.counts + chunk
+
+        self._rows, self._cols, self._pending = [], [], 0
+
+    def matrix(self):
+        '''
+        The count matrix (CSR), including any pairs not yet flushed.
+        '''
+        self.flush()
+
+        return self.counts
+
+
+def author_counters(documents, vocab_size, window = 5, chunk_size = 1 << 20):
+    '''
+    One CooccurrenceCounter per author, filled in one pass.
+
+    Parameters
+    ----------
+    documents : iterable
+        (essay, author, codes) tuples, as from
+        corpus.documents_from_tokens(); can be a generator.
+    vocab_size : int
+        number of distinct codes.
+    window, chunk_size : int
+        see CooccurrenceCounter.
+
+    Returns
+    -------
+    counters : dict
+        author -> CooccurrenceCounter.
+
+    '''
+    counters = {}
+    for _, author, codes in documents:
+        if author not in counters:
+            counters[author] = CooccurrenceCounter(vocab_size, window, chunk_size)
+        counters[author].add_document(codes)
+
+    return counters
+
+
+# ----------------------------------------------------------------------------
+#                           Association Scores
+# ----------------------------------------------------------------------------
+def association_scores(counts):
+    '''
+    PMI, NPMI and t-score of every non-zero pair, vectorized.
+
+    Probabilities are taken over the pairs themselves: p(x, y) is the pair's
+    share of all pairs, and p(x), p(y) the shares of pairs with x first and y
+    second (the row and column sums).
+
+    Parameters
+    ----------
+    counts : sparse matrix
+        word-by-word co-occurrence counts.
+
+    Returns
+    -------
+    scores : DataFrame
+        word_1 and word_2 (codes), count, expected, pmi, npmi and t_score, one
+        row per non-zero.
+
+    '''
+    counts = sp.coo_matrix(counts)
+    total = counts.sum()
+
+    rows_sum = np.asarray(counts.sum(axis = 1)).ravel()
+    cols_sum = np.asarray(counts.sum(axis = 0)).ravel()
+
+    observed = counts.data.astype(float)
+    expected = rows_sum[counts.row] * cols_sum[counts.col] / total
+    p_xy = observed / total
+
+    pmi = np.log2(observed / expected)
+    # A pair that is every pair there is has -log2 p(x, y) = 0
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        npmi = np.where(p_xy < 1, pmi / -np.log2(p_xy), 1.0)
+
+    return pd.DataFrame({'word_1': counts.row,
+                         'word_2': counts.col,
+                         'count': counts.data,
+                         'expected': expected,
+                         'pmi': pmi,
+                         'npmi': npmi,
+                         't_score': (observed - expected) / np.sqrt(observed)})
+
+
+def top_pairs(counts, vocab, k = 10, measure = 'npmi', min_count = 5):
+    '''
+    The k best pairs in one count matrix.
+
+    Parameters
+    ----------
+    counts : sparse matrix
+        word-by-word co-occurrence counts.
+    vocab : Index
+        word for each code.
+    k : int
+        pairs to return.
+    measure : string
+        'npmi', 'pmi' or 't_score' to rank by.
+    min_count : int
+        ignore pairs seen fewer times than this.
+
+    Returns
+    -------
+    pairs : DataFrame
+        word_1, word_2 (the words), count, expected and the three scores,
+        best first.
+
+    '''
+    if measure not in MEASURES:
+        raise ValueError(f"Unknown measure {measure!r}, pick one of {MEASURES}")
+
+    # Drop the rare pairs before scoring; PMI's marginals still use every pair
+    scores = association_scores(counts)
+    scores = scores[scores['count'] >= min_count]
+    scores = scores.nlargest(k, measure).reset_index(drop = True)
+
+    scores['word_1'] = vocab[scores['word_1']]
+    scores['word_2'] = vocab[scores['word_2']]
+
+    return scores
+
+
+# ----------------------------------------------------------------------------
+#                             Per Author Output
+# ----------------------------------------------------------------------------
+def top_collocations(tokens = None, k = 10, measure = 'npmi', term = 'lemmatized_word',
+                     window = 5, min_count = 5, chunk_size = 1 << 20):
+    '''
+    The top k collocations of every author.
+
+    Parameters
+    ----------
+    tokens : DataFrame, optional
+        one row per token with Essay and Author columns, each essay's tokens
+        together and in text order. Defaults to the token table from
+        corpus.load_tokens().
+    k : int
+        pairs per author.
+    measure : string
+        'npmi', 'pmi' or 't_score' to rank by.
+    term : string
+        column holding the words.
+    window : int
+        how many following tokens count as co-occurring.
+    min_count : int
+        ignore pairs an author uses fewer times than this.
+    chunk_size : int
+        see CooccurrenceCounter.
+
+    Returns
+    -------
+    collocations : DataFrame
+        Author, word_1, word_2, count, expected, pmi, npmi and t_score, best
+        first within each author.
+
+    '''
+    if tokens is None:
+        tokens = corpus.load_tokens(columns = TOKEN_COLUMNS)
+
+    documents, vocab = corpus.documents_from_tokens(tokens, term)
+    counters = author_counters(documents, len(vocab), window, chunk_size)
+
+    tables = [top_pairs(counter.matrix(), vocab, k, measure, min_count).assign(Author = author)
+              for author, counter in sorted(counters.items())]
+    collocations = pd.concat(tables, ignore_index = True)
+
+    return collocations[['Author'] + [c for c in collocations.columns if c != 'Author']]
+
+
+# ----------------------------------------------------------------------------
+#                                Benchmark
+# ----------------------------------------------------------------------------
+def benchmark(tokens = None, factors = (1, 10, 50), window = 5, chunk_size = 1 << 20,
+              term = 'lemmatized_word'):
+    '''
+    Count pairs over the corpus streamed `factor` times over, with the peak
+    memory, to show memory stays bounded as the corpus grows.
+
+    Returns
+    -------
+    timings : DataFrame
+        factor, tokens, seconds, tokens_per_second, nnz and peak_mb.
+
+    '''
+    if tokens is None:
+        tokens = corpus.load_tokens(columns = TOKEN_COLUMNS)
+
+    documents, vocab = corpus.documents_from_tokens(tokens, term)
+    n_tokens = sum(len(codes) for _, _, codes in documents)
+
+    rows = []
+    for factor in factors:
+        tracemalloc.start()
+        started = time.perf_counter()
+        counters = author_counters(corpus.scaled_documents(documents, factor),
+                                   len(vocab), window, chunk_size)
+        nnz = sum(counter.matrix().nnz for counter in counters.values())
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rows.append({'factor': factor,
+                     'tokens': n_tokens * factor,
+                     'seconds': round(elapsed, 3),
+                     'tokens_per_second': round(n_tokens * factor / elapsed),
+                     'nnz': nnz,
+                     'peak_mb': round(peak / 1e6, 2)})
+
+    return pd.DataFrame(rows)
+
+
+#%%
+if __name__ == '__main__':
+    fed_tokens = corpus.load_tokens(columns = TOKEN_COLUMNS)
+
+    for fed_measure in MEASURES:
+        print(f"\n{fed_measure}")
+        print(top_collocations(fed_tokens, k = 8, measure = fed_measure).round(3).to_string(index = False))
+
+    print(benchmark(fed_tokens))
@@ -0,0 +1,449 @@
+##Concordance - Inverted index and keyword-in-context search
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to search the tokenized corpus without scanning
+# the whole dataframe every time. We build an inverted index from every lemma
+# (and every raw word) to the positions it appears at, and keep the positions
+# as delta-encoded integer arrays. Each position maps back to its essay,
+# line_index and token offset within the line, so we can:
+#   1. print keyword-in-context (KWIC) concordances,
+#   2. find exact phrases ("common defense"), and
+#   3. run boolean queries (executive AND NOT senate) over all 85 essays.
+#
+# The index can be built from full_fedpapers.csv (stop words already removed,
+# lemmas from the NLTK lemmatizer) or straight from the raw essays, which keeps
+# every word so phrase queries match the text as written.
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+import corpus
+
+
+# ----------------------------------------------------------------------------
+#                              Token Tables
+# ----------------------------------------------------------------------------
+# Both loaders return the same columns: Essay, line_index, lines, Word and
+# lemmatized_word, one row per token in reading order.
+def tokens_from_csv(csv_path = corpus.FULL_FEDPAPERS_CSV):
+    '''
+    Load the token table written by Data Load Script.py.
+
+    Parameters
+    ----------
+    csv_path : string
+        path to full_fedpapers.csv.
+
+    Returns
+    -------
+    tokens : DataFrame
+        one row per (non stop word) token.
+
+    '''
+    return corpus.load_tokens(csv_path, ['Essay', 'line_index', 'Lines', 'Word', 'lemmatized_word']) \
+        .rename(columns = {'Lines': 'lines'})
+
+
+def tokens_from_lines(text_df = None):
+    '''
+    Tokenize the raw essay lines, keeping every alphabetic word.
+
+    Parameters
+    ----------
+    text_df : DataFrame, optional
+        output of corpus.load_lines(). Loaded if not given.
+
+    Returns
+    -------
+    tokens : DataFrame
+        one row per word. With no lemmatizer involved, the lemma is just the
+        lowercase word.
+
+    '''
+    if text_df is None:
+        text_df = corpus.load_lines()
+
+    words = text_df['lines'].str.findall('[A-Za-z]+')
+    tokens = text_df.assign(Word = words).explode('Word').dropna(subset = ['Word'])
+    tokens['lemmatized_word'] = tokens['Word'].str.lower()
+
+    return tokens[['Essay', 'line_index', 'lines', 'Word', 'lemmatized_word']] \
+        .reset_index(drop = True)
+
+
+# ----------------------------------------------------------------------------
+#                              Inverted Index
+# ----------------------------------------------------------------------------
+class PostingLists:
+    '''
+    Posting lists for one field, stored CSR style: every term's sorted token
+    positions are delta encoded and packed into one array. The first position of
+    each term is kept separately so the gaps fit in the smallest integer type.
+
+    Parameters
+    ----------
+    codes : array
+        term code of every token, in position order.
+    vocab : list
+        term for each code.
+
+    '''
+
+    def __init__(self, codes, vocab):
+        codes = np.asarray(codes)
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+
+        # Group the positions by term; the stable sort keeps them in position
+        # order within each term
+        positions = np.argsort(codes, kind = 'stable')
+        counts = np.bincount(codes, minlength = len(vocab))
+        self.indptr = np.zeros(len(vocab) + 1, dtype = np.int64)
+        np.cumsum(counts, out = self.indptr[1:])
+
+        gaps = np.diff(positions, prepend = 0)
+        starts = self.indptr[:-1][counts > 0]
+        self.firsts = np.zeros(len(vocab), dtype = np.uint32)
+        self.firsts[counts > 0] = positions[starts]
+        gaps[starts] = 0
+
+        self.gaps = gaps.astype(np.min_scalar_type(gaps.max() if len(gaps) else 0))
+
+    def __contains__(self, term):
+        return term in self.vocab
+
+    def positions(self, term):
+        '''
+        Decode the sorted token positions of a term (empty if unknown).
+        '''
+        code = self.vocab.get(term)
+        if code is None:
+            return np.array([], dtype = np.int64)
+
+        gaps = self.gaps[self.indptr[code]:self.indptr[code + 1]].astype(np.int64)
+        gaps[0] = self.firsts[code]
+
+        return np.cumsum(gaps)
+
+    def frequency(self, term):
+        code = self.vocab.get(term)
+        return 0 if code is None else int(self.indptr[code + 1] - self.indptr[code])
+
+    @property
+    def nbytes(self):
+        return self.gaps.nbytes + self.firsts.nbytes + self.indptr.nbytes
+
+
+class ConcordanceIndex:
+    '''
+    Inverted index over a token table (see tokens_from_csv / tokens_from_lines).
+
+    Parameters
+    ----------
+    tokens : DataFrame
+        Essay, line_index, lines, Word and lemmatized_word columns, one row per
+        token in reading order.
+
+    '''
+
+    def __init__(self, tokens):
+        # Per-token arrays: which essay and line each position belongs to, and
+        # where in the line it sits
+        essay_codes, self.essays = pd.factorize(tokens['Essay'])
+        self.essay_codes = essay_codes.astype(np.int32)
+        self.line_index = tokens['line_index'].to_numpy(dtype = np.int64)
+        self.offsets = tokens.groupby('line_index', sort = False).cumcount() \
+            .to_numpy(dtype = np.int32)
+
+        # The text of each line, kept once per line rather than once per token
+        lines = tokens[['line_index', 'lines']].drop_duplicates('line_index')
+        self.lines = pd.Series(lines['lines'].to_numpy(), index = lines['line_index'])
+
+        word_codes, words = pd.factorize(tokens['Word'].str.lower())
+        lemma_codes, lemmas = pd.factorize(tokens['lemmatized_word'].str.lower())
+        self.words = np.asarray(tokens['Word'], dtype = object)
+
+        self.postings = {'word': PostingLists(word_codes, list(words)),
+                         'lemma': PostingLists(lemma_codes, list(lemmas))}
+
+    def __len__(self):
+        return len(self.essay_codes)
+
+    # ------------------------------------------------------------------------
+    #                              Lookups
+    # ------------------------------------------------------------------------
+    def positions(self, term, field = 'lemma'):
+        '''
+        Sorted token positions of a single term.
+        '''
+        return self.postings[field].positions(term.lower())
+
+    def phrase_positions(self, phrase, field = 'lemma'):
+        '''
+        Start positions of an exact phrase (consecutive tokens, same essay).
+
+        Parameters
+        ----------
+        phrase : string or list
+            the words of the phrase.
+        field : string
+            'lemma' or 'word'.
+
+        Returns
+        -------
+        starts : array
+            token position of the first word of each match.
+
+        '''
+        terms = phrase.split() if isinstance(phrase, str) else list(phrase)
+        if not terms:
+            return np.array([], dtype = np.int64)
+
+        # Shift each term's postings back by its place in the phrase, then
+        # intersect: what's left are the starting positions
+        starts = self.positions(terms[0], field)
+        for i, term in enumerate(terms[1:], start = 1):
+            if len(starts) == 0:
+                break
+            starts = np.intersect1d(starts, self.positions(term, field) - i,
+                                    assume_unique = True)
+
+        # Phrases can't run from the end of one essay into the next
+        last = starts + len(terms) - 1
+        return starts[self.essay_codes[starts] == self.essay_codes[last]]
+
+    def locate(self, positions):
+        '''
+        Turn token positions into (Essay, line_index, offset) rows.
+        '''
+        positions = np.asarray(positions, dtype = np.int64)
+
+        return pd.DataFrame({'Essay': self.essays[self.essay_codes[positions]],
+                             'line_index': self.line_index[positions],
+                             'offset': self.offsets[positions]})
+
+    # ------------------------------------------------------------------------
+    #                           Concordances
+    # ------------------------------------------------------------------------
+    def concordance(self, query, width = 6, field = 'lemma', limit = None):
+        '''
+        Keyword-in-context lines for a word or phrase.
+
+        Parameters
+        ----------
+        query : string
+            a word or a phrase.
+        width : int
+            number of tokens of context on each side.
+        field : string
+            'lemma' or 'word'.
+        limit : int, optional
+            only return the first limit matches.
+
+        Returns
+        -------
+        kwic : DataFrame
+            Essay, line_index, offset, left, keyword and right columns, plus the
+            full text of the line.
+
+        '''
+        n_terms = len(query.split())
+        starts = self.phrase_positions(query, field)
+        if limit is not None:
+            starts = starts[:limit]
+
+        kwic = self.locate(starts)
+        left, keyword, right = [], [], []
+        for start in starts:
+            essay = self.essay_codes[start]
+            end = start + n_terms
+
+            # Clip the context window to the essay the match is in
+            lo = max(start - width, 0)
+            while self.essay_codes[lo] != essay:
+                lo += 1
+            hi = min(end + width, len(self))
+            while self.essay_codes[hi - 1] != essay:
+                hi -= 1
+
+            left.append(" ".join(self.words[lo:start]))
+            keyword.append(" ".join(self.words[start:end]))
+            right.append(" ".join(self.words[end:hi]))
+
+        kwic['left'] = left
+        kwic['keyword'] = keyword
+        kwic['right'] = right
+        kwic['lines'] = self.lines.reindex(kwic['line_index']).to_numpy()
+
+        return kwic
+
+    # ------------------------------------------------------------------------
+    #                          Boolean Queries
+    # ------------------------------------------------------------------------
+    def boolean(self, query, field = 'lemma'):
+        '''
+        Essays matching a boolean query. Supports AND, OR, NOT, parentheses and
+        "quoted phrases"; terms next to each other are ANDed.
+
+        Example: 'executive AND (senate OR "house of representatives") NOT king'
+
+        Parameters
+        ----------
+        query : string
+            the boolean query.
+        field : string
+            'lemma' or 'word'.
+
+        Returns
+        -------
+        essays : list
+            matching essay ids, in corpus order.
+
+        '''
+        matches = _BooleanParser(self, field).parse(query)
+
+        return list(self.essays[np.flatnonzero(matches)])
+
+    def essay_mask(self, positions):
+        '''
+        Boolean mask over the essays containing any of the given positions.
+        '''
+        mask = np.zeros(len(self.essays), dtype = bool)
+        mask[self.essay_codes[positions]] = True
+
+        return mask
+
+
+class _BooleanParser:
+    '''
+    Small recursive descent parser for ConcordanceIndex.boolean(). Each term or
+    phrase evaluates to a boolean mask over the essays.
+
+        expr   := and_expr ('OR' and_expr)*
+        and_expr := unary (['AND'] unary)*
+        unary  := 'NOT' unary | '(' expr ')' | term | "phrase"
+    '''
+
+    TOKEN_RE = re.compile(r'"[^"]*"|\(|\)|[^\s()"]+')
+
+    def __init__(self, index, field):
+        self.index = index
+        self.field = field
+
+    def parse(self, query):
+        self.tokens = self.TOKEN_RE.findall(query)
+        self.i = 0
+        result = self._expr()
+        if self.i != len(self.tokens):
+            raise ValueError(f"Unexpected {self.tokens[self.i]!r} in query {query!r}")
+
+        return result
+
+    def _peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def _expr(self):
+        result = self._and_expr()
+        while self._peek() == 'OR':
+            self.i += 1
+            result = result | self._and_expr()
+
+        return result
+
+    def _and_expr(self):
+        result = self._unary()
+        while self._peek() not in (None, 'OR', ')'):
+            if self._peek() == 'AND':
+                self.i += 1
+            result = result & self._unary()
+
+        return result
+
+    def _unary(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError("Query ended unexpectedly")
+        self.i += 1
+
+        if token == 'NOT':
+            return ~self._unary()
+        if token == '(':
+            result = self._expr()
+            if self._peek() != ')':
+                raise ValueError("Missing closing parenthesis")
+            self.i += 1
+            return result
+        if token in ('AND', 'OR', ')'):
+            raise ValueError(f"Unexpected {token!r}")
+
+        return self.index.essay_mask(self.index.phrase_positions(token.strip('"'), self.field))
+
+
+# ----------------------------------------------------------------------------
+#                                 Benchmark
+# ----------------------------------------------------------------------------
+def benchmark(tokens, scale = 1, repeats = 200):
+    '''
+    Time building the index and a handful of typical queries.
+
+    Parameters
+    ----------
+    tokens : DataFrame
+        token table to index.
+    scale : int
+        repeat the corpus this many times (as new essays) to see how things
+        grow with corpus size.
+    repeats : int
+        how many times to run each query.
+
+    Returns
+    -------
+    timings : DataFrame
+        seconds for the build and median milliseconds per query, next to the
+        pandas linear scan the index replaces.
+
+    '''
+    if scale > 1:
+        line_span = tokens['line_index'].max() + 1
+        tokens = pd.concat([tokens.assign(Essay = tokens['Essay'] + f" (copy {i})",
+                                          line_index = tokens['line_index'] + i * line_span)
+                            for i in range(scale)], ignore_index = True)
+
+    started = time.perf_counter()
+    index = ConcordanceIndex(tokens)
+    build_seconds = time.perf_counter() - started
+
+    queries = {'term': lambda: index.positions('power'),
+               'phrase': lambda: index.phrase_positions('national government'),
+               'kwic': lambda: index.concordance('executive', limit = 50),
+               'boolean': lambda: index.boolean('executive AND (senate OR president) NOT king'),
+               'pandas scan': lambda: tokens[tokens['lemmatized_word'] == 'power']}
+
+    rows = [{'step': 'build', 'tokens': len(index), 'ms': build_seconds * 1000}]
+    for name, query in queries.items():
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            query()
+            times.append(time.perf_counter() - started)
+        rows.append({'step': name, 'tokens': len(index), 'ms': np.median(times) * 1000})
+
+    print(f"Index size: {sum(p.nbytes for p in index.postings.values()) / 1e6:.2f} MB "
+          f"for {len(index)} tokens")
+
+    return pd.DataFrame(rows)
+
+
+#%%
+if __name__ == '__main__':
+    fed_index = ConcordanceIndex(tokens_from_lines())
+
+    print(fed_index.concordance('faction', field = 'word', limit = 10)[['Essay', 'left', 'keyword', 'right']])
+    print(fed_index.locate(fed_index.phrase_positions('common defense', field = 'word')))
+    print(fed_index.boolean('executive AND (senate OR president) NOT king', field = 'word'))
+
+    for scale in [1, 10]:
+        print(benchmark(tokens_from_lines(), scale = scale))
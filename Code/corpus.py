@@ -0,0 +1,367 @@
+##Corpus - Shared loading helpers
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to hold the small pieces of loading and cleaning
+# that every analysis script repeats: reading the essays in Data/, turning the
+# file names into 'Essay 1' style ids, cleaning the text for TF-IDF, pulling the
+# authorship columns back out of full_fedpapers.csv, and loading its token table
+# and integer-coding it essay by essay. Everything here can be imported from the
+# other modules in Code/ so they all agree on what an essay looks like.
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# ----------------------------------------------------------------------------
+#                                 Paths
+# ----------------------------------------------------------------------------
+# The scripts are run from the project root (see the note in EDA.py), but the
+# modules in here can also be imported from anywhere, so we anchor on this file.
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DATA_DIR = os.path.join(PROJECT_DIR, 'Data')
+FULL_FEDPAPERS_CSV = os.path.join(DATA_DIR, 'full_fedpapers.csv')
+
+# Additional stop words on top of NLTK's English list (same list as the one used
+# in Data Load Script.py)
+EXTRA_STOP_WORDS = ['would', 'may', 'yet', 'must', 'shall', 'not', 'still', 'let',
+                    'also', 'ought', 'a', 'the', 'it', 'i', 'upon', 'but', 'if', 'in',
+                    'this', 'might', 'and', 'us', 'can', 'as', 'to', 'make', 'made',
+                    'much']
+
+
+def get_stop_words():
+    '''
+    Build the stop word list used across the project: NLTK's English stop words
+    plus our additional ones.
+
+    Returns
+    -------
+    stop : set
+        lowercase stop words.
+
+    '''
+    # Imported here so modules that never clean text don't need the NLTK corpora
+    from nltk.corpus import stopwords
+
+    stop = set(stopwords.words('english'))
+    stop.update(EXTRA_STOP_WORDS)
+
+    return stop
+
+
+# ----------------------------------------------------------------------------
+#                              Loading Essays
+# ----------------------------------------------------------------------------
+def essay_name(file_name):
+    '''
+    Convert a file name like 'essay07.txt' into the 'Essay 7' id used by the
+    authorship table.
+
+    Parameters
+    ----------
+    file_name : string
+        name of the essay file.
+
+    Returns
+    -------
+    name : string
+        essay id.
+
+    '''
+    number = re.search(r'(\d+)', os.path.basename(file_name))
+
+    # Anything that isn't numbered (an outside text dropped into Data/) just
+    # keeps its file name without the extension
+    if number is None:
+        return os.path.splitext(os.path.basename(file_name))[0]
+
+    return f"Essay {int(number.group(1))}"
+
+
+def list_essay_files(data_dir = DATA_DIR):
+    '''
+    List the text files in the data folder in a stable (sorted) order.
+
+    Parameters
+    ----------
+    data_dir : string
+        folder holding the essays.
+
+    Returns
+    -------
+    txt_files : list
+        file names ending in .txt.
+
+    '''
+    return sorted(x for x in os.listdir(data_dir) if x[-4:] == '.txt')
+
+
+def read_essay_lines(path):
+    '''
+    Read the non-blank lines of a single essay file.
+
+    Parameters
+    ----------
+    path : string
+        path to the text file.
+
+    Returns
+    -------
+    lines : list
+        lines of the essay, without their trailing newline.
+
+    '''
+    with open(path, encoding = 'utf-8', errors = 'replace') as f:
+        return [line.rstrip('\r\n') for line in f if line.strip()]
+
+
+def load_lines(data_dir = DATA_DIR):
+    '''
+    Load every essay into one dataframe with a row per (non-blank) line.
+
+    Parameters
+    ----------
+    data_dir : string
+        folder holding the essays.
+
+    Returns
+    -------
+    text_df : DataFrame
+        columns 'line_index', 'Essay' and 'lines'. line_index counts lines
+        across the whole corpus, in file order.
+
+    '''
+    essays = []
+    lines = []
+
+    for text_file in list_essay_files(data_dir):
+        essay_lines = read_essay_lines(os.path.join(data_dir, text_file))
+        essays.extend([essay_name(text_file)] * len(essay_lines))
+        lines.extend(essay_lines)
+
+    text_df = pd.DataFrame({'Essay': essays, 'lines': lines})
+    text_df.insert(0, 'line_index', range(len(text_df)))
+
+    return text_df
+
+
+# ----------------------------------------------------------------------------
+#                              Text Cleaning
+# ----------------------------------------------------------------------------
+def clean_text(text, stop = None):
+    '''
+    Clean a piece of text for TF-IDF: keep letters only, lowercase everything
+    and drop stop words.
+
+    This is not quite the text_analysis.py cleaning. That script drops stop
+    words before lowercasing (so capitalised ones like 'The' stay in) and uses
+    NLTK's list alone; here the words are lowercased first and the default
+    stop list adds EXTRA_STOP_WORDS.
+
+    Parameters
+    ----------
+    text : string
+        raw text.
+    stop : set, optional
+        stop words to remove. Defaults to get_stop_words().
+
+    Returns
+    -------
+    cleaned : string
+        space separated, lowercase words.
+
+    '''
+    if stop is None:
+        stop = get_stop_words()
+
+    words = re.sub('[^A-Za-z]', ' ', text).lower().split()
+
+    return " ".join(x for x in words if x not in stop)
+
+
+def essay_documents(data_dir = DATA_DIR, stop = None):
+    '''
+    Build one cleaned document per essay, ready for a vectorizer.
+
+    Parameters
+    ----------
+    data_dir : string
+        folder holding the essays.
+    stop : set, optional
+        stop words to remove. Defaults to get_stop_words().
+
+    Returns
+    -------
+    documents : DataFrame
+        columns 'Essay' and 'lines' (the cleaned text), one row per essay in
+        essay number order.
+
+    '''
+    if stop is None:
+        stop = get_stop_words()
+
+    essays = []
+    texts = []
+
+    for text_file in list_essay_files(data_dir):
+        essay_lines = read_essay_lines(os.path.join(data_dir, text_file))
+        essays.append(essay_name(text_file))
+        # Join with a space so words at the end of one line don't run into the
+        # start of the next
+        texts.append(clean_text(" ".join(essay_lines), stop = stop))
+
+    return pd.DataFrame({'Essay': essays, 'lines': texts})
+
+
+# ----------------------------------------------------------------------------
+#                              Authorship Data
+# ----------------------------------------------------------------------------
+def load_authorship(csv_path = FULL_FEDPAPERS_CSV):
+    '''
+    Pull the per-essay authorship columns back out of the csv written by
+    Data Load Script.py.
+
+    Parameters
+    ----------
+    csv_path : string
+        path to full_fedpapers.csv.
+
+    Returns
+    -------
+    authors : DataFrame
+        columns 'Essay', 'Author' and 'Date', one row per essay.
+
+    '''
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"{csv_path} does not exist yet. Run "
+                                "'Data Load Script.py' first to build it.")
+
+    authors = pd.read_csv(csv_path, usecols = ['Essay', 'Author', 'Date']) \
+        .drop_duplicates('Essay') \
+        .reset_index(drop = True)
+
+    authors['Date'] = pd.to_datetime(authors['Date'])
+
+    return authors
+
+
+def fetch_authorship(url = 'https://guides.loc.gov/federalist-papers/full-text'):
+    '''
+    Scrape and clean the authorship table, the same steps as the "Joining
+    Authorship Data" section of Data Load Script.py.
+
+    Parameters
+    ----------
+    url : string
+        page holding the authorship table.
+
+    Returns
+    -------
+    authors_clean : DataFrame
+        Essay ('Essay 1' style), Author ('Hamilton or Madison' -> 'Unknown'),
+        Date (datetime, NaT where it was '--') and Publication columns, plus the
+        rest of the scraped table.
+
+    '''
+    import requests
+
+    authors = pd.read_html(requests.get(url).content)[0]
+
+    authors_clean = authors.copy().rename(columns = {'No.': 'Essay'})
+    authors_clean['Essay'] = "Essay " + authors_clean['Essay'].astype('int').astype('str')
+    authors_clean['Author'] = authors_clean['Author'].replace('Hamilton or Madison', "Unknown")
+    authors_clean['Date'] = pd.to_datetime(authors_clean['Date'].replace('--', 'NaN'),
+                                           format = "%A, %B %d, %Y", errors = 'coerce')
+
+    # Tidy up the publication names
+    authors_clean['Publication'] = authors_clean['Publication'].replace({
+        '--': 'Unknown',
+        'For the Independent Journal': 'Independent Journal',
+        "Frm the New York Packet": "New York Packet",
+        "From the New York Packet": "New York Packet",
+        "From The New York Packet": "New York Packet",
+        "From McLEAN's Edition, New York": "McLEAN's Edition",
+        "From McLEAN's Edition": "McLEAN's Edition",
+        "From the Daily Advertiser": "Daily Advertiser"})
+
+    return authors_clean
+
+
+# ----------------------------------------------------------------------------
+#                               Token Table
+# ----------------------------------------------------------------------------
+def load_tokens(csv_path = FULL_FEDPAPERS_CSV, columns = None):
+    '''
+    Load the token table written by Data Load Script.py (stop words already
+    out), in text order.
+
+    Parameters
+    ----------
+    csv_path : string
+        path to full_fedpapers.csv.
+    columns : list, optional
+        columns to read. Defaults to all of them; line_index is always read so
+        the rows can be put in order.
+
+    Returns
+    -------
+    tokens : DataFrame
+        one row per token. Empty strings stay strings rather than NaN.
+
+    '''
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"{csv_path} does not exist yet. Run "
+                                "'Data Load Script.py' first to build it.")
+
+    if columns is not None:
+        columns = list(dict.fromkeys(['line_index'] + list(columns)))
+
+    tokens = pd.read_csv(csv_path, usecols = columns, keep_default_na = False)
+
+    # The csv is written in line order already, but a stable sort makes sure of
+    # it without shuffling the tokens within a line
+    return tokens.sort_values('line_index', kind = 'stable').reset_index(drop = True)
+
+
+def documents_from_tokens(tokens, term = 'lemmatized_word', essay = 'Essay', author = 'Author'):
+    '''
+    Integer-code a token table and split it into per essay runs.
+
+    Parameters
+    ----------
+    tokens : DataFrame
+        one row per token, each essay's tokens together and in text order.
+    term, essay, author : string
+        columns holding the words, the essay and the author.
+
+    Returns
+    -------
+    documents : list
+        (essay, author, codes) for every essay.
+    vocab : Index
+        the word for each code.
+
+    '''
+    codes, vocab = pd.factorize(tokens[term])
+    codes = codes.astype(np.int32)
+
+    essays = tokens[essay].to_numpy()
+    authors = tokens[author].to_numpy()
+    starts = np.flatnonzero(np.r_[True, essays[1:] != essays[:-1]])
+    ends = np.r_[starts[1:], len(essays)]
+
+    return [(essays[s], authors[s], codes[s:e]) for s, e in zip(starts, ends)], vocab
+
+
+def scaled_documents(documents, factor):
+    '''
+    Stream the corpus `factor` times over, each copy of an essay under a new
+    id, without ever holding the scaled corpus in memory.
+    '''
+    for copy in range(factor):
+        for essay, author, codes in documents:
+            yield f"{essay} #{copy}", author, codes
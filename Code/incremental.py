@@ -0,0 +1,461 @@
+##Incremental Corpus - Add essays without refitting everything
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to let us drop a new document (an
+# Anti-Federalist paper, say) into the corpus without rerunning the tagging,
+# every EDA aggregate and the full TfidfVectorizer refit. IncrementalCorpus
+# keeps:
+#   1. a token store (one int array of term codes per document),
+#   2. the word counts and document frequencies EDA.py builds with groupby,
+#   3. TF-IDF rows weighted the same way as sklearn's default TfidfVectorizer
+#      (raw counts, smooth idf, l2 norm), and
+#   4. a top-k similar documents list for every row.
+#
+# Adding a document only touches that document's terms: counts and df are
+# bumped for its terms, its similarities are computed through the term
+# postings, and only the rows that now have it as a top-k neighbour are
+# refreshed. That step costs the total length of its terms' postings, so it is
+# cheap for rare words but a document full of common words still walks most of
+# the corpus.
+#
+# Because the idf of every term shifts a little as N grows, rows are weighted
+# with the idf from the last full refresh, and a full refresh (reweight every
+# row, rebuild every top-k list: about O(N^2) for the similarity blocks) runs
+# once the corpus has grown by refresh_ratio since then. Spread over the
+# refresh_ratio * N adds in between, that is still O(N) per add, so adding does
+# get slower as the corpus grows; benchmark() measures both parts. With
+# refresh_ratio = None there are no automatic refreshes: the idf stays as of
+# the last refresh() (new terms get theirs when first seen) until you call
+# refresh() yourself.
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+import corpus
+
+
+class IncrementalCorpus:
+    '''
+    Corpus that supports appending documents with incremental TF-IDF and top-k
+    similarity updates.
+
+    Parameters
+    ----------
+    k : int
+        number of neighbours to keep for every document.
+    refresh_ratio : float or None
+        reweight everything once the corpus grows by this fraction since the
+        last full refresh. None to only refresh when refresh() is called.
+    stop : set, optional
+        stop words removed when cleaning text. Defaults to
+        corpus.get_stop_words().
+
+    '''
+
+    def __init__(self, k = 5, refresh_ratio = 0.25, stop = None):
+        self.k = k
+        self.refresh_ratio = refresh_ratio
+        self.stop = corpus.get_stop_words() if stop is None else stop
+
+        # Vocabulary and per-term statistics. The arrays are over-allocated and
+        # grown by doubling so new terms are amortized O(1)
+        self.vocab = {}
+        self.terms = []
+        self._df = np.zeros(1024, dtype = np.int64)
+        self._cf = np.zeros(1024, dtype = np.int64)
+
+        # Per-document data
+        self.essays = []
+        self.authors = []
+        self.tokens = []
+        self.rows = []
+
+        # Weighted rows from the last full refresh, stored term-major (CSC) so we
+        # can pull out just the columns a new document uses, plus postings for
+        # documents added since
+        self._refresh_n = 0
+        self._idf = np.zeros(0)
+        self._base = sp.csc_matrix((0, 0))
+        self._delta_postings = {}
+        self._weights = []
+
+        # Top-k neighbours of every document, over-allocated and grown by
+        # doubling like _df/_cf (see top_rows / top_scores)
+        self._top_rows = np.full((0, k), -1, dtype = np.int64)
+        self._top_scores = np.full((0, k), -np.inf)
+
+    # ------------------------------------------------------------------------
+    #                           Building the corpus
+    # ------------------------------------------------------------------------
+    @classmethod
+    def from_data_dir(cls, data_dir = corpus.DATA_DIR, authors = None, **kwargs):
+        '''
+        Build the corpus from every essay in the data folder.
+
+        Parameters
+        ----------
+        data_dir : string
+            folder holding the essays.
+        authors : DataFrame, optional
+            'Essay' and 'Author' columns used to label the documents.
+        **kwargs :
+            passed on to IncrementalCorpus().
+
+        '''
+        fed_corpus = cls(**kwargs)
+        documents = corpus.essay_documents(data_dir, stop = fed_corpus.stop)
+        author_lookup = {} if authors is None else dict(zip(authors['Essay'], authors['Author']))
+
+        for essay, text in zip(documents['Essay'], documents['lines']):
+            fed_corpus._append(essay, author_lookup.get(essay, 'Unknown'), text.split())
+
+        fed_corpus.refresh()
+
+        return fed_corpus
+
+    def __len__(self):
+        return len(self.essays)
+
+    @property
+    def n_terms(self):
+        return len(self.terms)
+
+    @property
+    def top_rows(self):
+        return self._top_rows[:len(self)]
+
+    @property
+    def top_scores(self):
+        return self._top_scores[:len(self)]
+
+    @property
+    def df(self):
+        return self._df[:self.n_terms]
+
+    @property
+    def cf(self):
+        return self._cf[:self.n_terms]
+
+    def idf(self):
+        '''
+        Current smooth idf of every term, as sklearn computes it.
+        '''
+        return np.log((1 + len(self)) / (1 + self.df)) + 1
+
+    def _encode(self, words):
+        codes = np.empty(len(words), dtype = np.int32)
+        for i, word in enumerate(words):
+            code = self.vocab.get(word)
+            if code is None:
+                code = self.vocab[word] = len(self.terms)
+                self.terms.append(word)
+            codes[i] = code
+
+        # Make room for any new terms
+        if self.n_terms > len(self._df):
+            size = max(self.n_terms, 2 * len(self._df))
+            self._df = np.concatenate([self._df, np.zeros(size - len(self._df), dtype = np.int64)])
+            self._cf = np.concatenate([self._cf, np.zeros(size - len(self._cf), dtype = np.int64)])
+
+        return codes
+
+    def _append(self, essay, author, words):
+        '''
+        Add a document to the token store and update counts and df. Doesn't
+        touch the weights or the similarity index.
+        '''
+        codes = self._encode(words)
+        terms, counts = np.unique(codes, return_counts = True)
+
+        self._df[terms] += 1
+        self._cf[terms] += counts
+
+        self.essays.append(essay)
+        self.authors.append(author)
+        self.tokens.append(codes)
+        self.rows.append((terms, counts))
+
+        return len(self.essays) - 1
+
+    def _weight(self, terms, counts):
+        # Terms that showed up after the last refresh get their idf from the
+        # current document frequencies
+        idf = np.empty(len(terms))
+        known = terms < len(self._idf)
+        idf[known] = self._idf[terms[known]]
+        idf[~known] = np.log((1 + len(self)) / (1 + self.df[terms[~known]])) + 1
+
+        weights = counts * idf
+        return weights / np.linalg.norm(weights)
+
+    # ------------------------------------------------------------------------
+    #                             Full refresh
+    # ------------------------------------------------------------------------
+    def matrix(self):
+        '''
+        Current document-by-term TF-IDF matrix (CSR).
+        '''
+        indptr = np.zeros(len(self) + 1, dtype = np.int64)
+        np.cumsum([len(terms) for terms, _ in self._weights], out = indptr[1:])
+        indices = np.concatenate([terms for terms, _ in self._weights]) if self._weights else []
+        data = np.concatenate([weights for _, weights in self._weights]) if self._weights else []
+
+        return sp.csr_matrix((data, indices, indptr), shape = (len(self), self.n_terms))
+
+    def refresh(self, block_size = 1024):
+        '''
+        Reweight every row with the current idf and rebuild the top-k index.
+        This is the expensive step (every row against every other, a block at
+        a time) that add_document() only runs now and then.
+        '''
+        self._idf = self.idf()
+        self._refresh_n = len(self)
+        self._weights = [(terms, self._weight(terms, counts)) for terms, counts in self.rows]
+        self._delta_postings = {}
+
+        fed_matrix = self.matrix()
+        self._base = fed_matrix.tocsc()
+
+        # Top-k for every row, a block of rows at a time so we never hold the
+        # whole N x N similarity matrix
+        k = min(self.k, max(len(self) - 1, 0))
+        self._top_rows = np.full((len(self), self.k), -1, dtype = np.int64)
+        self._top_scores = np.full((len(self), self.k), -np.inf)
+        for start in range(0, len(self), block_size):
+            block = (fed_matrix[start:start + block_size] @ fed_matrix.T).toarray()
+            block[np.arange(len(block)), np.arange(start, start + len(block))] = -np.inf
+            if k == 0:
+                continue
+            top = np.argpartition(-block, k - 1, axis = 1)[:, :k]
+            scores = np.take_along_axis(block, top, axis = 1)
+            order = np.argsort(-scores, axis = 1, kind = 'stable')
+            self.top_rows[start:start + len(block), :k] = np.take_along_axis(top, order, axis = 1)
+            self.top_scores[start:start + len(block), :k] = np.take_along_axis(scores, order, axis = 1)
+
+    # ------------------------------------------------------------------------
+    #                           Adding documents
+    # ------------------------------------------------------------------------
+    def _scores(self, terms, weights, exclude = None):
+        '''
+        Similarity of a weighted row against every document, computed through
+        the postings of its terms only. Returns (rows, scores) for the documents
+        that share at least one term.
+        '''
+        # Documents from the last refresh: read the postings of these terms
+        # straight out of the CSC arrays (no dense length-N vector)
+        known = terms < self._base.shape[1]
+        starts = self._base.indptr[terms[known]]
+        lengths = self._base.indptr[terms[known] + 1] - starts
+        positions = np.arange(lengths.sum()) \
+            + np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        hit_rows = [self._base.indices[positions]]
+        products = [self._base.data[positions] * np.repeat(weights[known], lengths)]
+
+        # Documents added since
+        for term, weight in zip(terms, weights):
+            postings = self._delta_postings.get(term)
+            if postings:
+                hit_rows.append(postings[0])
+                products.append(weight * np.asarray(postings[1]))
+
+        # Add up the products per document
+        rows, inverse = np.unique(np.concatenate(hit_rows).astype(np.int64), return_inverse = True)
+        values = np.bincount(inverse, weights = np.concatenate(products), minlength = len(rows))
+
+        keep = (rows != (-1 if exclude is None else exclude)) & (values != 0)
+
+        return rows[keep], values[keep]
+
+    def _insert_neighbour(self, row, neighbour, score):
+        # Keep the row's list sorted; only called when score beats its k-th
+        position = np.searchsorted(-self.top_scores[row], -score, side = 'right')
+        self.top_rows[row, position + 1:] = self.top_rows[row, position:-1].copy()
+        self.top_scores[row, position + 1:] = self.top_scores[row, position:-1].copy()
+        self.top_rows[row, position] = neighbour
+        self.top_scores[row, position] = score
+
+    def add_document(self, essay, text, author = 'Unknown'):
+        '''
+        Append one document and update the counts, df, idf and the top-k index
+        rows it affects.
+
+        Parameters
+        ----------
+        essay : string
+            id of the new document.
+        text : string
+            raw text; it's cleaned with corpus.clean_text().
+        author : string
+            author label.
+
+        Returns
+        -------
+        row : int
+            row of the new document.
+
+        '''
+        row = self._append(essay, author, corpus.clean_text(text, stop = self.stop).split())
+
+        # Once we've drifted far enough from the last refresh, pay for a full
+        # one. This happens every refresh_ratio * N additions
+        if self.refresh_ratio is not None and len(self) > self._refresh_n * (1 + self.refresh_ratio):
+            self.refresh()
+            return row
+
+        terms, counts = self.rows[row]
+        weights = self._weight(terms, counts)
+        self._weights.append((terms, weights))
+
+        rows, scores = self._scores(terms, weights, exclude = row)
+
+        # The new row's own neighbours. Make room by doubling, so appending a
+        # row is amortized O(1) rather than a copy of the whole index
+        if len(self) > len(self._top_rows):
+            size = max(len(self), 2 * len(self._top_rows))
+            self._top_rows = np.concatenate([self._top_rows,
+                                             np.full((size - len(self._top_rows), self.k), -1, dtype = np.int64)])
+            self._top_scores = np.concatenate([self._top_scores,
+                                               np.full((size - len(self._top_scores), self.k), -np.inf)])
+        k = min(self.k, len(rows))
+        if k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind = 'stable')]
+            self.top_rows[row, :k] = rows[top]
+            self.top_scores[row, :k] = scores[top]
+
+        # Only rows where the new document beats their current k-th neighbour
+        affected = scores > self.top_scores[rows, -1]
+        for other, score in zip(rows[affected], scores[affected]):
+            self._insert_neighbour(other, row, score)
+
+        for term, weight in zip(terms, weights):
+            postings = self._delta_postings.setdefault(term, ([], []))
+            postings[0].append(row)
+            postings[1].append(weight)
+
+        return row
+
+    # ------------------------------------------------------------------------
+    #                               Queries
+    # ------------------------------------------------------------------------
+    def similar(self, essay, k = None):
+        '''
+        Top-k most similar documents to one already in the corpus.
+
+        Parameters
+        ----------
+        essay : string
+            document id.
+        k : int, optional
+            how many to return (at most the k the corpus was built with).
+
+        Returns
+        -------
+        similar : DataFrame
+            Essay, Author and score columns.
+
+        '''
+        row = self.essays.index(essay)
+        k = self.k if k is None else min(k, self.k)
+        keep = self.top_rows[row, :k] >= 0
+        rows = self.top_rows[row, :k][keep]
+
+        return pd.DataFrame({'Essay': [self.essays[i] for i in rows],
+                             'Author': [self.authors[i] for i in rows],
+                             'score': self.top_scores[row, :k][keep]})
+
+    def word_counts(self):
+        '''
+        Same table as word_counts / doc_lengths in EDA.py (Viz 1 and Viz 8),
+        straight from the running counts.
+        '''
+        return pd.DataFrame({'Word': self.terms, 'count': self.cf, 'doc_count': self.df}) \
+            .sort_values('count', ascending = False) \
+            .reset_index(drop = True)
+
+    def doc_lengths(self):
+        '''
+        Number of (non stop word) tokens in every document.
+        '''
+        return pd.DataFrame({'Essay': self.essays,
+                             'Author': self.authors,
+                             'length': [len(codes) for codes in self.tokens]})
+
+
+# ----------------------------------------------------------------------------
+#                                Benchmark
+# ----------------------------------------------------------------------------
+def benchmark(factors = (1, 4, 16), n_adds = 20, refresh_ratio = 0.25, stop = None):
+    '''
+    Time adding documents to the corpus repeated `factor` times over.
+
+    The adds and the refresh are timed apart: add_ms is the mean cost of an
+    add that doesn't trigger a refresh, and amortized_ms spreads one refresh
+    over the refresh_ratio * N adds that lead up to it. Both grow with N.
+
+    Returns
+    -------
+    timings : DataFrame
+        documents, add_ms, refresh_ms and amortized_ms.
+
+    '''
+    import time
+
+    if stop is None:
+        stop = corpus.get_stop_words()
+
+    documents = corpus.essay_documents(stop = stop)
+    new_texts = [" ".join(corpus.read_essay_lines(os.path.join(corpus.DATA_DIR, x)))
+                 for x in corpus.list_essay_files()[:n_adds]]
+
+    rows = []
+    for factor in factors:
+        fed_corpus = IncrementalCorpus(refresh_ratio = None, stop = stop)
+        for copy in range(factor):
+            for essay, text in zip(documents['Essay'], documents['lines']):
+                fed_corpus._append(f"{essay} #{copy}", 'Unknown', text.split())
+
+        started = time.perf_counter()
+        fed_corpus.refresh()
+        refresh_seconds = time.perf_counter() - started
+        n = len(fed_corpus)
+
+        started = time.perf_counter()
+        for i, text in enumerate(new_texts):
+            fed_corpus.add_document(f"New Paper {i}", text)
+        add_seconds = (time.perf_counter() - started) / len(new_texts)
+
+        rows.append({'documents': n,
+                     'add_ms': round(add_seconds * 1000, 3),
+                     'refresh_ms': round(refresh_seconds * 1000, 3),
+                     'amortized_ms': round((add_seconds + refresh_seconds / (refresh_ratio * n)) * 1000, 3)})
+
+    return pd.DataFrame(rows)
+
+
+#%%
+if __name__ == '__main__':
+    import time
+
+    try:
+        fed_authors = corpus.load_authorship()
+    except FileNotFoundError:
+        fed_authors = None
+
+    fed_corpus = IncrementalCorpus.from_data_dir(authors = fed_authors)
+    print(fed_corpus.similar('Essay 52'))
+
+    # Pretend one of the essays is a newly discovered paper and time adding it
+    with open(os.path.join(corpus.DATA_DIR, 'essay10.txt')) as f:
+        new_text = f.read()
+
+    started = time.perf_counter()
+    fed_corpus.add_document('New Paper', new_text)
+    print(f"Added a document in {(time.perf_counter() - started) * 1000:.2f} ms")
+    print(fed_corpus.similar('New Paper'))
+
+    print(benchmark())
@@ -0,0 +1,180 @@
+##Keyness - Distinctive words per author
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to find the words each author uses unusually
+# often compared with everyone else. Viz 9 in EDA.py used to get at this by
+# grouping on the float tf_idf score itself, taking nlargest per author and
+# merging back on the score, which is slow and mixes up words that tie.
+#
+# Instead we build one author-by-term count matrix and compute, for every
+# (author, word) cell at once, the classic corpus-linguistics keyness scores of
+# the author against the rest of the corpus:
+#   1. Dunning's log-likelihood (G2, in the two-cell form corpus tools use),
+#   2. Pearson's chi-square on the 2x2 contingency table, and
+#   3. the log ratio (log2 of the relative frequencies, an effect size).
+# top_keywords() then returns the top-k distinctive words per author directly.
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+MEASURES = ('log_likelihood', 'chi_square', 'log_ratio')
+
+
+def group_term_matrix(tokens, group = 'Author', term = 'Word'):
+    '''
+    Count every term for every group (author by default).
+
+    Parameters
+    ----------
+    tokens : DataFrame
+        one row per token.
+    group : string
+        column to group by.
+    term : string
+        column holding the words.
+
+    Returns
+    -------
+    counts : array
+        n_groups x n_terms counts.
+    groups : Index
+        group of every row.
+    terms : Index
+        term of every column.
+
+    '''
+    group_codes, groups = pd.factorize(tokens[group], sort = True)
+    term_codes, terms = pd.factorize(tokens[term], sort = True)
+
+    # Missing values get code -1; leave them out the way groupby does
+    keep = (group_codes >= 0) & (term_codes >= 0)
+    group_codes, term_codes = group_codes[keep], term_codes[keep]
+
+    counts = sp.coo_matrix((np.ones(len(group_codes), dtype = np.int64), (group_codes, term_codes)),
+                           shape = (len(groups), len(terms))).toarray()
+
+    return counts, groups, terms
+
+
+def keyness_scores(counts):
+    '''
+    Keyness of every group against the rest, for every term, in one pass.
+
+    For a group and a term the 2x2 table is:
+
+                        group     rest of corpus
+        this term         a             b
+        other terms     c - a         d - b
+
+    where c and d are the number of tokens in the group and in the rest.
+
+    Parameters
+    ----------
+    counts : array
+        n_groups x n_terms counts.
+
+    Returns
+    -------
+    scores : dict
+        'log_likelihood', 'chi_square' and 'log_ratio' arrays, the same shape
+        as counts, plus 'expected' (the count we'd expect in the group if it
+        used the term at the corpus rate). Log-likelihood and chi-square are
+        unsigned; compare counts with expected for the direction.
+
+    '''
+    counts = np.asarray(counts, dtype = float)
+    a = counts
+    b = counts.sum(axis = 0, keepdims = True) - a
+    c = counts.sum(axis = 1, keepdims = True)
+    total = counts.sum()
+    d = total - c
+
+    term_total = a + b
+    expected_a = c * term_total / total
+    expected_b = d * term_total / total
+
+    # 0 * log(0) is taken as 0
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        log_likelihood = 2 * (np.where(a > 0, a * np.log(a / expected_a), 0)
+                              + np.where(b > 0, b * np.log(b / expected_b), 0))
+
+        denominator = c * d * term_total * (total - term_total)
+        chi_square = np.where(denominator > 0,
+                              total * (a * (d - b) - b * (c - a)) ** 2 / denominator,
+                              0)
+
+    # Log ratio, with 0.5 added to zero counts so it stays finite
+    log_ratio = np.log2(((a + (a == 0) * 0.5) / c) / ((b + (b == 0) * 0.5) / d))
+
+    return {'log_likelihood': log_likelihood,
+            'chi_square': chi_square,
+            'log_ratio': log_ratio,
+            'expected': expected_a}
+
+
+def top_keywords(tokens, k = 10, measure = 'log_likelihood', group = 'Author',
+                 term = 'Word', min_count = 5):
+    '''
+    The k most distinctive (over-used) words for every author.
+
+    Parameters
+    ----------
+    tokens : DataFrame
+        one row per token.
+    k : int
+        words per author.
+    measure : string
+        'log_likelihood', 'chi_square' or 'log_ratio' to rank by.
+    group, term : string
+        columns to group by and to count.
+    min_count : int
+        ignore words the author uses fewer times than this (log ratio in
+        particular overrates rare words).
+
+    Returns
+    -------
+    keywords : DataFrame
+        Author, Word, count, expected and all three scores, best first within
+        each author.
+
+    '''
+    if measure not in MEASURES:
+        raise ValueError(f"Unknown measure {measure!r}, pick one of {MEASURES}")
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+
+    counts, groups, terms = group_term_matrix(tokens, group, term)
+    scores = keyness_scores(counts)
+
+    # Only words the author uses more than expected, and often enough
+    ranking = np.where((counts > scores['expected']) & (counts >= min_count),
+                       scores[measure], -np.inf)
+
+    n = min(k, ranking.shape[1])
+    top = np.argpartition(-ranking, n - 1, axis = 1)[:, :n]
+    order = np.argsort(-np.take_along_axis(ranking, top, axis = 1), axis = 1, kind = 'stable')
+    top = np.take_along_axis(top, order, axis = 1)
+
+    rows = np.repeat(np.arange(len(groups)), n)
+    cols = top.ravel()
+    keep = np.isfinite(ranking[rows, cols])
+    rows, cols = rows[keep], cols[keep]
+
+    return pd.DataFrame({group: groups[rows],
+                         term: terms[cols],
+                         'count': counts[rows, cols],
+                         'expected': scores['expected'][rows, cols],
+                         'log_likelihood': scores['log_likelihood'][rows, cols],
+                         'chi_square': scores['chi_square'][rows, cols],
+                         'log_ratio': scores['log_ratio'][rows, cols]})
+
+
+#%%
+if __name__ == '__main__':
+    import corpus
+
+    fed_papers = pd.read_csv(corpus.FULL_FEDPAPERS_CSV, keep_default_na = False)
+    print(top_keywords(fed_papers, k = 10).round(2).to_string(index = False))
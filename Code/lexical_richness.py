@@ -0,0 +1,412 @@
+##Lexical Richness - Vocabulary richness measures per essay and per author
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to go beyond the raw word counts and document
+# lengths of EDA.py (Viz 2 and 3) and measure how varied each essay's and each
+# author's vocabulary is:
+#   1. TTR        | type-token ratio, distinct words over total words.
+#   2. MATTR      | moving-average TTR: the TTR of every window of `window`
+#                   consecutive words, averaged. Unlike TTR it doesn't just fall
+#                   as essays get longer.
+#   3. Yule's K   | 10^4 * (sum f^2 - N) / N^2 over the word frequencies f, the
+#                   chance two words drawn at random are the same (scaled).
+#   4. Simpson's D| the same idea without replacement: sum f(f-1) / N(N-1).
+#   5. Hapax      | share of the vocabulary used once (hapax legomena) or twice
+#                   (dis legomena).
+#
+# Everything comes out of one streaming pass over each essay's integer-coded
+# tokens. RichnessAccumulator keeps a count per vocabulary entry (O(vocab)
+# memory) plus running totals, so every measure is up to date after each token;
+# the moving window adds one count per entry and a ring buffer of the last
+# `window` tokens, and moving it along by one token is O(1). update() does the
+# same thing a chunk of tokens at a time with numpy, which is what we use in
+# practice (check_paths() confirms it matches the token at a time path).
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import corpus
+
+
+METRICS = ['n_tokens', 'n_types', 'ttr', 'mattr', 'yules_k', 'simpsons_d',
+           'hapax_ratio', 'hapax_token_ratio', 'dis_ratio']
+
+
+# ----------------------------------------------------------------------------
+#                               Accumulator
+# ----------------------------------------------------------------------------
+class RichnessAccumulator:
+    '''
+    Running richness measures over a stream of integer-coded tokens.
+
+    Tokens are fed one document at a time; call end_document() between
+    documents so the moving window doesn't run across them. Frequencies keep
+    adding up across documents, so feeding all of an author's essays into one
+    accumulator gives the author's measures.
+
+    Parameters
+    ----------
+    vocab_size : int
+        number of distinct codes (codes run from 0 to vocab_size - 1).
+    window : int
+        MATTR window length, in tokens.
+    chunk_size : int
+        update() works through its input this many tokens at a time, which
+        caps its scratch memory.
+
+    '''
+
+    def __init__(self, vocab_size, window = 100, chunk_size = 1 << 16):
+        self.window = window
+        self.chunk_size = chunk_size
+
+        self.counts = np.zeros(vocab_size, dtype = np.int64)
+        self.window_counts = np.zeros(vocab_size, dtype = np.int32)
+        self.ring = np.zeros(window, dtype = np.int64)
+        self.reset()
+
+    def reset(self):
+        '''
+        Start over (keeping the arrays, so one accumulator can be reused).
+        '''
+        self.counts[:] = 0
+        self.window_counts[:] = 0
+
+        self.n = 0                  # tokens
+        self.types = 0              # distinct codes
+        self.sum_squares = 0        # sum of f^2 over the codes
+        self.hapax = 0              # codes seen once
+        self.dis = 0                # codes seen twice
+
+        self.doc_n = 0              # tokens so far in the current document
+        self.window_types = 0       # distinct codes in the current window
+        self.ttr_sum = 0.0          # sum of the TTRs of every full window
+        self.n_windows = 0
+
+    def _tail(self):
+        # The last min(doc_n, window) tokens of the document, oldest first
+        return self.ring[np.arange(self.doc_n - min(self.doc_n, self.window), self.doc_n) % self.window]
+
+    def end_document(self):
+        '''
+        Empty the window so the next document's windows start fresh. O(window).
+        '''
+        np.subtract.at(self.window_counts, self._tail(), 1)
+        self.doc_n = 0
+        self.window_types = 0
+
+    # ------------------------------------------------------------------------
+    #                           One Token at a Time
+    # ------------------------------------------------------------------------
+    def add(self, code):
+        '''
+        Add one token, updating every measure in O(1).
+        '''
+        f = int(self.counts[code])
+        self.counts[code] = f + 1
+        self.n += 1
+        # (f + 1)^2 - f^2
+        self.sum_squares += 2 * f + 1
+
+        if f == 0:
+            self.types += 1
+            self.hapax += 1
+        elif f == 1:
+            self.hapax -= 1
+            self.dis += 1
+        elif f == 2:
+            self.dis -= 1
+
+        # Slide the window: drop the token from `window` tokens ago, add this one
+        w = self.window
+        slot = self.doc_n % w
+        if self.doc_n >= w:
+            old = self.ring[slot]
+            self.window_counts[old] -= 1
+            if self.window_counts[old] == 0:
+                self.window_types -= 1
+
+        self.ring[slot] = code
+        if self.window_counts[code] == 0:
+            self.window_types += 1
+        self.window_counts[code] += 1
+
+        self.doc_n += 1
+        if self.doc_n >= w:
+            self.ttr_sum += self.window_types / w
+            self.n_windows += 1
+
+    # ------------------------------------------------------------------------
+    #                           A Chunk at a Time
+    # ------------------------------------------------------------------------
+    def update(self, codes):
+        '''
+        Add a run of tokens from the current document. Same result as calling
+        add() on each of them.
+        '''
+        codes = np.asarray(codes, dtype = np.int64)
+        for start in range(0, len(codes), self.chunk_size):
+            self._update_chunk(codes[start:start + self.chunk_size])
+
+    def _update_chunk(self, codes):
+        if len(codes) == 0:
+            return
+
+        # Frequencies: only the codes in this chunk change
+        codes_seen, chunk_counts = np.unique(codes, return_counts = True)
+        old = self.counts[codes_seen]
+        new = old + chunk_counts
+        self.counts[codes_seen] = new
+
+        self.n += len(codes)
+        self.sum_squares += int((new * new - old * old).sum())
+        self.types += int((old == 0).sum())
+        self.hapax += int((new == 1).sum() - (old == 1).sum())
+        self.dis += int((new == 2).sum() - (old == 2).sum())
+
+        # Window: put the tail of the document in front of the chunk and find
+        # each token's previous and next occurrence within that sequence
+        w = self.window
+        tail = self._tail()
+        t = len(tail)
+        seq = np.concatenate([tail, codes])
+        m = len(seq)
+
+        order = np.argsort(seq, kind = 'stable')
+        same = seq[order[1:]] == seq[order[:-1]]
+        prev = np.full(m, -1, dtype = np.int64)
+        prev[order[1:][same]] = order[:-1][same]
+        nxt = np.full(m, m, dtype = np.int64)
+        nxt[order[:-1][same]] = order[1:][same]
+
+        # Moving the window to end at i drops token i - w (if that was the last
+        # copy of its code before i) and adds token i (if its code isn't
+        # already in the window)
+        i = np.arange(t, m)
+        leaving = i - w
+        leave = (leaving >= 0) & (nxt[np.maximum(leaving, 0)] >= i)
+        enter = (prev[i] < 0) | (prev[i] <= leaving)
+        distinct = self.window_types + np.cumsum(enter.astype(np.int64) - leave)
+
+        # Only full windows count towards MATTR
+        full = (self.doc_n - t + i) >= w - 1
+        self.ttr_sum += distinct[full].sum() / w
+        self.n_windows += int(full.sum())
+        self.window_types = int(distinct[-1])
+
+        # Move the ring buffer and its counts on to the new tail
+        np.subtract.at(self.window_counts, tail, 1)
+        self.doc_n += len(codes)
+        new_tail = seq[-min(self.doc_n, w):]
+        np.add.at(self.window_counts, new_tail, 1)
+        self.ring[np.arange(self.doc_n - len(new_tail), self.doc_n) % w] = new_tail
+
+    # ------------------------------------------------------------------------
+    #                                Results
+    # ------------------------------------------------------------------------
+    def metrics(self):
+        '''
+        The measures so far.
+
+        Returns
+        -------
+        metrics : dict
+            one value per name in METRICS. MATTR falls back to TTR when no
+            document has reached the window length.
+
+        '''
+        n = self.n
+        ttr = self.types / n if n else np.nan
+
+        return {'n_tokens': n,
+                'n_types': self.types,
+                'ttr': ttr,
+                'mattr': self.ttr_sum / self.n_windows if self.n_windows else ttr,
+                'yules_k': 1e4 * (self.sum_squares - n) / n ** 2 if n else np.nan,
+                'simpsons_d': (self.sum_squares - n) / (n * (n - 1)) if n > 1 else np.nan,
+                'hapax_ratio': self.hapax / self.types if self.types else np.nan,
+                'hapax_token_ratio': self.hapax / n if n else np.nan,
+                'dis_ratio': self.dis / self.types if self.types else np.nan}
+
+
+# ----------------------------------------------------------------------------
+#                              Corpus Measures
+# ----------------------------------------------------------------------------
+def load_tokens(text_df = None, authors = None):
+    '''
+    Every word of every essay (stop words included, since they're part of an
+    author's vocabulary too) with its author.
+
+    Parameters
+    ----------
+    text_df : DataFrame, optional
+        output of corpus.load_lines().
+    authors : DataFrame, optional
+        'Essay' and 'Author' columns. Defaults to corpus.load_authorship(); if
+        the csv hasn't been built yet every author is 'Unknown'.
+
+    Returns
+    -------
+    tokens : DataFrame
+        Essay, Author, line_index, Word and lemmatized_word (the lowercase
+        word), in text order.
+
+    '''
+    import concordance
+
+    tokens = concordance.tokens_from_lines(text_df)
+
+    if authors is None:
+        try:
+            authors = corpus.load_authorship()
+        except FileNotFoundError:
+            authors = pd.DataFrame({'Essay': tokens['Essay'].unique(), 'Author': 'Unknown'})
+
+    tokens = tokens.merge(authors[['Essay', 'Author']], on = 'Essay', how = 'left')
+    tokens['Author'] = tokens['Author'].fillna('Unknown')
+
+    return tokens
+
+
+def stream_richness(documents, vocab_size, window = 100):
+    '''
+    Richness of every essay and every author in one pass over the documents.
+
+    Parameters
+    ----------
+    documents : iterable
+        (essay, author, codes) tuples; can be a generator.
+    vocab_size : int
+        number of distinct codes.
+    window : int
+        MATTR window length.
+
+    Returns
+    -------
+    by_essay : DataFrame
+        Essay, Author and the METRICS columns.
+    by_author : DataFrame
+        Author and the METRICS columns, pooling the author's essays.
+
+    '''
+    # One accumulator reused for every essay, one per author
+    essay_acc = RichnessAccumulator(vocab_size, window)
+    author_accs = {}
+
+    rows = []
+    for essay, author, codes in documents:
+        essay_acc.reset()
+        essay_acc.update(codes)
+        rows.append({'Essay': essay, 'Author': author, **essay_acc.metrics()})
+
+        if author not in author_accs:
+            author_accs[author] = RichnessAccumulator(vocab_size, window)
+        author_accs[author].update(codes)
+        author_accs[author].end_document()
+
+    by_essay = pd.DataFrame(rows, columns = ['Essay', 'Author'] + METRICS)
+    by_author = pd.DataFrame([{'Author': author, **acc.metrics()}
+                              for author, acc in sorted(author_accs.items())],
+                             columns = ['Author'] + METRICS)
+
+    return by_essay, by_author
+
+
+def lexical_richness(tokens = None, term = 'lemmatized_word', window = 100):
+    '''
+    Richness of every essay and every author.
+
+    Parameters
+    ----------
+    tokens : DataFrame, optional
+        one row per token with Essay and Author columns, each essay's tokens
+        in text order. Defaults to load_tokens().
+    term : string
+        column holding the words.
+    window : int
+        MATTR window length.
+
+    Returns
+    -------
+    by_essay, by_author : DataFrame
+        see stream_richness().
+
+    '''
+    if tokens is None:
+        tokens = load_tokens()
+
+    documents, vocab = corpus.documents_from_tokens(tokens, term)
+
+    return stream_richness(documents, len(vocab), window)
+
+
+# ----------------------------------------------------------------------------
+#                                Benchmark
+# ----------------------------------------------------------------------------
+def check_paths(documents, vocab_size, window = 100):
+    '''
+    True if add() one token at a time and update() give the same measures.
+    '''
+    one, chunked = RichnessAccumulator(vocab_size, window), RichnessAccumulator(vocab_size, window, 997)
+    for _, _, codes in documents:
+        for code in codes:
+            one.add(code)
+        one.end_document()
+        chunked.update(codes)
+        chunked.end_document()
+
+    a, b = one.metrics(), chunked.metrics()
+
+    return all(np.isclose(a[k], b[k], rtol = 1e-12) for k in METRICS)
+
+
+def benchmark(tokens = None, factors = (1, 10, 100), window = 100):
+    '''
+    Time the streaming pass over the corpus scaled up by each factor, with its
+    peak memory.
+
+    Returns
+    -------
+    timings : DataFrame
+        factor, tokens, seconds, tokens_per_second and peak_mb.
+
+    '''
+    if tokens is None:
+        tokens = load_tokens()
+
+    documents, vocab = corpus.documents_from_tokens(tokens)
+    n_tokens = sum(len(codes) for _, _, codes in documents)
+
+    rows = []
+    for factor in factors:
+        tracemalloc.start()
+        started = time.perf_counter()
+        stream_richness(corpus.scaled_documents(documents, factor), len(vocab), window)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rows.append({'factor': factor,
+                     'tokens': n_tokens * factor,
+                     'seconds': round(elapsed, 3),
+                     'tokens_per_second': round(n_tokens * factor / elapsed),
+                     'peak_mb': round(peak / 1e6, 2)})
+
+    return pd.DataFrame(rows)
+
+
+#%%
+if __name__ == '__main__':
+    fed_tokens = load_tokens()
+    by_essay, by_author = lexical_richness(fed_tokens)
+
+    print(by_author.round(4).to_string(index = False))
+    print(by_essay.groupby('Author')[['ttr', 'mattr', 'yules_k', 'hapax_ratio']].mean().round(4))
+
+    documents, vocab = corpus.documents_from_tokens(fed_tokens)
+    print(f"add() and update() agree: {check_paths(documents[:5], len(vocab))}")
+    print(benchmark(fed_tokens))
@@ -0,0 +1,168 @@
+##LSA - Dense truncated-SVD embeddings for essays and queries
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to give the similarity model a dense mode.
+# The cosine similarities in text_analysis.py are computed over the full,
+# sparse TF-IDF vocabulary, so every query costs as much as the vocabulary is
+# big and words that mean the same thing never match. Latent semantic analysis
+# (LSA) runs a randomized truncated SVD on that same matrix (fed_transform) and
+# keeps k dimensions:
+#   1. the essay embeddings are saved as one contiguous float32 array,
+#   2. new text is projected into the same space with the saved SVD, and
+#   3. similarity and clustering become small dense matrix products.
+#
+# The LSA pieces are added to the model dict from similarity_service.py, so
+# query_similar(..., mode = 'lsa') works for both the Python API and the server.
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.decomposition import TruncatedSVD
+
+import corpus
+
+
+EMBEDDINGS_PATH = os.path.join(corpus.DATA_DIR, 'lsa_embeddings.npy')
+
+
+def _normalize(vectors):
+    # l2 normalise the rows so a dot product is the cosine similarity
+    norms = np.linalg.norm(vectors, axis = 1, keepdims = True)
+    vectors = np.divide(vectors, norms, out = np.zeros_like(vectors), where = norms > 0)
+
+    return np.ascontiguousarray(vectors, dtype = np.float32)
+
+
+def build_lsa(model, n_components = 100, n_iter = 7, random_state = 0):
+    '''
+    Run randomized truncated SVD on the TF-IDF matrix and add the SVD and the
+    essay embeddings to the model.
+
+    Parameters
+    ----------
+    model : dict
+        model from similarity_service.build_model() or load_model().
+    n_components : int
+        number of dimensions to keep (capped at one less than the number of
+        essays).
+    n_iter : int
+        power iterations for the randomized solver.
+    random_state : int
+        seed, so the embeddings come out the same each run.
+
+    Returns
+    -------
+    model : dict
+        the same model with 'svd' and 'embeddings' (an n_essays x k C-contiguous
+        float32 array with unit-length rows) added.
+
+    '''
+    matrix = model['matrix']
+    n_components = min(n_components, min(matrix.shape) - 1)
+
+    svd = TruncatedSVD(n_components = n_components,
+                       algorithm = 'randomized',
+                       n_iter = n_iter,
+                       random_state = random_state)
+
+    model['svd'] = svd
+    model['embeddings'] = _normalize(svd.fit_transform(matrix))
+
+    return model
+
+
+def project(model, rows):
+    '''
+    Project TF-IDF rows (from the model's vectorizer) into the LSA space.
+
+    Parameters
+    ----------
+    model : dict
+        model with LSA added by build_lsa().
+    rows : sparse matrix
+        TF-IDF rows.
+
+    Returns
+    -------
+    embeddings : array
+        float32, one unit-length row per input row.
+
+    '''
+    if 'svd' not in model:
+        raise ValueError("The model has no LSA space yet; run lsa.build_lsa(model) first")
+
+    return _normalize(model['svd'].transform(rows))
+
+
+def embed_text(model, texts, stop = None):
+    '''
+    Clean, vectorize and project raw texts into the LSA space.
+    '''
+    cleaned = [corpus.clean_text(x, stop = stop) for x in texts]
+
+    return project(model, model['vectorizer'].transform(cleaned))
+
+
+def save_embeddings(model, path = EMBEDDINGS_PATH):
+    '''
+    Save the essay embeddings as a .npy file (can be memory-mapped back in with
+    np.load(path, mmap_mode = 'r')).
+    '''
+    np.save(path, model['embeddings'])
+
+
+def explained_variance(model):
+    '''
+    Share of the TF-IDF variance the kept dimensions explain.
+    '''
+    return float(model['svd'].explained_variance_ratio_.sum())
+
+
+def cluster_essays(model, n_clusters = 4, random_state = 0):
+    '''
+    K-means clustering of the essays in the LSA space.
+
+    Parameters
+    ----------
+    model : dict
+        model with LSA added by build_lsa().
+    n_clusters : int
+        number of clusters.
+    random_state : int
+        seed for k-means.
+
+    Returns
+    -------
+    clusters : DataFrame
+        Essay, Author and cluster columns.
+
+    '''
+    kmeans = KMeans(n_clusters = n_clusters, n_init = 10, random_state = random_state)
+    labels = kmeans.fit_predict(model['embeddings'])
+
+    return pd.DataFrame({'Essay': model['essays'],
+                         'Author': model['authors'],
+                         'cluster': labels})
+
+
+#%%
+if __name__ == '__main__':
+    import similarity_service
+
+    fed_model = similarity_service.load_model() \
+        if os.path.exists(similarity_service.MODEL_PATH) else similarity_service.build_model()
+
+    build_lsa(fed_model)
+    save_embeddings(fed_model)
+    similarity_service.save_model(fed_model)
+    print(f"{fed_model['embeddings'].shape[1]} dimensions explain "
+          f"{explained_variance(fed_model):.1%} of the variance")
+
+    for row in similarity_service.query_similar(fed_model, essay = 'Essay 52', mode = 'lsa'):
+        print(row)
+
+    clusters = cluster_essays(fed_model)
+    print(pd.crosstab(clusters['Author'], clusters['cluster']))
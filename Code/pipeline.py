@@ -0,0 +1,564 @@
+##Pipeline - Run the load / tag / merge / analysis steps as a DAG
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to run the steps that Data Load Script.py,
+# EDA.py and text_analysis.py do one after another as a small DAG instead:
+#
+#     load ---> tag ---------+
+#                            +--> merge --+--> aggregates
+#     authorship ------------+            +--> figures
+#          |
+#          +--> tfidf --> similarity
+#
+# Every stage declares the stages it takes as inputs and the files it writes.
+# A stage starts as soon as its inputs are done, so the authorship scrape runs
+# while the corpus is being tagged and the TF-IDF model is fit without waiting
+# on tagging at all. CPU heavy stages go to a process pool, the rest to a thread
+# pool. Like make, a stage is skipped when its outputs are newer than its
+# sources and its inputs' outputs; its result is read back from disk only if
+# a stage that does run needs it.
+#
+#   python Code/pipeline.py                  (run whatever is out of date)
+#   python Code/pipeline.py --force tag      (re-run tag and everything after it)
+#   python Code/pipeline.py --dry-run        (just print the plan)
+import argparse
+import functools
+import glob
+import os
+import pickle
+import runpy
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+import corpus
+
+
+CODE_DIR = os.path.join(corpus.PROJECT_DIR, 'Code')
+VIZ_DIR = os.path.join(corpus.PROJECT_DIR, 'Viz')
+CACHE_DIR = os.path.join(corpus.DATA_DIR, 'cache')
+
+EXECUTORS = ('thread', 'process')
+
+
+# ----------------------------------------------------------------------------
+#                                  Stages
+# ----------------------------------------------------------------------------
+def _save_pickle(result, outputs):
+    with open(outputs[0], 'wb') as f:
+        pickle.dump(result, f, protocol = pickle.HIGHEST_PROTOCOL)
+
+
+def _load_pickle(outputs):
+    with open(outputs[0], 'rb') as f:
+        return pickle.load(f)
+
+
+class Stage:
+    '''
+    One step of the pipeline.
+
+    Parameters
+    ----------
+    name : string
+        name other stages use to refer to this one.
+    function : callable
+        called with the results of the input stages as keyword arguments (by
+        stage name). Must be a module level function (or a functools.partial
+        of one) if it runs on the process pool.
+    inputs : tuple
+        names of the stages this one needs.
+    outputs : tuple
+        files the stage's result is saved to.
+    sources : tuple
+        other files (glob patterns allowed) the stage reads, including its
+        code. The stage is out of date if any of them is newer than its outputs.
+    executor : string
+        'thread' for I/O bound stages, 'process' for CPU bound ones.
+    save, load : callable, optional
+        save(result, outputs) and load(outputs). Default to pickling the result
+        to outputs[0]. A stage whose function writes its own files can pass
+        save = None.
+
+    '''
+
+    def __init__(self, name, function, inputs = (), outputs = (), sources = (),
+                 executor = 'thread', save = _save_pickle, load = _load_pickle):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor!r}, pick one of {EXECUTORS}")
+
+        self.name = name
+        self.function = function
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.sources = tuple(sources)
+        self.executor = executor
+        self.save = save
+        self.load = load
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs = {self.inputs}, executor = {self.executor!r})"
+
+    def source_files(self):
+        return [path for pattern in self.sources for path in sorted(glob.glob(pattern))]
+
+
+class Pipeline:
+    '''
+    A set of stages, run in dependency order with independent stages running
+    at the same time.
+
+    Parameters
+    ----------
+    stages : list, optional
+        Stage objects to start with (more can be added with add()).
+
+    '''
+
+    def __init__(self, stages = ()):
+        self.stages = {}
+        for stage in stages:
+            self.add(stage)
+
+    def add(self, stage):
+        if stage.name in self.stages:
+            raise ValueError(f"There is already a stage called {stage.name!r}")
+        self.stages[stage.name] = stage
+
+        return stage
+
+    def order(self, targets = None):
+        '''
+        The stages needed for the targets (default: every stage), each after
+        all of its inputs.
+        '''
+        targets = list(self.stages) if targets is None else list(targets)
+
+        ordered = []
+        state = {}
+
+        def visit(name, path):
+            if name not in self.stages:
+                raise KeyError(f"Unknown stage {name!r}" + (f" (input of {path[-1]!r})" if path else ""))
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError("Cycle in the pipeline: " + " -> ".join(path + [name]))
+
+            state[name] = 'visiting'
+            for upstream in self.stages[name].inputs:
+                visit(upstream, path + [name])
+            state[name] = 'done'
+            ordered.append(name)
+
+        for name in targets:
+            visit(name, [])
+
+        return ordered
+
+    # ------------------------------------------------------------------------
+    #                              Up to Date?
+    # ------------------------------------------------------------------------
+    def _out_of_date(self, stage):
+        '''
+        Why a stage has to run, or None if its outputs are current.
+        '''
+        if not stage.outputs:
+            return 'no outputs'
+
+        missing = [path for path in stage.outputs if not os.path.exists(path)]
+        if missing:
+            return f"missing {os.path.relpath(missing[0], corpus.PROJECT_DIR)}"
+
+        built = min(os.path.getmtime(path) for path in stage.outputs)
+        depends_on = stage.source_files() + [path for name in stage.inputs
+                                             for path in self.stages[name].outputs]
+        for path in depends_on:
+            if os.path.exists(path) and os.path.getmtime(path) > built:
+                return f"{os.path.relpath(path, corpus.PROJECT_DIR)} changed"
+
+        return None
+
+    def plan(self, targets = None, force = ()):
+        '''
+        Decide which stages run.
+
+        Parameters
+        ----------
+        targets : list, optional
+            stages we want (their inputs come along). Defaults to every stage.
+        force : iterable
+            stages to re-run even if they're up to date.
+
+        Returns
+        -------
+        plan : dict
+            stage name -> reason to run it, or None to skip it, in run order.
+
+        '''
+        force = set(force)
+        unknown = force - set(self.stages)
+        if unknown:
+            raise KeyError(f"Unknown stage(s) {sorted(unknown)}")
+
+        plan = {}
+        for name in self.order(targets):
+            stage = self.stages[name]
+            if name in force:
+                plan[name] = 'forced'
+            elif any(plan[upstream] for upstream in stage.inputs):
+                # Anything downstream of a stage that runs has to run too
+                plan[name] = 'input re-run'
+            else:
+                plan[name] = self._out_of_date(stage)
+
+        return plan
+
+    # ------------------------------------------------------------------------
+    #                                  Run
+    # ------------------------------------------------------------------------
+    def run(self, targets = None, force = (), max_workers = None, verbose = True):
+        '''
+        Run the out of date stages, each one as soon as its inputs are ready.
+
+        Parameters
+        ----------
+        targets : list, optional
+            stages we want. Defaults to every stage.
+        force : iterable
+            stages to re-run even if they're up to date.
+        max_workers : int, optional
+            size of each of the thread and process pools.
+        verbose : bool
+            print a line as each stage starts and finishes.
+
+        Returns
+        -------
+        results : dict
+            stage name -> result, for the stages that ran and for the targets.
+        report : DataFrame
+            stage, status ('ran' or 'skipped'), reason and seconds.
+
+        '''
+        plan = self.plan(targets, force)
+        targets = list(plan) if targets is None else list(targets)
+
+        results = {}
+        report = {name: {'stage': name, 'status': 'skipped', 'reason': 'up to date',
+                         'seconds': 0.0} for name, reason in plan.items() if reason is None}
+
+        def result_of(name):
+            # Results of skipped stages are only read back when something needs them
+            if name not in results:
+                stage = self.stages[name]
+                results[name] = stage.load(stage.outputs) if stage.load else None
+            return results[name]
+
+        pools = {'thread': ThreadPoolExecutor(max_workers = max_workers),
+                 'process': ProcessPoolExecutor(max_workers = max_workers)}
+        waiting = [name for name, reason in plan.items() if reason]
+        running = {}
+        started = {}
+
+        try:
+            while waiting or running:
+                # Start everything whose inputs are finished
+                for name in list(waiting):
+                    stage = self.stages[name]
+                    if any(upstream in waiting or upstream in running.values()
+                           for upstream in stage.inputs):
+                        continue
+
+                    kwargs = {upstream: result_of(upstream) for upstream in stage.inputs}
+                    if verbose:
+                        print(f"[pipeline] start {name:<12} ({plan[name]}, {stage.executor})")
+                    started[name] = time.perf_counter()
+                    running[pools[stage.executor].submit(stage.function, **kwargs)] = name
+                    waiting.remove(name)
+
+                finished, _ = wait(running, return_when = FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+
+                    # Let the error through; the pools are shut down below
+                    results[name] = future.result()
+                    if stage.save and stage.outputs:
+                        for path in stage.outputs:
+                            os.makedirs(os.path.dirname(path), exist_ok = True)
+                        stage.save(results[name], stage.outputs)
+
+                    seconds = time.perf_counter() - started[name]
+                    report[name] = {'stage': name, 'status': 'ran', 'reason': plan[name],
+                                    'seconds': round(seconds, 3)}
+                    if verbose:
+                        print(f"[pipeline] done  {name:<12} {seconds:.2f}s")
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait = True, cancel_futures = True)
+
+        for name in targets:
+            result_of(name)
+
+        return results, pd.DataFrame([report[name] for name in plan])
+
+
+# ----------------------------------------------------------------------------
+#                             Stage Functions
+# ----------------------------------------------------------------------------
+# Module level so they can be sent to the process pool.
+def load_stage(data_dir = corpus.DATA_DIR):
+    '''
+    Every line of every essay (corpus.load_lines()).
+    '''
+    return corpus.load_lines(data_dir)
+
+
+def tag_stage(load, backend = 'perceptron', sentence_tagging = True, data_dir = corpus.DATA_DIR):
+    '''
+    Tag, filter and lemmatize every line into the token level dataframe, with
+    the same pos_tagging.tag_corpus() call Data Load Script.py makes, so both
+    write the same full_fedpapers.csv.
+
+    Parameters
+    ----------
+    load : DataFrame
+        output of the load stage (corpus.load_lines()).
+    backend : string
+        part of speech tagger backend (see pos_tagging.py).
+    sentence_tagging : bool
+        see pos_tagging.tag_corpus().
+    data_dir : string
+        folder holding the essays.
+
+    Returns
+    -------
+    tokens : DataFrame
+        line_index, Essay, Lines, Word, lemmatized_word and part_of_speech.
+
+    '''
+    import pos_tagging
+
+    return pos_tagging.tag_corpus(load, backend = backend, sentence_tagging = sentence_tagging,
+                                  data_dir = data_dir).to_pandas()
+
+
+def authorship_stage():
+    '''
+    Scrape and clean the authorship table (corpus.fetch_authorship()).
+    '''
+    return corpus.fetch_authorship()
+
+
+def merge_stage(tag, authorship):
+    '''
+    Join the tokens to the authorship table, as the csv EDA.py reads.
+    '''
+    return tag.merge(authorship, left_on = 'Essay', right_on = 'Essay', how = 'inner')
+
+
+def _save_csv(result, outputs):
+    result.to_csv(outputs[0], index = False)
+
+
+def _load_csv(outputs):
+    return pd.read_csv(outputs[0], keep_default_na = False)
+
+
+def aggregates_stage(merge):
+    '''
+    The count tables EDA.py builds, plus the top keyness words per author.
+
+    Returns
+    -------
+    aggregates : dict
+        'word_counts' (Word, count, doc_count), 'author_counts' (Author, Word,
+        count), 'essay_lengths' (Essay, Author, length) and 'keywords' (see
+        keyness.top_keywords()).
+
+    '''
+    import keyness
+
+    word_counts = merge.groupby('Word') \
+        .agg(count = ('Essay', 'size'), doc_count = ('Essay', 'nunique')) \
+        .sort_values('count', ascending = False) \
+        .reset_index()
+
+    author_counts = merge.groupby(['Author', 'Word']) \
+        .size() \
+        .reset_index(name = 'count') \
+        .sort_values(['Author', 'count'], ascending = [True, False], ignore_index = True)
+
+    essay_lengths = merge.groupby(['Essay', 'Author']) \
+        .size() \
+        .reset_index(name = 'length')
+
+    return {'word_counts': word_counts,
+            'author_counts': author_counts,
+            'essay_lengths': essay_lengths,
+            'keywords': keyness.top_keywords(merge, k = 10)}
+
+
+def tfidf_stage(authorship, data_dir = corpus.DATA_DIR):
+    '''
+    Fit the TF-IDF model of similarity_service.py. It reads the essays itself,
+    so it doesn't have to wait for tagging.
+    '''
+    import similarity_service
+
+    return similarity_service.build_model(corpus.essay_documents(data_dir), authorship)
+
+
+def similarity_stage(tfidf, k = 5):
+    '''
+    The k most similar essays to every essay.
+
+    Returns
+    -------
+    similar : DataFrame
+        Essay, Author, rank, Similar_Essay, Similar_Author and score.
+
+    '''
+    import similarity_service
+
+    queries = [{'essay': essay} for essay in tfidf['essays']]
+    rows = []
+    for essay, author, matches in zip(tfidf['essays'], tfidf['authors'],
+                                      similarity_service.query_batch(tfidf, queries, k = k)):
+        for rank, match in enumerate(matches, start = 1):
+            rows.append({'Essay': essay, 'Author': author, 'rank': rank,
+                         'Similar_Essay': match['essay'],
+                         'Similar_Author': match['author'],
+                         'score': match['score']})
+
+    return pd.DataFrame(rows)
+
+
+def _save_model(result, outputs):
+    import similarity_service
+    similarity_service.save_model(result, outputs[0])
+
+
+def _load_model(outputs):
+    import similarity_service
+    return similarity_service.load_model(outputs[0])
+
+
+def figures_stage(merge, script = os.path.join(CODE_DIR, 'EDA.py')):
+    '''
+    Run EDA.py to redraw the figures in Viz/. It reads the csv written by the
+    merge stage, so the merged frame itself isn't used. Runs in its own process
+    because pyplot keeps global state.
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+
+    # EDA.py uses paths relative to the project root
+    cwd = os.getcwd()
+    os.chdir(corpus.PROJECT_DIR)
+    try:
+        runpy.run_path(script, run_name = '__main__')
+    finally:
+        os.chdir(cwd)
+
+        import matplotlib.pyplot as plt
+        plt.close('all')
+
+
+FIGURES = ['Top_20_Words.png', 'Document_Lengths.png', 'Document_Lengths_by_Author.png',
+           'Hamilton_Top_Words.png', 'Jay_Top_Words.png', 'Madison_Top_Words.png',
+           'Unknown_Top_Words.png', 'Word_Frequency_by_Document_Frequency.png',
+           'Top_Keyness.png']
+
+
+def build_pipeline(backend = 'perceptron', sentence_tagging = True, data_dir = corpus.DATA_DIR,
+                   cache_dir = CACHE_DIR):
+    '''
+    The project's pipeline (see the diagram at the top of this module).
+
+    Parameters
+    ----------
+    backend : string
+        part of speech tagger backend for the tag stage.
+    sentence_tagging : bool
+        see tag_stage().
+    data_dir : string
+        folder holding the essays.
+    cache_dir : string
+        where the intermediate results are kept.
+
+    Returns
+    -------
+    pipeline : Pipeline
+        the stages, ready to run.
+
+    '''
+    import similarity_service
+
+    essays = os.path.join(data_dir, '*.txt')
+
+    def code(*modules):
+        return tuple(os.path.join(CODE_DIR, m + '.py') for m in modules)
+
+    return Pipeline([
+        Stage('load', functools.partial(load_stage, data_dir),
+              outputs = [os.path.join(cache_dir, 'lines.pkl')],
+              sources = (essays,) + code('corpus')),
+        Stage('tag', functools.partial(tag_stage, backend = backend,
+                                       sentence_tagging = sentence_tagging, data_dir = data_dir),
+              inputs = ['load'],
+              outputs = [os.path.join(cache_dir, f'tokens_{backend}.pkl')],
+              sources = code('corpus', 'pos_tagging', 'sentences', 'token_table', 'pipeline'),
+              executor = 'process'),
+        Stage('authorship', authorship_stage,
+              outputs = [os.path.join(cache_dir, 'authorship.pkl')]),
+        Stage('merge', merge_stage,
+              inputs = ['tag', 'authorship'],
+              outputs = [corpus.FULL_FEDPAPERS_CSV],
+              save = _save_csv, load = _load_csv),
+        Stage('aggregates', aggregates_stage,
+              inputs = ['merge'],
+              outputs = [os.path.join(cache_dir, 'aggregates.pkl')],
+              sources = code('keyness'),
+              executor = 'process'),
+        Stage('tfidf', functools.partial(tfidf_stage, data_dir = data_dir),
+              inputs = ['authorship'],
+              outputs = [similarity_service.MODEL_PATH],
+              sources = (essays,) + code('corpus', 'similarity_service'),
+              executor = 'process',
+              save = _save_model, load = _load_model),
+        Stage('similarity', similarity_stage,
+              inputs = ['tfidf'],
+              outputs = [os.path.join(cache_dir, 'similar_essays.csv')],
+              save = _save_csv, load = _load_csv),
+        Stage('figures', figures_stage,
+              inputs = ['merge'],
+              outputs = [os.path.join(VIZ_DIR, name) for name in FIGURES],
+              sources = code('EDA', 'keyness'),
+              executor = 'process',
+              save = None, load = None),
+    ])
+
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Run the pipeline stages that are out of date")
+    parser.add_argument('targets', nargs = '*', help = 'stages to bring up to date (default: all)')
+    parser.add_argument('--force', nargs = '*', default = [], help = 'stages to re-run anyway')
+    parser.add_argument('--backend', default = 'perceptron', help = 'part of speech tagger backend')
+    parser.add_argument('--workers', type = int, help = 'size of each worker pool')
+    parser.add_argument('--dry-run', action = 'store_true', help = 'print the plan and stop')
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(backend = args.backend)
+    targets = args.targets or None
+
+    if args.dry_run:
+        for name, reason in pipeline.plan(targets, args.force).items():
+            print(f"{name:<12} {reason or 'up to date'}")
+    else:
+        _, report = pipeline.run(targets, force = args.force, max_workers = args.workers)
+        print(report.to_string(index = False))
@@ -0,0 +1,568 @@
+##POS Tagging - Selectable, cached part of speech taggers
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to make the part of speech tagging in
+# Data Load Script.py cheaper on big corpora. There are three backends:
+#   1. 'nltk'       | nltk.pos_tag once per line, exactly what the script used
+#                     to do (kept so we can compare against it).
+#   2. 'perceptron' | NLTK's averaged perceptron, loaded once per process and
+#                     run over a whole essay's lines at a time with tag_sents.
+#                     Same tags as 'nltk', less overhead per line.
+#   3. 'lookup'     | a word -> most frequent tag lookup plus suffix rules for
+#                     unseen words. Much faster and good enough to pick out
+#                     content words, at some cost in accuracy. The lookup table
+#                     is learned from the perceptron's output and cached in
+#                     Data/, along with a hash of the lines it was learned from
+#                     so it's retrained when the essays change.
+#
+# compare_backends() reports throughput and how often each backend agrees with
+# the part_of_speech column already in full_fedpapers.csv, matching lines by
+# essay and text and scoring on essays the lookup tagger wasn't trained on.
+# Every backend tags the way the csv was built (whole sentences, or line by
+# line), so the numbers compare taggers rather than tagging granularity.
+import functools
+import hashlib
+import os
+import pickle
+import re
+import string
+import time
+from collections import Counter, defaultdict
+
+import nltk
+import pandas as pd
+
+import corpus
+
+
+LOOKUP_TAGGER_PATH = os.path.join(corpus.DATA_DIR, 'lookup_tagger.pkl')
+
+BACKENDS = ('nltk', 'perceptron', 'lookup')
+
+
+# ----------------------------------------------------------------------------
+#                              Perceptron Tagger
+# ----------------------------------------------------------------------------
+@functools.lru_cache(maxsize = None)
+def get_perceptron_tagger():
+    '''
+    Load NLTK's averaged perceptron tagger once and share it. (Older versions
+    of nltk.pos_tag build a new tagger, and reload the model, on every call.)
+
+    Returns
+    -------
+    tagger : PerceptronTagger
+        the loaded tagger.
+
+    '''
+    from nltk.tag.perceptron import PerceptronTagger
+
+    return PerceptronTagger()
+
+
+# ----------------------------------------------------------------------------
+#                          Lookup + Suffix Tagger
+# ----------------------------------------------------------------------------
+class LookupSuffixTagger:
+    '''
+    Tag each word with its most frequent tag from training, falling back on
+    suffix rules (and capitalisation) for words it hasn't seen.
+
+    Parameters
+    ----------
+    lookup : dict
+        word -> tag.
+    suffixes : dict
+        suffix -> tag, learned from the training data.
+
+    '''
+
+    # Rules of thumb for words that aren't in the lookup or suffix tables
+    FALLBACK_RULES = [(re.compile(r'^-?\d+([.,]\d+)*$'), 'CD'),
+                      (re.compile(r'.*ly$'), 'RB'),
+                      (re.compile(r'.*ing$'), 'VBG'),
+                      (re.compile(r'.*ed$'), 'VBN'),
+                      (re.compile(r'.*(ous|ful|ive|able|ible|al|ic)$'), 'JJ'),
+                      (re.compile(r'.*ss$'), 'NN'),
+                      (re.compile(r'.*s$'), 'NNS')]
+
+    def __init__(self, lookup, suffixes):
+        self.lookup = lookup
+        self.suffixes = suffixes
+
+    @classmethod
+    def train(cls, tagged_sents, suffix_lengths = (4, 3, 2), min_count = 3):
+        '''
+        Learn the lookup and suffix tables from tagged sentences.
+
+        Parameters
+        ----------
+        tagged_sents : iterable
+            lists of (word, tag) pairs.
+        suffix_lengths : tuple
+            suffix lengths to learn, longest first.
+        min_count : int
+            ignore suffixes seen fewer times than this.
+
+        Returns
+        -------
+        tagger : LookupSuffixTagger
+            the trained tagger.
+
+        '''
+        word_tags = defaultdict(Counter)
+        suffix_tags = defaultdict(Counter)
+
+        for sent in tagged_sents:
+            for word, tag in sent:
+                word_tags[word][tag] += 1
+                # Lowercase entry too, so sentence-initial words still hit
+                word_tags[word.lower()][tag] += 1
+                for n in suffix_lengths:
+                    if len(word) > n:
+                        suffix_tags[word[-n:].lower()][tag] += 1
+
+        lookup = {word: tags.most_common(1)[0][0] for word, tags in word_tags.items()}
+        suffixes = {suffix: tags.most_common(1)[0][0] for suffix, tags in suffix_tags.items()
+                    if sum(tags.values()) >= min_count}
+
+        return cls(lookup, suffixes)
+
+    def _tag_word(self, word):
+        tag = self.lookup.get(word) or self.lookup.get(word.lower())
+        if tag is not None:
+            return tag
+
+        if all(c in string.punctuation for c in word):
+            return word if len(word) == 1 else ':'
+
+        for n in (4, 3, 2):
+            tag = self.suffixes.get(word[-n:].lower())
+            if tag is not None and len(word) > n:
+                return tag
+
+        for pattern, tag in self.FALLBACK_RULES:
+            if pattern.match(word):
+                return tag
+
+        return 'NNP' if word[:1].isupper() else 'NN'
+
+    def tag(self, tokens):
+        return [(word, self._tag_word(word)) for word in tokens]
+
+    def tag_sents(self, sentences):
+        return [self.tag(tokens) for tokens in sentences]
+
+
+def train_lookup_tagger(lines = None):
+    '''
+    Train the lookup tagger on the perceptron's tags for the corpus.
+
+    Parameters
+    ----------
+    lines : list, optional
+        raw lines to tag for training. Defaults to every line in Data/.
+
+    Returns
+    -------
+    tagger : LookupSuffixTagger
+        the trained tagger.
+
+    '''
+    if lines is None:
+        lines = list(corpus.load_lines()['lines'])
+
+    return LookupSuffixTagger.train(get_perceptron_tagger().tag_sents(tokenize_lines(lines)))
+
+
+def training_key(lines):
+    '''
+    Hash of the lines a lookup tagger is trained on, to tell a stale cache.
+    '''
+    digest = hashlib.sha1()
+    for line in lines:
+        digest.update(line.encode('utf-8'))
+        digest.update(b'\n')
+
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize = None)
+def get_lookup_tagger(path = LOOKUP_TAGGER_PATH, data_dir = corpus.DATA_DIR):
+    '''
+    Load the cached lookup tagger, training and saving it the first time and
+    whenever the essays in data_dir have changed since it was trained.
+
+    Parameters
+    ----------
+    path : string
+        where the trained tagger is cached.
+    data_dir : string
+        folder holding the essays it's trained on.
+
+    Returns
+    -------
+    tagger : LookupSuffixTagger
+        the loaded tagger.
+
+    '''
+    lines = list(corpus.load_lines(data_dir)['lines'])
+    key = training_key(lines)
+
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            cached = pickle.load(f)
+        # Caches from before the key was stored are just the tagger
+        if isinstance(cached, dict) and cached.get('key') == key:
+            return cached['tagger']
+
+    tagger = train_lookup_tagger(lines)
+    with open(path, 'wb') as f:
+        pickle.dump({'key': key, 'tagger': tagger}, f, protocol = pickle.HIGHEST_PROTOCOL)
+
+    return tagger
+
+
+# ----------------------------------------------------------------------------
+#                                 Tagging
+# ----------------------------------------------------------------------------
+def tokenize_lines(lines):
+    '''
+    Tokenize every line with nltk.word_tokenize, like Data Load Script.py does.
+    '''
+    return [nltk.word_tokenize(line) for line in lines]
+
+
+class _PosTagWrapper:
+    '''
+    The 'nltk' backend: nltk.pos_tag called once per sentence (or line).
+    '''
+
+    def tag(self, tokens):
+        return nltk.pos_tag(tokens)
+
+    def tag_sents(self, sentences):
+        return [nltk.pos_tag(tokens) for tokens in sentences]
+
+
+def get_tagger(backend = 'perceptron'):
+    '''
+    The tagger for a backend. Every backend's tagger has tag() and tag_sents().
+
+    Parameters
+    ----------
+    backend : string
+        'nltk', 'perceptron' or 'lookup' (see the top of this module).
+
+    Returns
+    -------
+    tagger : object
+        the (shared) tagger.
+
+    '''
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown tagger backend {backend!r}, pick one of {BACKENDS}")
+
+    if backend == 'nltk':
+        return _PosTagWrapper()
+    if backend == 'perceptron':
+        return get_perceptron_tagger()
+
+    return get_lookup_tagger()
+
+
+def tag_lines(lines, backend = 'perceptron', essays = None, tagger = None):
+    '''
+    Tokenize and tag a list of lines.
+
+    Parameters
+    ----------
+    lines : list
+        raw lines of text.
+    backend : string
+        'nltk', 'perceptron' or 'lookup' (see the top of this module).
+    essays : list, optional
+        essay of each line. Lines are handed to the tagger one essay at a time;
+        without it they all go in one batch.
+    tagger : object, optional
+        a tagger to use instead of the backend's shared one (anything with
+        tag_sents()).
+
+    Returns
+    -------
+    tagged : list
+        a list of (word, tag) pairs for every line.
+
+    '''
+    if tagger is None:
+        tagger = get_tagger(backend)
+    tokens = tokenize_lines(lines)
+
+    if essays is None:
+        return tagger.tag_sents(tokens)
+
+    # Batch a whole essay's lines at a time (lines of an essay are contiguous)
+    tagged = []
+    start = 0
+    for end in range(1, len(tokens) + 1):
+        if end == len(tokens) or essays[end] != essays[start]:
+            tagged.extend(tagger.tag_sents(tokens[start:end]))
+            start = end
+
+    return tagged
+
+
+# ----------------------------------------------------------------------------
+#                          Tagging the Whole Corpus
+# ----------------------------------------------------------------------------
+def wordnet_pos(treebank_tag):
+    '''
+    Map a treebank tag to the WordNet part of speech name the lemmatizer takes
+    ('' if there isn't one).
+    '''
+    from nltk.corpus import wordnet
+
+    return {'J': wordnet.ADJ, 'V': wordnet.VERB,
+            'N': wordnet.NOUN, 'R': wordnet.ADV}.get(treebank_tag[:1], '')
+
+
+def tag_corpus(text_df = None, backend = 'perceptron', sentence_tagging = True,
+               data_dir = corpus.DATA_DIR, stop = None, verbose = False, return_sentences = False):
+    '''
+    Tag every line, drop stop words, punctuation and non-alphabetic tokens and
+    lemmatize the rest into a TokenTable. This is the tagging loop of
+    Data Load Script.py; the script and pipeline.py both call it.
+
+    Essays are tagged and appended one at a time, so only one essay's
+    (word, tag) pairs are ever held in memory.
+
+    Parameters
+    ----------
+    text_df : DataFrame, optional
+        output of corpus.load_lines() (its line_index is the one the table
+        gets). Loaded from data_dir if not given.
+    backend : string
+        'nltk', 'perceptron' or 'lookup' (see the top of this module).
+    sentence_tagging : bool
+        tag whole sentences and hand the tags back line by line (see
+        sentences.py) rather than tagging each wrapped line on its own.
+    data_dir : string
+        folder holding the essays.
+    stop : set, optional
+        stop words to drop. Defaults to corpus.get_stop_words().
+    verbose : bool
+        print a line per essay.
+    return_sentences : bool
+        also return the sentences the tags came from (needs sentence_tagging),
+        for sentences.stylometry_features() without a second tagging pass.
+
+    Returns
+    -------
+    tokens : TokenTable
+        the kept tokens.
+    fed_sentences : DataFrame
+        only with return_sentences: one row per sentence, as from
+        sentences.segment_corpus() but without the tokens and token_lines
+        columns (the token table has the words already).
+
+    '''
+    from nltk.stem import WordNetLemmatizer
+
+    import sentences
+    import token_table
+
+    if text_df is None:
+        text_df = corpus.load_lines(data_dir)
+    if stop is None:
+        stop = corpus.get_stop_words()
+    if return_sentences and not sentence_tagging:
+        raise ValueError("return_sentences needs sentence_tagging")
+
+    paths = {corpus.essay_name(x): os.path.join(data_dir, x) for x in corpus.list_essay_files(data_dir)}
+    lemmatizer = WordNetLemmatizer()
+    lemmas = {}
+
+    tokens = token_table.TokenTable()
+    sentence_frames = []
+    for essay, essay_df in text_df.groupby('Essay', sort = False):
+        lines = list(essay_df['lines'])
+        line_index = list(essay_df['line_index'])
+
+        if sentence_tagging:
+            tagged_lines, essay_sentences = sentences.tag_essay_lines(
+                paths[essay], first_line = line_index[0], n_lines = len(lines), backend = backend)
+            if return_sentences:
+                sentence_frames.append(essay_sentences.drop(columns = ['tokens', 'token_lines']))
+        else:
+            tagged_lines = tag_lines(lines, backend = backend)
+
+        n_before = len(tokens)
+        for idx, line, pos_tags in zip(line_index, lines, tagged_lines):
+            tokens.add_line(idx, line)
+
+            for offset, (word, pos) in enumerate(pos_tags):
+                if word.lower() in stop or word in string.punctuation or not word.isalpha():
+                    continue
+
+                # The same word and tag always lemmatize the same way
+                key = (word, pos)
+                if key not in lemmas:
+                    try:
+                        lemmas[key] = lemmatizer.lemmatize(word.lower(), pos = wordnet_pos(pos))
+                    # For some words the lemmatizer fails; keep the word as is
+                    except Exception:
+                        lemmas[key] = word.lower()
+
+                tokens.append(idx, essay, word, lemmas[key], pos, offset)
+
+        if verbose:
+            print(f"{essay}: kept {len(tokens) - n_before} tokens from {len(lines)} lines")
+
+    if return_sentences:
+        return tokens, pd.concat(sentence_frames, ignore_index = True)
+
+    return tokens
+
+
+# ----------------------------------------------------------------------------
+#                             Compare Backends
+# ----------------------------------------------------------------------------
+def content_tags(tagged_line, stop):
+    '''
+    Keep the tags of the words Data Load Script.py keeps (no stop words,
+    punctuation or non-alphabetic tokens).
+    '''
+    return [pos for word, pos in tagged_line
+            if not (word.lower() in stop or word in string.punctuation or not word.isalpha())]
+
+
+def reference_tags(csv_path = corpus.FULL_FEDPAPERS_CSV):
+    '''
+    The content-word tags in full_fedpapers.csv, keyed by (Essay, line text)
+    rather than line_index, so they line up with corpus.load_lines() however
+    the csv's lines were numbered when it was written.
+
+    Returns
+    -------
+    reference : Series
+        list of tags for every (Essay, Lines) pair. Lines whose text appears
+        more than once in an essay are left out, since we can't tell them apart.
+
+    '''
+    tokens = pd.read_csv(csv_path, usecols = ['line_index', 'Essay', 'Lines', 'part_of_speech'],
+                         keep_default_na = False)
+
+    repeats = tokens.groupby(['Essay', 'Lines'])['line_index'].nunique()
+    unique_lines = repeats[repeats == 1].index
+
+    return tokens.groupby(['Essay', 'Lines'], sort = False)['part_of_speech'] \
+        .apply(list) \
+        .reindex(unique_lines) \
+        .dropna()
+
+
+def compare_backends(text_df = None, csv_path = corpus.FULL_FEDPAPERS_CSV,
+                     backends = BACKENDS, stop = None, holdout_every = 5,
+                     sentence_tagging = True, data_dir = corpus.DATA_DIR):
+    '''
+    Time each backend over the corpus and measure how often it agrees with the
+    part_of_speech column in full_fedpapers.csv.
+
+    The lookup tagger is learned from tagged text, so for a fair score it's
+    trained here on the perceptron's tags for every essay except every
+    holdout_every-th one, and every backend's agreement is measured on the
+    held-out essays only.
+
+    The backends should tag the way the csv was built (SENTENCE_TAGGING in
+    Data Load Script.py), or the agreement mixes up the tagger with how much
+    of the sentence it saw.
+
+    Parameters
+    ----------
+    text_df : DataFrame, optional
+        output of corpus.load_lines().
+    csv_path : string
+        path to full_fedpapers.csv. Agreement is skipped if it doesn't exist.
+    backends : tuple
+        backends to compare.
+    stop : set, optional
+        stop words, as in Data Load Script.py.
+    holdout_every : int
+        hold out every holdout_every-th essay (in file order).
+    sentence_tagging : bool
+        tag whole sentences (see sentences.py) rather than one line at a
+        time, as tag_corpus() does.
+    data_dir : string
+        folder holding the essays (for sentence tagging).
+
+    Returns
+    -------
+    comparison : DataFrame
+        tokens per second over the whole corpus, and agreement and the number
+        of tags compared over the held-out essays, for every backend.
+
+    '''
+    import sentences
+
+    if text_df is None:
+        text_df = corpus.load_lines(data_dir)
+    if stop is None:
+        stop = corpus.get_stop_words()
+
+    reference = reference_tags(csv_path) if os.path.exists(csv_path) else None
+
+    held_out = set(text_df['Essay'].unique()[holdout_every - 1::holdout_every])
+    is_held_out = text_df['Essay'].isin(held_out).to_numpy()
+
+    # Make sure the models are loaded before we start the clock
+    taggers = {backend: get_tagger(backend) for backend in backends if backend != 'lookup'}
+    if 'lookup' in backends:
+        taggers['lookup'] = train_lookup_tagger(list(text_df.loc[~is_held_out, 'lines']))
+
+    lines = list(text_df['lines'])
+    essays = list(text_df['Essay'])
+    paths = {corpus.essay_name(x): os.path.join(data_dir, x) for x in corpus.list_essay_files(data_dir)}
+    rows = []
+    for backend in backends:
+        started = time.perf_counter()
+        if sentence_tagging:
+            tagged = []
+            for essay, essay_df in text_df.groupby('Essay', sort = False):
+                tagged.extend(sentences.tag_essay_lines(paths[essay],
+                                                        first_line = essay_df['line_index'].iloc[0],
+                                                        n_lines = len(essay_df),
+                                                        tagger = taggers[backend])[0])
+        else:
+            tagged = tag_lines(lines, essays = essays, tagger = taggers[backend])
+        elapsed = time.perf_counter() - started
+
+        n_tokens = sum(len(line) for line in tagged)
+        row = {'backend': backend,
+               'tokens': n_tokens,
+               'seconds': round(elapsed, 3),
+               'tokens_per_second': round(n_tokens / elapsed)}
+
+        # Agreement on the content words of the held-out lines. Lines where the
+        # number of kept words differs (a different tokenizer run, say) are skipped
+        if reference is not None:
+            agree = total = 0
+            for essay, line, line_tags, keep in zip(essays, lines, tagged, is_held_out):
+                expected = reference.get((essay, line)) if keep else None
+                got = content_tags(line_tags, stop)
+                if expected is None or len(expected) != len(got):
+                    continue
+                agree += sum(a == b for a, b in zip(expected, got))
+                total += len(got)
+            row['agreement'] = round(agree / total, 4) if total else None
+            row['compared'] = total
+
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+#%%
+if __name__ == '__main__':
+    print(compare_backends())
@@ -0,0 +1,469 @@
+##Sentences - Sentence segmentation and sentence-level stylometry
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to stop treating the essays as a list of
+# physical lines. The files are hard-wrapped at about 70 characters, so
+# tokenizing and tagging a line at a time hands the tagger sentence fragments
+# and throws away sentence structure. Here we:
+#   1. rebuild paragraphs from the wrapped lines (a blank line, or a short line
+#      ending a sentence, closes a paragraph),
+#   2. split paragraphs into sentences, remembering which line_index every
+#      sentence and token came from,
+#   3. tokenize and tag whole sentences in the same pass, and
+#   4. compute sentence-length and POS-sequence distributions per essay, two
+#      classic authorship signals.
+#
+# tags_by_line() hands the sentence-level tags back line by line, so the
+# tagging loop in Data Load Script.py can use them unchanged, and the same pass
+# gives us the sentences for the stylometry features. line_index here
+# counts non-blank lines in sorted file order, the same as corpus.load_lines(),
+# which is where the script gets its lines from.
+import functools
+import os
+import re
+
+import nltk
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from nltk.tokenize import NLTKWordTokenizer
+
+import corpus
+import pos_tagging
+
+
+SPLITTERS = ('punkt', 'regex')
+
+# Lines shorter than this that end a sentence are taken to end a paragraph
+SHORT_LINE = 55
+
+# Sentence length bins (in words) for the length distribution
+LENGTH_BINS = [0, 10, 20, 30, 40, 50, 60, 80, np.inf]
+
+
+# ----------------------------------------------------------------------------
+#                               Paragraphs
+# ----------------------------------------------------------------------------
+def essay_paragraphs(path, first_line = 0):
+    '''
+    Rebuild the paragraphs of one essay from its wrapped lines.
+
+    Parameters
+    ----------
+    path : string
+        path to the essay file.
+    first_line : int
+        line_index of the essay's first non-blank line.
+
+    Returns
+    -------
+    paragraphs : list
+        one dict per paragraph: Essay, paragraph, text (lines joined by
+        spaces), line_index (the line of each joined line) and line_starts
+        (character offset of each line in text).
+    n_lines : int
+        number of non-blank lines in the essay.
+
+    '''
+    essay = corpus.essay_name(path)
+    with open(path, encoding = 'utf-8', errors = 'replace') as f:
+        raw_lines = [line.rstrip('\r\n') for line in f]
+
+    rows = []
+    paragraph = []
+    line_index = first_line
+    for line in raw_lines + ['']:
+        # Non-blank lines are numbered the same way as corpus.read_essay_lines()
+        if line.strip():
+            paragraph.append((line_index, line.strip()))
+            line_index += 1
+            if not (len(line) < SHORT_LINE and line.rstrip().endswith(('.', '?', '!', ':'))):
+                continue
+
+        if paragraph:
+            texts = [text for _, text in paragraph]
+            starts = np.concatenate([[0], np.cumsum([len(t) + 1 for t in texts])[:-1]])
+            rows.append({'Essay': essay,
+                         'paragraph': len(rows),
+                         'text': " ".join(texts),
+                         'line_index': np.array([i for i, _ in paragraph]),
+                         'line_starts': starts})
+            paragraph = []
+
+    return rows, line_index - first_line
+
+
+def load_paragraphs(data_dir = corpus.DATA_DIR):
+    '''
+    Rebuild the paragraphs of every essay from its wrapped lines.
+
+    Parameters
+    ----------
+    data_dir : string
+        folder holding the essays.
+
+    Returns
+    -------
+    paragraphs : DataFrame
+        one row per paragraph, see essay_paragraphs().
+
+    '''
+    rows = []
+    line_index = 0
+
+    for text_file in corpus.list_essay_files(data_dir):
+        essay_rows, n_lines = essay_paragraphs(os.path.join(data_dir, text_file), line_index)
+        rows.extend(essay_rows)
+        line_index += n_lines
+
+    return pd.DataFrame(rows)
+
+
+# ----------------------------------------------------------------------------
+#                               Sentences
+# ----------------------------------------------------------------------------
+# Abbreviations that end in a period but don't end a sentence
+_ABBREVIATIONS = r'(?<!\bMr)(?<!\bMrs)(?<!\bDr)(?<!\bSt)(?<!\bNo)(?<!\bviz)(?<!\bvol)(?<!\bp)(?<!\bi\.e)(?<!\be\.g)'
+_SENTENCE_END = re.compile(_ABBREVIATIONS + r'[.?!]["\')\]]*\s+(?=["\'(\[]?[A-Z0-9])')
+
+
+def sentence_spans(text, splitter = 'punkt'):
+    '''
+    Character spans of the sentences in a paragraph.
+
+    Parameters
+    ----------
+    text : string
+        paragraph text.
+    splitter : string
+        'punkt' for NLTK's Punkt sentence tokenizer (what sent_tokenize uses),
+        or 'regex' for a quick rule-based split on terminal punctuation.
+
+    Returns
+    -------
+    spans : list
+        (start, end) character offsets.
+
+    '''
+    if splitter == 'punkt':
+        return list(_punkt().span_tokenize(text))
+
+    if splitter != 'regex':
+        raise ValueError(f"Unknown splitter {splitter!r}, pick one of {SPLITTERS}")
+
+    spans = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        spans.append((start, match.end() - len(match.group()) + len(match.group().rstrip())))
+        start = match.end()
+    if text[start:].strip():
+        spans.append((start, len(text.rstrip())))
+
+    return spans
+
+
+@functools.lru_cache(maxsize = None)
+def _punkt():
+    # Load the English Punkt model once. Newer NLTK ships it as punkt_tab,
+    # older versions as a pickle
+    try:
+        from nltk.tokenize.punkt import PunktTokenizer
+    except ImportError:
+        return nltk.data.load('tokenizers/punkt/english.pickle')
+
+    return PunktTokenizer('english')
+
+
+def segment_paragraphs(paragraphs, tagger, splitter = 'punkt'):
+    '''
+    Split one essay's paragraphs into sentences, then tokenize and tag them
+    (the whole essay in one tag_sents() batch).
+
+    Parameters
+    ----------
+    paragraphs : iterable
+        the essay's paragraphs, as from essay_paragraphs().
+    tagger : object
+        a tagger from pos_tagging.get_tagger().
+    splitter : string
+        'punkt' or 'regex' (see sentence_spans()).
+
+    Returns
+    -------
+    rows : list
+        one dict per sentence, see segment_corpus().
+
+    '''
+    word_tokenizer = NLTKWordTokenizer()
+
+    rows = []
+    token_lists = []
+    for paragraph in paragraphs:
+        for start, end in sentence_spans(paragraph['text'], splitter):
+            spans = list(word_tokenizer.span_tokenize(paragraph['text'][start:end]))
+            if not spans:
+                continue
+
+            # Which line each token started on
+            token_starts = start + np.array([s for s, _ in spans])
+            lines = paragraph['line_index'][np.searchsorted(paragraph['line_starts'], token_starts,
+                                                            side = 'right') - 1]
+
+            token_lists.append([paragraph['text'][start + s:start + e] for s, e in spans])
+            rows.append({'Essay': paragraph['Essay'],
+                         'paragraph': paragraph['paragraph'],
+                         'sentence': len(rows),
+                         'line_start': lines[0],
+                         'line_end': lines[-1],
+                         'token_lines': lines})
+
+    for row, tagged in zip(rows, tagger.tag_sents(token_lists)):
+        row['tokens'] = [word for word, _ in tagged]
+        row['tags'] = [tag for _, tag in tagged]
+        row['n_words'] = sum(word.isalpha() for word in row['tokens'])
+
+    return rows
+
+
+SENTENCE_COLUMNS = ['Essay', 'paragraph', 'sentence', 'line_start', 'line_end',
+                    'n_words', 'tokens', 'tags', 'token_lines']
+
+
+def segment_corpus(data_dir = corpus.DATA_DIR, backend = 'perceptron', splitter = 'punkt'):
+    '''
+    Split every essay into sentences, then tokenize and tag them, in one pass.
+
+    Parameters
+    ----------
+    data_dir : string
+        folder holding the essays.
+    backend : string
+        part of speech tagger backend (see pos_tagging.py).
+    splitter : string
+        'punkt' or 'regex' (see sentence_spans()).
+
+    Returns
+    -------
+    sentences : DataFrame
+        one row per sentence: Essay, paragraph, sentence (number within the
+        essay), line_start and line_end, n_words, and the sentence's tokens,
+        tags and token_lines (line_index of every token).
+
+    '''
+    tagger = pos_tagging.get_tagger(backend)
+
+    rows = []
+    line_index = 0
+    for text_file in corpus.list_essay_files(data_dir):
+        paragraphs, n_lines = essay_paragraphs(os.path.join(data_dir, text_file), line_index)
+        rows.extend(segment_paragraphs(paragraphs, tagger, splitter))
+        line_index += n_lines
+
+    return pd.DataFrame(rows, columns = SENTENCE_COLUMNS)
+
+
+def tags_by_line(sentences, n_lines = None, first_line = 0):
+    '''
+    Regroup sentence-level (word, tag) pairs by the line they came from, in the
+    shape pos_tagging.tag_lines() returns.
+
+    Parameters
+    ----------
+    sentences : DataFrame
+        output of segment_corpus() (or some of its rows).
+    n_lines : int, optional
+        number of lines (defaults to the last line seen + 1 - first_line).
+    first_line : int
+        line_index of the first line to return.
+
+    Returns
+    -------
+    tagged : list
+        a list of (word, tag) pairs for every line_index from first_line on.
+
+    '''
+    if n_lines is None:
+        n_lines = int(sentences['line_end'].max()) + 1 - first_line
+
+    tagged = [[] for _ in range(n_lines)]
+    for tokens, tags, lines in zip(sentences['tokens'], sentences['tags'], sentences['token_lines']):
+        for word, tag, line in zip(tokens, tags, lines):
+            tagged[line - first_line].append((word, tag))
+
+    return tagged
+
+
+def tag_essay_lines(path, first_line = 0, n_lines = None, backend = 'perceptron', splitter = 'punkt',
+                    tagger = None):
+    '''
+    Tag one essay a sentence at a time and hand the tags back by line.
+
+    Parameters
+    ----------
+    path : string
+        path to the essay file.
+    first_line : int
+        line_index of the essay's first line.
+    n_lines : int, optional
+        number of lines the caller has for this essay. A ValueError is raised
+        if the file doesn't have that many non-blank lines, rather than give
+        lines each other's tags.
+    backend : string
+        part of speech tagger backend (see pos_tagging.py).
+    splitter : string
+        'punkt' or 'regex' (see sentence_spans()).
+    tagger : object, optional
+        a tagger to use instead of the backend's shared one (anything with
+        tag_sents()).
+
+    Returns
+    -------
+    tagged : list
+        a list of (word, tag) pairs for every line of the essay.
+    essay_sentences : DataFrame
+        the essay's sentences, as segment_corpus() returns them, so the
+        stylometry features can come from the same pass.
+
+    '''
+    paragraphs, found = essay_paragraphs(path, first_line)
+    if n_lines is not None and n_lines != found:
+        raise ValueError(f"{path} has {found} non-blank lines, expected {n_lines}")
+
+    if tagger is None:
+        tagger = pos_tagging.get_tagger(backend)
+
+    rows = segment_paragraphs(paragraphs, tagger, splitter)
+    essay_sentences = pd.DataFrame(rows, columns = SENTENCE_COLUMNS)
+
+    return tags_by_line(essay_sentences, found, first_line), essay_sentences
+
+
+# ----------------------------------------------------------------------------
+#                          Stylometry Features
+# ----------------------------------------------------------------------------
+def sentence_length_features(sentences):
+    '''
+    Sentence length summary and binned distribution for every essay.
+
+    Parameters
+    ----------
+    sentences : DataFrame
+        output of segment_corpus() (only Essay and n_words are used).
+
+    Returns
+    -------
+    features : DataFrame
+        indexed by Essay: number of sentences, mean / std / median / 90th
+        percentile length in words, and the share of sentences in each length
+        bin (len_0_10, len_10_20, ...).
+
+    '''
+    lengths = sentences.groupby('Essay', sort = False)['n_words']
+    features = pd.DataFrame({'n_sentences': lengths.size(),
+                             'mean_length': lengths.mean(),
+                             'std_length': lengths.std(),
+                             'median_length': lengths.median(),
+                             'p90_length': lengths.quantile(0.9)})
+
+    # Histogram of every essay at once: bin each sentence, then count
+    # (essay, bin) pairs with a sparse matrix
+    essay_codes = pd.Categorical(sentences['Essay'], categories = features.index).codes
+    bins = np.digitize(sentences['n_words'], LENGTH_BINS[1:-1])
+    histogram = sp.coo_matrix((np.ones(len(bins)), (essay_codes, bins)),
+                              shape = (len(features), len(LENGTH_BINS) - 1)).toarray()
+    histogram /= histogram.sum(axis = 1, keepdims = True)
+
+    labels = [f"len_{int(lo)}_{'up' if np.isinf(hi) else int(hi)}"
+              for lo, hi in zip(LENGTH_BINS[:-1], LENGTH_BINS[1:])]
+
+    return features.join(pd.DataFrame(histogram, index = features.index, columns = labels))
+
+
+def pos_sequence_features(sentences, n = 2, coarse = True, min_share = 0.001):
+    '''
+    Distribution of POS n-grams (within sentences) for every essay.
+
+    Parameters
+    ----------
+    sentences : DataFrame
+        output of segment_corpus(), or any subset of its rows (only Essay and
+        tags are used).
+    n : int
+        n-gram length (1 for plain tag frequencies).
+    coarse : bool
+        use the first two letters of each Penn tag (NN, VB, JJ, ...) so the
+        feature space stays small.
+    min_share : float
+        drop n-grams that make up less than this share of the corpus.
+
+    Returns
+    -------
+    features : DataFrame
+        indexed by Essay, one column per POS n-gram, each row summing to 1
+        (before dropping rare n-grams).
+
+    '''
+    # explode() labels every tag with its sentence's index, which is used as a
+    # position below, so number the sentences 0..n-1 first
+    sentences = sentences.reset_index(drop = True)
+    tags = sentences['tags'].explode().dropna()
+    if coarse:
+        tags = tags.str[:2]
+
+    tag_codes, tag_names = pd.factorize(tags)
+    sentence_of = tags.index.to_numpy()
+    essays = sentences['Essay'].to_numpy()[sentence_of]
+
+    # An n-gram starts at every token with n - 1 more tokens in its sentence
+    valid = np.ones(len(tag_codes) - n + 1, dtype = bool) if len(tag_codes) >= n \
+        else np.zeros(0, dtype = bool)
+    gram_codes = np.zeros(len(valid), dtype = np.int64)
+    for j in range(n):
+        gram_codes = gram_codes * len(tag_names) + tag_codes[j:j + len(valid)]
+        valid &= sentence_of[j:j + len(valid)] == sentence_of[:len(valid)]
+
+    essay_codes, essay_names = pd.factorize(essays[:len(valid)][valid])
+    gram_ids, gram_values = pd.factorize(gram_codes[valid])
+
+    counts = sp.coo_matrix((np.ones(len(gram_ids)), (essay_codes, gram_ids)),
+                           shape = (len(essay_names), len(gram_values))).toarray()
+    shares = counts / counts.sum(axis = 1, keepdims = True)
+
+    # Decode the n-gram codes back into tag names
+    names = []
+    for code in gram_values:
+        parts = []
+        for _ in range(n):
+            code, tag = divmod(code, len(tag_names))
+            parts.append(tag_names[tag])
+        names.append("pos_" + "_".join(reversed(parts)))
+
+    features = pd.DataFrame(shares, index = pd.Index(essay_names, name = 'Essay'), columns = names)
+    keep = counts.sum(axis = 0) / counts.sum() >= min_share
+
+    return features.loc[:, keep].sort_index(axis = 1)
+
+
+def stylometry_features(sentences, n = 2):
+    '''
+    Sentence length and POS n-gram features side by side, one row per essay.
+    '''
+    return sentence_length_features(sentences).join(pos_sequence_features(sentences, n = n))
+
+
+#%%
+if __name__ == '__main__':
+    fed_sentences = segment_corpus()
+    print(f"{len(fed_sentences)} sentences across {fed_sentences['Essay'].nunique()} essays")
+
+    fed_features = stylometry_features(fed_sentences)
+    print(fed_features.iloc[:, :10].round(3))
+
+    try:
+        fed_authors = corpus.load_authorship()
+        print(fed_features.join(fed_authors.set_index('Essay')['Author'])
+              .groupby('Author')[['mean_length', 'median_length', 'p90_length']].mean())
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,485 @@
+##Sharded Counts - Map-reduce word counting across processes or nodes
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to do the kind of counting EDA.py does (word
+# counts, document frequency, per-author counts, tf) straight from the essay
+# files, without first loading everything into one pandas frame. The essay
+# files are split into shards and:
+#   1. map    | each worker tokenizes its shard and returns a sparse
+#               essay-by-term count matrix over its own local vocabulary,
+#   2. reduce | the partial matrices are put on one shared vocabulary and
+#               stacked into a single essay-by-term matrix.
+# Shards can run in a process pool on one machine, or on separate machines
+# that share the Data/ folder:
+#   python Code/sharded_counts.py --shard 0 --n-shards 4    (on each node)
+#   python Code/sharded_counts.py --reduce                  (once they finish)
+# (add --text to count the raw essays instead of the csv).
+# The merged result is identical to running the same map step over every file
+# in a single process (see check_identical()).
+#
+# There are two map steps:
+#   1. csv  | the Word column of full_fedpapers.csv, filtered by EDA.py's
+#             stop_Words, each shard reading the csv in chunks and keeping its
+#             own essays. These are the tokens EDA.py groups, so the merged
+#             counts match its word_counts and document counts exactly (see
+#             check_eda()).
+#   2. text | corpus.clean_text() over the raw essay files, for when the csv
+#             hasn't been built (it needs the NLTK tagger). This splits on
+#             anything that isn't a letter ("self-evident" becomes two words,
+#             where NLTK keeps it as one and Data Load Script.py then drops it),
+#             lowercases, and drops corpus.get_stop_words(), so its counts are
+#             close to EDA.py's but not the same.
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+import corpus
+
+
+SHARD_DIR = os.path.join(corpus.DATA_DIR, 'shards')
+
+# Same list as stop_Words in EDA.py, applied on top of the stop words Data Load
+# Script.py already took out of the csv
+EDA_STOP_WORDS = {'would', 'may', 'yet', 'must', 'shall', 'not', 'still', 'let',
+                  'also', 'ought', 'a', 'the', 'it', 'i', 'upon', 'but', 'if', 'in',
+                  'this', 'might', 'and', 'us', 'can', 'as', 'to', 'could'}
+
+
+# ----------------------------------------------------------------------------
+#                                  Map
+# ----------------------------------------------------------------------------
+def list_shards(files, n_shards):
+    '''
+    Split the files into n_shards interleaved shards (so early and late essays,
+    which differ in length, are spread evenly).
+    '''
+    return [files[i::n_shards] for i in range(n_shards)]
+
+
+def map_counts(paths, stop):
+    '''
+    Tokenize and count a shard of essay files.
+
+    Parameters
+    ----------
+    paths : list
+        essay files in this shard.
+    stop : set
+        stop words to remove.
+
+    Returns
+    -------
+    partial : dict
+        'essays' (row labels), 'terms' (local vocabulary) and 'counts' (a CSR
+        essay-by-term matrix over that vocabulary).
+
+    '''
+    counters = [Counter(corpus.clean_text(" ".join(corpus.read_essay_lines(path)), stop = stop).split())
+                for path in paths]
+
+    return _partial([corpus.essay_name(path) for path in paths], counters)
+
+
+def map_csv(csv_path, essays, stop, chunksize = 100000):
+    '''
+    Count the Word column of full_fedpapers.csv for a shard of essays.
+
+    Parameters
+    ----------
+    csv_path : string
+        path to full_fedpapers.csv.
+    essays : list
+        essays ('Essay 1' style) in this shard.
+    stop : set
+        words to leave out, as EDA.py does with stop_Words.
+    chunksize : int
+        csv rows read at a time, so a worker never holds the whole table.
+
+    Returns
+    -------
+    partial : dict
+        see map_counts().
+
+    '''
+    counters = {essay: Counter() for essay in essays}
+
+    # Read the csv the way EDA.py does (pandas' default NA handling) so the
+    # few words pandas takes for missing values drop out of both
+    for chunk in pd.read_csv(csv_path, usecols = ['Essay', 'Word'], chunksize = chunksize):
+        chunk = chunk[chunk['Essay'].isin(counters) & ~chunk['Word'].isin(stop)]
+        for (essay, word), count in chunk.groupby(['Essay', 'Word']).size().items():
+            counters[essay][word] += count
+
+    return _partial(list(essays), [counters[essay] for essay in essays])
+
+
+def _partial(essays, counters):
+    '''
+    Essay-by-term CSR counts over a local vocabulary, one Counter per essay.
+    '''
+    vocab = {}
+    rows, cols, data = [], [], []
+
+    for row, counter in enumerate(counters):
+        for word, count in counter.items():
+            rows.append(row)
+            cols.append(vocab.setdefault(word, len(vocab)))
+            data.append(count)
+
+    counts = sp.csr_matrix((np.array(data, dtype = np.int64), (rows, cols)),
+                           shape = (len(essays), len(vocab)))
+
+    return {'essays': essays, 'terms': list(vocab), 'counts': counts}
+
+
+def _map_shard(paths, stop, csv_path = None):
+    # Shards are lists of essay files either way; the csv map only needs their ids
+    if csv_path is None:
+        return map_counts(paths, stop)
+
+    return map_csv(csv_path, [corpus.essay_name(os.path.basename(p)) for p in paths], stop)
+
+
+# ----------------------------------------------------------------------------
+#                                 Reduce
+# ----------------------------------------------------------------------------
+def reduce_counts(partials, essay_order = None):
+    '''
+    Merge partial count matrices onto one shared vocabulary.
+
+    Parameters
+    ----------
+    partials : list
+        outputs of map_counts().
+    essay_order : list, optional
+        order for the rows of the result. Defaults to essay number order.
+
+    Returns
+    -------
+    merged : dict
+        'essays', 'terms' (sorted) and 'counts' (CSR essay-by-term matrix).
+
+    Raises
+    ------
+    ValueError
+        if an essay turns up in more than one partial (or twice in one).
+
+    '''
+    seen = Counter(essay for partial in partials for essay in partial['essays'])
+    repeated = sorted(essay for essay, n in seen.items() if n > 1)
+    if repeated:
+        raise ValueError(f"Essays counted more than once: {', '.join(repeated)}")
+
+    terms = sorted(set().union(*(p['terms'] for p in partials)))
+    term_ids = {term: i for i, term in enumerate(terms)}
+
+    # Move every partial onto the shared columns; only the column indices change
+    blocks = []
+    essays = []
+    for partial in partials:
+        remap = np.array([term_ids[t] for t in partial['terms']], dtype = np.int64)
+        counts = partial['counts'].tocoo()
+        blocks.append(sp.csr_matrix((counts.data, (counts.row, remap[counts.col])),
+                                    shape = (counts.shape[0], len(terms))))
+        essays.extend(partial['essays'])
+
+    counts = sp.vstack(blocks, format = 'csr') if blocks else sp.csr_matrix((0, len(terms)))
+
+    if essay_order is None:
+        essay_order = sorted(essays, key = lambda x: (len(x), x))
+    position = {essay: i for i, essay in enumerate(essays)}
+    counts = counts[[position[e] for e in essay_order]]
+    counts.sort_indices()
+
+    return {'essays': list(essay_order), 'terms': terms, 'counts': counts}
+
+
+# ----------------------------------------------------------------------------
+#                                Executors
+# ----------------------------------------------------------------------------
+def _default_stop(stop, csv_path):
+    if stop is not None:
+        return stop
+
+    return EDA_STOP_WORDS if csv_path is not None else corpus.get_stop_words()
+
+
+def count_single(data_dir = corpus.DATA_DIR, stop = None, csv_path = None):
+    '''
+    The single process path: one map over every essay, then the same reduce.
+    See count_sharded() for the arguments.
+    '''
+    stop = _default_stop(stop, csv_path)
+    files = [os.path.join(data_dir, x) for x in corpus.list_essay_files(data_dir)]
+
+    return reduce_counts([_map_shard(files, stop, csv_path)])
+
+
+def count_sharded(data_dir = corpus.DATA_DIR, n_workers = None, n_shards = None, stop = None,
+                  csv_path = None):
+    '''
+    Run the map step over shards in a process pool and reduce the results.
+
+    Parameters
+    ----------
+    data_dir : string
+        folder holding the essays (these also decide the shards for the csv).
+    n_workers : int, optional
+        worker processes (defaults to the number of CPUs).
+    n_shards : int, optional
+        number of shards (defaults to n_workers).
+    stop : set, optional
+        stop words. Defaults to EDA_STOP_WORDS for the csv and
+        corpus.get_stop_words() for the text.
+    csv_path : string, optional
+        count the Word column of this full_fedpapers.csv instead of the text.
+
+    Returns
+    -------
+    merged : dict
+        see reduce_counts().
+
+    '''
+    stop = _default_stop(stop, csv_path)
+    n_workers = n_workers or os.cpu_count()
+    n_shards = n_shards or n_workers
+
+    files = [os.path.join(data_dir, x) for x in corpus.list_essay_files(data_dir)]
+    shards = [shard for shard in list_shards(files, n_shards) if shard]
+
+    with ProcessPoolExecutor(max_workers = n_workers) as pool:
+        partials = list(pool.map(_map_shard, shards, [stop] * len(shards), [csv_path] * len(shards)))
+
+    return reduce_counts(partials)
+
+
+def run_shard(shard_id, n_shards, data_dir = corpus.DATA_DIR, out_dir = SHARD_DIR, stop = None,
+              csv_path = None):
+    '''
+    Map one shard and write its partial counts to out_dir, for running shards
+    on separate machines that share the data folder.
+    '''
+    if not 0 <= shard_id < n_shards:
+        raise ValueError(f"shard_id must be in 0..{n_shards - 1}, got {shard_id}")
+
+    stop = _default_stop(stop, csv_path)
+    files = [os.path.join(data_dir, x) for x in corpus.list_essay_files(data_dir)]
+    partial = _map_shard(list_shards(files, n_shards)[shard_id], stop, csv_path)
+
+    os.makedirs(out_dir, exist_ok = True)
+    prefix = os.path.join(out_dir, f"part-{shard_id:04d}-of-{n_shards:04d}")
+    sp.save_npz(prefix + '.npz', partial['counts'])
+    with open(prefix + '.json', 'w') as f:
+        json.dump({'essays': partial['essays'], 'terms': partial['terms']}, f)
+
+
+def reduce_dir(out_dir = SHARD_DIR):
+    '''
+    Reduce the partials written by run_shard().
+
+    Raises
+    ------
+    ValueError
+        if the partials don't come from one run: mixed shard counts (left over
+        from an earlier run with a different n_shards), or a shard missing.
+
+    '''
+    found = {}
+    for path in glob.glob(os.path.join(out_dir, 'part-*.json')):
+        name = re.fullmatch(r'part-(\d+)-of-(\d+)\.json', os.path.basename(path))
+        if name is None:
+            raise ValueError(f"Unexpected partial file name: {path}")
+        found[int(name.group(1)), int(name.group(2))] = path[:-5]
+
+    shard_counts = sorted({n for _, n in found})
+    if len(shard_counts) != 1:
+        raise ValueError(f"{out_dir} holds partials for {shard_counts or 'no'} shard counts; "
+                         "clear out the old run first")
+
+    n_shards = shard_counts[0]
+    missing = sorted(set(range(n_shards)) - {shard for shard, _ in found})
+    if missing:
+        raise ValueError(f"Missing shards {missing} of {n_shards}")
+
+    partials = []
+    for shard in range(n_shards):
+        prefix = found[shard, n_shards]
+        with open(prefix + '.json') as f:
+            partial = json.load(f)
+        partial['counts'] = sp.load_npz(prefix + '.npz')
+        partials.append(partial)
+
+    return reduce_counts(partials)
+
+
+# ----------------------------------------------------------------------------
+#                               Aggregates
+# ----------------------------------------------------------------------------
+# The tables EDA.py builds with groupby, straight from the merged matrix. They
+# are EDA.py's own numbers when the counts come from the csv map step.
+def word_counts(merged):
+    '''
+    Total count and document frequency of every word, laid out like the
+    word_counts table behind Viz 1 and Viz 8 of EDA.py.
+    '''
+    counts = merged['counts']
+
+    return pd.DataFrame({'Word': merged['terms'],
+                         'count': np.asarray(counts.sum(axis = 0)).ravel(),
+                         'doc_count': np.diff(counts.tocsc().indptr)}) \
+        .sort_values(['count', 'Word'], ascending = [False, True]) \
+        .reset_index(drop = True)
+
+
+def author_counts(merged, authors):
+    '''
+    Word counts per author, laid out like the Author/Word table behind
+    Viz 4-7 of EDA.py.
+
+    Parameters
+    ----------
+    merged : dict
+        output of reduce_counts().
+    authors : DataFrame
+        'Essay' and 'Author' columns.
+
+    Returns
+    -------
+    counts : DataFrame
+        Author, Word and count columns, non-zero counts only.
+
+    '''
+    author_of = dict(zip(authors['Essay'], authors['Author']))
+    codes, names = pd.factorize(pd.Series([author_of.get(e, 'Unknown') for e in merged['essays']]))
+
+    # Author-by-essay indicator times essay-by-term counts
+    indicator = sp.csr_matrix((np.ones(len(codes)), (codes, np.arange(len(codes)))),
+                              shape = (len(names), len(codes)))
+    by_author = (indicator @ merged['counts']).tocoo()
+
+    return pd.DataFrame({'Author': names[by_author.row],
+                         'Word': np.asarray(merged['terms'])[by_author.col],
+                         'count': by_author.data.astype(np.int64)}) \
+        .sort_values(['Author', 'count'], ascending = [True, False]) \
+        .reset_index(drop = True)
+
+
+def term_frequency(merged):
+    '''
+    tf of every (essay, word) pair: the word's count over the essay's length
+    (both after the map step's stop words are out).
+    '''
+    counts = merged['counts'].tocoo()
+    lengths = np.asarray(merged['counts'].sum(axis = 1)).ravel()
+
+    return pd.DataFrame({'Essay': np.asarray(merged['essays'])[counts.row],
+                         'Word': np.asarray(merged['terms'])[counts.col],
+                         'count': counts.data,
+                         'tf': counts.data / lengths[counts.row]})
+
+
+# ----------------------------------------------------------------------------
+#                                 Checks
+# ----------------------------------------------------------------------------
+def check_identical(a, b):
+    '''
+    True if two merged results have the same essays, vocabulary and counts.
+
+    This compares two runs of the same map step (sharded against single
+    process); check_eda() compares the csv counts with EDA.py itself.
+    '''
+    return a['essays'] == b['essays'] and a['terms'] == b['terms'] \
+        and (a['counts'] != b['counts']).nnz == 0
+
+
+def eda_word_counts(csv_path = corpus.FULL_FEDPAPERS_CSV, stop = EDA_STOP_WORDS):
+    '''
+    word_counts and doc_count exactly as EDA.py computes them (Viz 1 and
+    Viz 8): load the whole csv, drop stop_Words and group by Word.
+    '''
+    fed_papers = pd.read_csv(csv_path)
+    fed_nonstop = fed_papers[~fed_papers['Word'].isin(stop)]
+
+    counts = fed_nonstop.groupby(['Word']).size().reset_index(name = 'count')
+    doc_counts = fed_nonstop[['Word', 'Essay']].drop_duplicates() \
+        .groupby(['Word']) \
+        .size() \
+        .reset_index(name = 'doc_count')
+
+    return pd.merge(counts, doc_counts, on = 'Word', how = 'inner')
+
+
+def check_eda(merged, csv_path = corpus.FULL_FEDPAPERS_CSV, stop = EDA_STOP_WORDS):
+    '''
+    True if a merged result from the csv map step has exactly EDA.py's word
+    counts and document counts: same words, same numbers, no tolerance.
+    '''
+    ours = word_counts(merged).sort_values('Word').reset_index(drop = True)
+    eda = eda_word_counts(csv_path, stop).sort_values('Word').reset_index(drop = True)
+
+    return ours['Word'].tolist() == eda['Word'].tolist() \
+        and (ours['count'].to_numpy() == eda['count'].to_numpy()).all() \
+        and (ours['doc_count'].to_numpy() == eda['doc_count'].to_numpy()).all()
+
+
+def benchmark(data_dir = corpus.DATA_DIR, workers = (1, 2, 4, 8), stop = None, csv_path = None):
+    '''
+    Time the sharded path against the single process path.
+
+    Every row records os.cpu_count(): with fewer CPUs than workers the
+    processes just take turns, so those timings show the pool's overhead,
+    not a speedup. With csv_path, matches_eda says whether the counts are
+    EDA.py's.
+    '''
+    stop = _default_stop(stop, csv_path)
+    cpus = os.cpu_count()
+
+    started = time.perf_counter()
+    single = count_single(data_dir, stop, csv_path)
+    rows = [{'workers': 'single', 'cpus': cpus, 'seconds': time.perf_counter() - started,
+             'identical': True}]
+
+    for n in workers:
+        started = time.perf_counter()
+        sharded = count_sharded(data_dir, n_workers = n, stop = stop, csv_path = csv_path)
+        rows.append({'workers': n,
+                     'cpus': cpus,
+                     'seconds': time.perf_counter() - started,
+                     'identical': check_identical(single, sharded)})
+
+    timings = pd.DataFrame(rows)
+    if csv_path is not None:
+        timings['matches_eda'] = check_eda(single, csv_path, stop)
+
+    return timings
+
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Sharded word counting")
+    parser.add_argument('--shard', type = int, help = 'run this shard and write its partial counts')
+    parser.add_argument('--n-shards', type = int, default = 4)
+    parser.add_argument('--reduce', action = 'store_true', help = 'merge the partial counts')
+    parser.add_argument('--text', action = 'store_true',
+                        help = 'count the raw essay text instead of full_fedpapers.csv')
+    args = parser.parse_args()
+
+    fed_csv = None if args.text else corpus.FULL_FEDPAPERS_CSV
+
+    if args.shard is not None:
+        run_shard(args.shard, args.n_shards, csv_path = fed_csv)
+    elif args.reduce:
+        print(word_counts(reduce_dir()).head(20))
+    else:
+        print(benchmark(csv_path = fed_csv))
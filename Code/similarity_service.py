@@ -0,0 +1,553 @@
+##Similarity Service - Query the essays by text or essay id
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to turn the cosine similarity section of
+# text_analysis.py into something we can keep running and ask questions of.
+# Instead of editing fed_transform[51:52] and rerunning cells, we save the
+# fitted TF-IDF model once and then:
+#   1. call query_similar() from Python with any text or an essay id, or
+#   2. start the small asyncio HTTP server and hit it with GET/POST requests.
+# Requests that arrive together are batched into one sparse matrix product,
+# and the service keeps track of its p50/p99 latency. With mode = 'lsa' the
+# same queries run against the dense LSA embeddings from lsa.py instead.
+#
+# Example (from the project root):
+#   python Code/similarity_service.py --build
+#   python Code/similarity_service.py --serve --port 8050
+#   curl "http://127.0.0.1:8050/similar?essay=Essay%2052&k=5"
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import linear_kernel
+
+import corpus
+import lsa
+
+
+MODEL_PATH = os.path.join(corpus.DATA_DIR, 'tfidf_model.pkl')
+
+MODES = ('tfidf', 'lsa')
+
+
+# ----------------------------------------------------------------------------
+#                           Build / Save the Model
+# ----------------------------------------------------------------------------
+def build_model(documents = None, authors = None):
+    '''
+    Fit the TF-IDF model over the essays, the same way text_analysis.py does.
+
+    Parameters
+    ----------
+    documents : DataFrame, optional
+        'Essay' and cleaned 'lines' columns. Defaults to
+        corpus.essay_documents().
+    authors : DataFrame, optional
+        'Essay' and 'Author' columns. Defaults to corpus.load_authorship(); if
+        the csv hasn't been built yet every author is 'Unknown'.
+
+    Returns
+    -------
+    model : dict
+        the fitted vectorizer, the essay-by-term matrix and the essay/author
+        labels for each row.
+
+    '''
+    if documents is None:
+        documents = corpus.essay_documents()
+
+    if authors is None:
+        try:
+            authors = corpus.load_authorship()
+        except FileNotFoundError:
+            authors = documents[['Essay']].assign(Author = 'Unknown')
+
+    # Keep the authors lined up with the rows of the matrix
+    labels = documents[['Essay']].merge(authors[['Essay', 'Author']],
+                                        on = 'Essay',
+                                        how = 'left')
+    labels['Author'] = labels['Author'].fillna('Unknown')
+
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(documents['lines'])
+
+    return {'vectorizer': vectorizer,
+            'matrix': sp.csr_matrix(matrix),
+            'essays': list(labels['Essay']),
+            'authors': list(labels['Author'])}
+
+
+def save_model(model, path = MODEL_PATH):
+    '''
+    Pickle a model built by build_model().
+
+    Parameters
+    ----------
+    model : dict
+        model to save.
+    path : string
+        where to save it.
+
+    '''
+    with open(path, 'wb') as f:
+        pickle.dump(model, f, protocol = pickle.HIGHEST_PROTOCOL)
+
+
+def load_model(path = MODEL_PATH):
+    '''
+    Load a model saved with save_model().
+
+    Parameters
+    ----------
+    path : string
+        where the model was saved.
+
+    Returns
+    -------
+    model : dict
+        the saved model.
+
+    '''
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+# ----------------------------------------------------------------------------
+#                                 Querying
+# ----------------------------------------------------------------------------
+def _essay_row(model, essay):
+    '''
+    Find the matrix row for an essay id given as 'Essay 52' or 52.
+    '''
+    if isinstance(essay, (int, np.integer)) or str(essay).isdigit():
+        essay = f"Essay {int(essay)}"
+
+    try:
+        return model['essays'].index(essay)
+    except ValueError:
+        raise KeyError(f"Unknown essay id: {essay!r}")
+
+
+def query_batch(model, queries, k = 5, stop = None, mode = 'tfidf'):
+    '''
+    Answer several queries with a single matrix product.
+
+    Parameters
+    ----------
+    model : dict
+        model from build_model() or load_model().
+    queries : list
+        each query is a dict with either a 'text' or an 'essay' key.
+    k : int
+        number of essays to return per query.
+    stop : set, optional
+        stop words used to clean text queries. Defaults to
+        corpus.get_stop_words().
+    mode : string
+        'tfidf' to compare over the sparse TF-IDF vocabulary, or 'lsa' to
+        compare the dense embeddings (see lsa.build_lsa()).
+
+    Returns
+    -------
+    results : list
+        one list per query of {'essay', 'author', 'score'} dicts, most similar
+        first. Essay queries leave out the essay itself.
+
+    '''
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode!r}, pick one of {MODES}")
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+
+    matrix = model['matrix']
+
+    # Text queries go through the saved vectorizer in one go; essay queries are
+    # already rows of the matrix
+    texts = [q['text'] for q in queries if 'text' in q]
+    if texts:
+        if stop is None:
+            stop = corpus.get_stop_words()
+        text_rows = model['vectorizer'].transform([corpus.clean_text(x, stop = stop)
+                                                   for x in texts])
+
+    rows = []
+    self_rows = []
+    text_position = 0
+    for q in queries:
+        if 'text' in q:
+            rows.append(text_rows[text_position])
+            text_position += 1
+            self_rows.append(-1)
+        else:
+            row = _essay_row(model, q['essay'])
+            rows.append(matrix[row])
+            self_rows.append(row)
+
+    # The rows are l2 normalised, so the linear kernel is the cosine similarity
+    if mode == 'lsa':
+        scores = lsa.project(model, sp.vstack(rows, format = 'csr')) @ model['embeddings'].T
+    else:
+        scores = linear_kernel(sp.vstack(rows, format = 'csr'), matrix)
+
+    results = []
+    for query_scores, self_row in zip(scores, self_rows):
+        if self_row >= 0:
+            query_scores[self_row] = -np.inf
+
+        n = min(k, len(query_scores) - (self_row >= 0))
+        top = np.argpartition(-query_scores, n - 1)[:n] if n > 0 else np.array([], dtype = int)
+        top = top[np.argsort(-query_scores[top], kind = 'stable')]
+
+        results.append([{'essay': model['essays'][i],
+                         'author': model['authors'][i],
+                         'score': float(query_scores[i])} for i in top])
+
+    return results
+
+
+def query_similar(model, text = None, essay = None, k = 5, stop = None, mode = 'tfidf'):
+    '''
+    Find the k essays most similar to some text or to another essay.
+
+    Parameters
+    ----------
+    model : dict
+        model from build_model() or load_model().
+    text : string, optional
+        arbitrary text to compare against the essays.
+    essay : string or int, optional
+        essay id ('Essay 52' or 52) to compare against the other essays.
+    k : int
+        number of essays to return.
+    stop : set, optional
+        stop words used to clean the text.
+    mode : string
+        'tfidf' or 'lsa'.
+
+    Returns
+    -------
+    results : list
+        {'essay', 'author', 'score'} dicts, most similar first.
+
+    '''
+    if (text is None) == (essay is None):
+        raise ValueError("Pass exactly one of text or essay")
+
+    query = {'text': text} if text is not None else {'essay': essay}
+
+    return query_batch(model, [query], k = k, stop = stop, mode = mode)[0]
+
+
+# ----------------------------------------------------------------------------
+#                               Latency Tracking
+# ----------------------------------------------------------------------------
+class LatencyTracker:
+    '''
+    Keep the most recent request latencies so we can report percentiles.
+    '''
+
+    def __init__(self, window = 10000):
+        self.latencies = deque(maxlen = window)
+        self.batch_sizes = deque(maxlen = window)
+
+    def record(self, seconds):
+        self.latencies.append(seconds)
+
+    def record_batch(self, size):
+        self.batch_sizes.append(size)
+
+    def summary(self):
+        '''
+        Returns
+        -------
+        stats : dict
+            request count, p50/p99 latency in milliseconds and mean batch size.
+
+        '''
+        if not self.latencies:
+            return {'requests': 0, 'p50_ms': None, 'p99_ms': None,
+                    'batches': 0, 'mean_batch_size': None}
+
+        p50, p99 = np.percentile(np.fromiter(self.latencies, dtype = float), [50, 99]) * 1000
+
+        return {'requests': len(self.latencies),
+                'p50_ms': round(float(p50), 3),
+                'p99_ms': round(float(p99), 3),
+                'batches': len(self.batch_sizes),
+                'mean_batch_size': round(float(np.mean(self.batch_sizes)), 2)}
+
+
+# ----------------------------------------------------------------------------
+#                              Batching Service
+# ----------------------------------------------------------------------------
+class SimilarityService:
+    '''
+    Long-lived query service. Queries that arrive within batch_window seconds of
+    each other (up to max_batch of them) are answered with one matrix product.
+
+    Parameters
+    ----------
+    model : dict
+        model from build_model() or load_model().
+    batch_window : float
+        how long to wait for more requests before running a batch.
+    max_batch : int
+        run the batch straight away once it has this many requests.
+    stop : set, optional
+        stop words used to clean text queries.
+    mode : string
+        'tfidf' or 'lsa'.
+
+    '''
+
+    def __init__(self, model, batch_window = 0.002, max_batch = 64, stop = None, mode = 'tfidf'):
+        self.model = model
+        self.mode = mode
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.stop = corpus.get_stop_words() if stop is None else stop
+        self.latency = LatencyTracker()
+        self._pending = []
+        self._flush_handle = None
+
+    async def query(self, text = None, essay = None, k = 5):
+        '''
+        Queue a query and wait for its batch to run. Same arguments as
+        query_similar().
+        '''
+        if (text is None) == (essay is None):
+            raise ValueError("Pass exactly one of text or essay")
+        # Checked here as well as in query_batch(): a negative k would otherwise
+        # slip through the batch (run at the largest k) and trim from the end
+        k = int(k)
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        query = {'text': text} if text is not None else {'essay': essay}
+        self._pending.append((query, k, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        self.latency.record_batch(len(batch))
+
+        # Run the batch at the largest k anyone asked for and trim afterwards.
+        # Bad essay ids fail on their own rather than taking the batch down.
+        k = max(item[1] for item in batch)
+        valid = []
+        for item in batch:
+            if 'essay' in item[0]:
+                try:
+                    _essay_row(self.model, item[0]['essay'])
+                except KeyError as e:
+                    # The client may have gone away and cancelled its future
+                    if not item[2].done():
+                        item[2].set_exception(e)
+                    continue
+            valid.append(item)
+
+        if valid:
+            try:
+                results = query_batch(self.model, [item[0] for item in valid],
+                                      k = k, stop = self.stop, mode = self.mode)
+            except Exception as e:
+                for item in valid:
+                    if not item[2].done():
+                        item[2].set_exception(e)
+                return
+
+            done = time.perf_counter()
+            for (query, query_k, future, started), result in zip(valid, results):
+                self.latency.record(done - started)
+                if not future.done():
+                    future.set_result(result[:query_k])
+
+    def stats(self):
+        return self.latency.summary()
+
+
+# ----------------------------------------------------------------------------
+#                                HTTP Server
+# ----------------------------------------------------------------------------
+# A deliberately tiny HTTP/1.0 server on top of asyncio streams so we don't need
+# a web framework. Endpoints:
+#   GET  /similar?text=...&k=5     or    GET /similar?essay=Essay%2052&k=5
+#   POST /similar  with a JSON body {"text": ..., "k": 5} or {"essay": ...}
+#   GET  /stats                    p50/p99 latency and batch sizes
+def _http_response(writer, status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found'}.get(status, 'Error')
+    writer.write(f"HTTP/1.0 {status} {reason}\r\n"
+                 "Content-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+
+
+async def _handle_connection(service, reader, writer):
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if len(request_line) < 2:
+            _http_response(writer, 400, {'error': 'malformed request'})
+            return
+
+        method, target = request_line[0], urlsplit(request_line[1])
+
+        if target.path == '/stats':
+            _http_response(writer, 200, service.stats())
+            return
+
+        if target.path != '/similar':
+            _http_response(writer, 404, {'error': f"unknown path {target.path}"})
+            return
+
+        if method == 'POST':
+            try:
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+            except asyncio.IncompleteReadError as e:
+                _http_response(writer, 400, {'error': f"body ended after {len(e.partial)} of "
+                                                      f"{e.expected} bytes"})
+                return
+            params = json.loads(body or b'{}')
+            if not isinstance(params, dict):
+                _http_response(writer, 400, {'error': 'the body must be a JSON object'})
+                return
+        else:
+            params = {key: value[0] for key, value in parse_qs(target.query).items()}
+
+        result = await service.query(text = params.get('text'),
+                                     essay = params.get('essay'),
+                                     k = int(params.get('k', 5)))
+        _http_response(writer, 200, {'results': result})
+
+    except (ValueError, KeyError) as e:
+        _http_response(writer, 400, {'error': str(e)})
+    finally:
+        await writer.drain()
+        writer.close()
+
+
+async def serve(model, host = '127.0.0.1', port = 8050, **service_kwargs):
+    '''
+    Run the HTTP server until cancelled.
+
+    Parameters
+    ----------
+    model : dict
+        model from build_model() or load_model().
+    host, port :
+        address to listen on.
+    **service_kwargs :
+        passed on to SimilarityService (batch_window, max_batch, stop, mode).
+
+    '''
+    service = SimilarityService(model, **service_kwargs)
+    server = await asyncio.start_server(
+        lambda r, w: _handle_connection(service, r, w), host, port)
+
+    print(f"Serving essay similarity on http://{host}:{port}/similar")
+    async with server:
+        await server.serve_forever()
+
+
+# ----------------------------------------------------------------------------
+#                                  Benchmark
+# ----------------------------------------------------------------------------
+async def _benchmark(service, queries, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(q):
+        async with semaphore:
+            return await service.query(**q)
+
+    return await asyncio.gather(*(one(q) for q in queries))
+
+
+def benchmark(model, n_queries = 2000, concurrency = 32, k = 5, mode = 'tfidf'):
+    '''
+    Fire a burst of essay and text queries at the batching service and report
+    its latency percentiles.
+
+    Returns
+    -------
+    stats : dict
+        the service's latency summary plus overall throughput.
+
+    '''
+    service = SimilarityService(model, mode = mode)
+    essays = model['essays']
+    queries = [{'essay': essays[i % len(essays)], 'k': k} if i % 2 else
+               {'text': 'the powers of the executive and the union of the states', 'k': k}
+               for i in range(n_queries)]
+
+    started = time.perf_counter()
+    asyncio.run(_benchmark(service, queries, concurrency))
+    elapsed = time.perf_counter() - started
+
+    stats = service.stats()
+    stats['queries_per_second'] = round(n_queries / elapsed, 1)
+
+    return stats
+
+
+#%%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Essay similarity service")
+    parser.add_argument('--build', action = 'store_true', help = 'fit and save the TF-IDF model')
+    parser.add_argument('--serve', action = 'store_true', help = 'start the HTTP server')
+    parser.add_argument('--benchmark', action = 'store_true', help = 'report p50/p99 latency')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8050)
+    parser.add_argument('--mode', choices = MODES, default = 'tfidf')
+    args = parser.parse_args()
+
+    if args.build or not os.path.exists(MODEL_PATH):
+        save_model(build_model())
+        print(f"Saved TF-IDF model to {MODEL_PATH}")
+
+    fed_model = load_model()
+    if args.mode == 'lsa' and 'svd' not in fed_model:
+        lsa.build_lsa(fed_model)
+        save_model(fed_model)
+
+    if args.benchmark:
+        print(benchmark(fed_model, mode = args.mode))
+
+    if args.serve:
+        asyncio.run(serve(fed_model, args.host, args.port, mode = args.mode))
+
+    if not (args.serve or args.benchmark):
+        # Same example as text_analysis.py: the essays most like Essay 52
+        for row in query_similar(fed_model, essay = 'Essay 52', mode = args.mode):
+            print(row)
@@ -234,3 +234,7 @@ fed_cosine_similarities[related_essays]
 #we attribute Essay 52 to that person. 
 #Another methodology is to do a k-means clustering to group the Essays together. 
 
+
+# To ask which essays are most like any piece of text (or another essay)
+# without editing the slices above, see similarity_service.py, which saves the
+# fitted TF-IDF model and serves top-k queries over it.
@@ -0,0 +1,361 @@
+##Text Reuse - MinHash/LSH detection of shared passages
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to find passages the essays share with each
+# other (Hamilton and Madison reused their own phrasing) or with outside texts
+# we compare them against. Comparing every line with every other line is
+# quadratic, so instead we:
+#   1. cut each essay's token stream into overlapping passages and hash every
+#      k-word shingle,
+#   2. build a MinHash signature for every passage (vectorized in NumPy),
+#   3. use LSH banding to pull out candidate passage pairs in near linear time,
+#   4. check each candidate with an exact token alignment, and
+#   5. report the shared spans as (Essay, line_index) ranges.
+#
+# Outside texts can be added by building their token table the same way
+# (concordance.tokens_from_lines on their lines) and concatenating it.
+import difflib
+
+import numpy as np
+import pandas as pd
+
+import concordance
+
+
+# Large prime for the universal hash family; products are done in uint64 and
+# are allowed to wrap, which is fine for hashing
+_MERSENNE = np.uint64((1 << 61) - 1)
+
+
+# ----------------------------------------------------------------------------
+#                           Shingles and Passages
+# ----------------------------------------------------------------------------
+def shingle_hashes(word_ids, k = 5):
+    '''
+    Hash every run of k consecutive words.
+
+    Parameters
+    ----------
+    word_ids : array
+        integer id of every token, in order.
+    k : int
+        shingle length in words.
+
+    Returns
+    -------
+    hashes : array
+        uint64 hash of the shingle starting at each position (the last k - 1
+        positions have no full shingle and are left out).
+
+    '''
+    word_ids = np.asarray(word_ids, dtype = np.uint64)
+    n = len(word_ids) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype = np.uint64)
+
+    # Polynomial rolling hash, one shifted slice at a time
+    hashes = np.zeros(n, dtype = np.uint64)
+    base = np.uint64(1000003)
+    with np.errstate(over = 'ignore'):
+        for j in range(k):
+            hashes = hashes * base + word_ids[j:j + n] + np.uint64(1)
+
+    return hashes
+
+
+def make_passages(essay_codes, passage_length = 50, step = 25):
+    '''
+    Cut each essay into overlapping windows of tokens.
+
+    Parameters
+    ----------
+    essay_codes : array
+        essay of every token, in order (essays are contiguous).
+    passage_length : int
+        tokens per passage.
+    step : int
+        tokens between passage starts.
+
+    Returns
+    -------
+    passages : DataFrame
+        essay code, start and end (exclusive) token position of every passage.
+
+    '''
+    boundaries = np.flatnonzero(np.diff(essay_codes)) + 1
+    essay_starts = np.concatenate([[0], boundaries])
+    essay_ends = np.concatenate([boundaries, [len(essay_codes)]])
+
+    rows = []
+    for essay_start, essay_end in zip(essay_starts, essay_ends):
+        last_start = max(essay_end - passage_length, essay_start)
+        starts = np.arange(essay_start, last_start + 1, step)
+        # The step need not land on the last window, so add it to cover the tail
+        if starts[-1] != last_start:
+            starts = np.append(starts, last_start)
+        rows.append(np.column_stack([np.full(len(starts), essay_codes[essay_start]),
+                                     starts,
+                                     np.minimum(starts + passage_length, essay_end)]))
+
+    return pd.DataFrame(np.vstack(rows), columns = ['essay', 'start', 'end'])
+
+
+# ----------------------------------------------------------------------------
+#                                  MinHash
+# ----------------------------------------------------------------------------
+def minhash_signatures(hashes, passages, k = 5, n_perm = 128, chunk = 16, seed = 0):
+    '''
+    MinHash signature of every passage.
+
+    Parameters
+    ----------
+    hashes : array
+        shingle hashes from shingle_hashes() over the whole token stream.
+    passages : DataFrame
+        output of make_passages().
+    k : int
+        shingle length used for hashes.
+    n_perm : int
+        number of hash functions (signature length).
+    chunk : int
+        hash functions to evaluate at once, to bound memory.
+    seed : int
+        seed for the hash functions.
+
+    Returns
+    -------
+    signatures : array
+        n_passages x n_perm uint64.
+
+    '''
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 61, size = n_perm, dtype = np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 61, size = n_perm, dtype = np.uint64)
+
+    # A passage's shingles are the ones that start in it and fit inside it.
+    # Lay them out back to back so np.minimum.reduceat can take each minimum
+    starts = passages['start'].to_numpy()
+    stops = np.maximum(passages['end'].to_numpy() - k + 1, starts + 1)
+    stops = np.minimum(stops, len(hashes))
+    lengths = np.maximum(stops - starts, 0)
+    index = np.concatenate([np.arange(s, s + n) for s, n in zip(starts, lengths)])
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    shingles = hashes[index]
+
+    signatures = np.full((len(passages), n_perm), np.iinfo(np.uint64).max, dtype = np.uint64)
+    has_shingles = lengths > 0
+    with np.errstate(over = 'ignore'):
+        for first in range(0, n_perm, chunk):
+            permuted = (shingles[:, None] * a[None, first:first + chunk] + b[None, first:first + chunk]) \
+                % _MERSENNE
+            minima = np.minimum.reduceat(permuted, offsets[has_shingles], axis = 0)
+            signatures[has_shingles, first:first + chunk] = minima
+
+    return signatures
+
+
+def lsh_candidates(signatures, passages, bands = 32, cross_essay_only = True):
+    '''
+    Candidate passage pairs: passages whose signatures agree on every row of
+    at least one band.
+
+    Parameters
+    ----------
+    signatures : array
+        output of minhash_signatures().
+    passages : DataFrame
+        output of make_passages().
+    bands : int
+        number of bands; n_perm / bands rows each. More bands catch pairs with
+        lower similarity (the threshold is about (1 / bands) ** (1 / rows)).
+    cross_essay_only : bool
+        skip pairs from the same essay. Even when False, two passages of the
+        same essay that overlap are never paired (they'd just match themselves).
+
+    Returns
+    -------
+    pairs : array
+        n_pairs x 2 passage numbers, first < second.
+
+    '''
+    n_passages, n_perm = signatures.shape
+    rows = n_perm // bands
+    essays = passages['essay'].to_numpy()
+    starts = passages['start'].to_numpy()
+    ends = passages['end'].to_numpy()
+
+    pairs = []
+    with np.errstate(over = 'ignore'):
+        for band in range(bands):
+            # One bucket key per passage for this band
+            band_rows = signatures[:, band * rows:(band + 1) * rows]
+            keys = np.zeros(n_passages, dtype = np.uint64)
+            for j in range(rows):
+                keys = keys * np.uint64(0x100000001b3) ^ band_rows[:, j]
+
+            order = np.argsort(keys, kind = 'stable')
+            sorted_keys = keys[order]
+            bucket_starts = np.flatnonzero(np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]]))
+            bucket_ends = np.concatenate([bucket_starts[1:], [n_passages]])
+
+            for start, end in zip(bucket_starts, bucket_ends):
+                if end - start < 2:
+                    continue
+                members = order[start:end]
+                first, second = np.triu_indices(len(members), k = 1)
+                pairs.append(np.column_stack([members[first], members[second]]))
+
+    if not pairs:
+        return np.zeros((0, 2), dtype = np.int64)
+
+    pairs = np.sort(np.vstack(pairs), axis = 1)
+    pairs = np.unique(pairs, axis = 0)
+
+    same_essay = essays[pairs[:, 0]] == essays[pairs[:, 1]]
+    if cross_essay_only:
+        pairs = pairs[~same_essay]
+    else:
+        overlap = (starts[pairs[:, 1]] < ends[pairs[:, 0]]) & (starts[pairs[:, 0]] < ends[pairs[:, 1]])
+        pairs = pairs[~(same_essay & overlap)]
+
+    return pairs
+
+
+# ----------------------------------------------------------------------------
+#                             Exact Alignment
+# ----------------------------------------------------------------------------
+def align_candidates(word_ids, passages, pairs, min_match = 8):
+    '''
+    Check candidate pairs by exact alignment of their tokens.
+
+    Parameters
+    ----------
+    word_ids : array
+        integer id of every token.
+    passages : DataFrame
+        output of make_passages().
+    pairs : array
+        output of lsh_candidates().
+    min_match : int
+        shortest run of identical tokens to report.
+
+    Returns
+    -------
+    matches : DataFrame
+        start_a, start_b and length (token positions) of every shared run, with
+        runs found in overlapping passages merged. A run aligned with itself
+        (start_a == start_b) is not reuse and is left out.
+
+    '''
+    starts = passages['start'].to_numpy()
+    ends = passages['end'].to_numpy()
+
+    runs = []
+    for a, b in pairs:
+        seq_a = word_ids[starts[a]:ends[a]].tolist()
+        seq_b = word_ids[starts[b]:ends[b]].tolist()
+        matcher = difflib.SequenceMatcher(None, seq_a, seq_b, autojunk = False)
+        for block in matcher.get_matching_blocks():
+            if block.size >= min_match and starts[a] + block.a != starts[b] + block.b:
+                runs.append((starts[a] + block.a, starts[b] + block.b, block.size))
+
+    if not runs:
+        return pd.DataFrame(columns = ['start_a', 'start_b', 'length'])
+
+    # The same run shows up in every overlapping passage pair that contains it,
+    # and long runs get split across passages. Merge runs on the same diagonal
+    # that touch or overlap
+    runs = pd.DataFrame(runs, columns = ['start_a', 'start_b', 'length'])
+    runs['diagonal'] = runs['start_b'] - runs['start_a']
+    runs = runs.sort_values(['diagonal', 'start_a']).reset_index(drop = True)
+
+    merged = []
+    for diagonal, group in runs.groupby('diagonal', sort = False):
+        current_start, current_end = None, None
+        for start, length in zip(group['start_a'], group['length']):
+            if current_start is not None and start <= current_end:
+                current_end = max(current_end, start + length)
+                continue
+            if current_start is not None:
+                merged.append((current_start, current_start + diagonal, current_end - current_start))
+            current_start, current_end = start, start + length
+        merged.append((current_start, current_start + diagonal, current_end - current_start))
+
+    return pd.DataFrame(merged, columns = ['start_a', 'start_b', 'length'])
+
+
+# ----------------------------------------------------------------------------
+#                                Detection
+# ----------------------------------------------------------------------------
+def detect_reuse(tokens = None, k = 5, passage_length = 50, step = 25,
+                 n_perm = 128, bands = 32, min_match = 8, cross_essay_only = True):
+    '''
+    Find passages shared between essays.
+
+    Parameters
+    ----------
+    tokens : DataFrame, optional
+        Essay, line_index and Word columns in reading order (see
+        concordance.tokens_from_lines). Defaults to the raw essays.
+    k : int
+        shingle length in words.
+    passage_length, step : int
+        passage window and stride in tokens.
+    n_perm, bands : int
+        MinHash signature length and LSH bands.
+    min_match : int
+        shortest shared run of words to report.
+    cross_essay_only : bool
+        only report reuse between different essays.
+
+    Returns
+    -------
+    reuse : DataFrame
+        one row per shared span: Essay, first and last line_index on each side,
+        its length in words and the shared text.
+
+    '''
+    if tokens is None:
+        tokens = concordance.tokens_from_lines()
+
+    essay_codes, essays = pd.factorize(tokens['Essay'])
+    word_ids, _ = pd.factorize(tokens['Word'].str.lower())
+    line_index = tokens['line_index'].to_numpy()
+    words = tokens['Word'].to_numpy()
+
+    hashes = shingle_hashes(word_ids, k)
+    passages = make_passages(essay_codes, passage_length, step)
+    signatures = minhash_signatures(hashes, passages, k, n_perm)
+    pairs = lsh_candidates(signatures, passages, bands, cross_essay_only)
+    matches = align_candidates(word_ids, passages, pairs, min_match)
+
+    # Map token positions back to essays and lines
+    a_start = matches['start_a'].to_numpy(dtype = np.int64)
+    b_start = matches['start_b'].to_numpy(dtype = np.int64)
+    a_end = a_start + matches['length'].to_numpy(dtype = np.int64) - 1
+    b_end = b_start + matches['length'].to_numpy(dtype = np.int64) - 1
+
+    return pd.DataFrame({'Essay_a': essays[essay_codes[a_start]],
+                         'line_start_a': line_index[a_start],
+                         'line_end_a': line_index[a_end],
+                         'Essay_b': essays[essay_codes[b_start]],
+                         'line_start_b': line_index[b_start],
+                         'line_end_b': line_index[b_end],
+                         'words': matches['length'].to_numpy(),
+                         'text': [" ".join(words[s:e + 1]) for s, e in zip(a_start, a_end)]}) \
+        .sort_values('words', ascending = False) \
+        .reset_index(drop = True)
+
+
+#%%
+if __name__ == '__main__':
+    import time
+
+    started = time.perf_counter()
+    fed_reuse = detect_reuse()
+    print(f"Found {len(fed_reuse)} shared spans in {time.perf_counter() - started:.1f} seconds")
+
+    pd.set_option('display.max_colwidth', 80)
+    print(fed_reuse.head(20))
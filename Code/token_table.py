@@ -0,0 +1,167 @@
+##Token Table - Compact in-memory token storage
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to hold the output of the tagging loop in
+# Data Load Script.py without a Python object per token per column. Instead of
+# seven lists of boxed values (and the copies the script used to make of them),
+# TokenTable keeps:
+#   1. parallel typed arrays (array module) for the line index, essay id, token
+#      offset within the line, word id, lemma id and part of speech code, and
+#   2. interned string pools for essays, words, lemmas, tags and line text, so
+#      every distinct string is stored once.
+# A token costs 21 bytes this way. We only turn it into a pandas dataframe when
+# asked, and then with categorical columns built straight from the codes.
+import sys
+from array import array
+
+import numpy as np
+import pandas as pd
+
+
+class StringPool:
+    '''
+    Interned strings: each distinct string gets a small integer id.
+    '''
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, code):
+        return self.strings[code]
+
+    def add(self, string):
+        '''
+        Id of a string, adding it to the pool if it's new.
+        '''
+        code = self.ids.get(string)
+        if code is None:
+            code = self.ids[string] = len(self.strings)
+            self.strings.append(sys.intern(string))
+
+        return code
+
+
+class TokenTable:
+    '''
+    Column store of tokens: one entry per token in each typed array, strings
+    kept in pools.
+
+    Columns (as returned by to_pandas()):
+        line_index, Essay, Lines, Word, lemmatized_word, part_of_speech, offset
+
+    '''
+
+    def __init__(self):
+        self.line_index = array('i')
+        self.essay_ids = array('i')
+        self.offsets = array('i')
+        self.word_ids = array('i')
+        self.lemma_ids = array('i')
+        self.pos_ids = array('B')
+
+        self.essays = StringPool()
+        self.words = StringPool()
+        self.lemmas = StringPool()
+        self.tags = StringPool()
+
+        # The text of each line, once per line rather than once per token
+        self.lines = {}
+
+    def __len__(self):
+        return len(self.line_index)
+
+    def add_line(self, line_index, line):
+        '''
+        Store the text of a line once.
+        '''
+        self.lines[line_index] = line
+
+    def append(self, line_index, essay, word, lemma, pos, offset):
+        '''
+        Add one token.
+
+        Parameters
+        ----------
+        line_index : int
+            line the token came from (store its text with add_line()).
+        essay : string
+            essay the line belongs to.
+        word : string
+            word as it appears in the text.
+        lemma : string
+            lemmatized word.
+        pos : string
+            part of speech tag.
+        offset : int
+            position of the token within its line.
+
+        '''
+        self.line_index.append(line_index)
+        self.essay_ids.append(self.essays.add(essay))
+        self.offsets.append(offset)
+        self.word_ids.append(self.words.add(word))
+        self.lemma_ids.append(self.lemmas.add(lemma))
+        self.pos_ids.append(self.tags.add(pos))
+
+    @property
+    def nbytes(self):
+        '''
+        Bytes used by the per-token arrays (the pools are on top of this).
+        '''
+        return sum(column.itemsize * len(column) for column in
+                   [self.line_index, self.essay_ids, self.offsets,
+                    self.word_ids, self.lemma_ids, self.pos_ids])
+
+    # ------------------------------------------------------------------------
+    #                               To pandas
+    # ------------------------------------------------------------------------
+    def _categorical(self, codes, pool):
+        return pd.Categorical.from_codes(np.frombuffer(codes, dtype = codes.typecode).astype(np.int32),
+                                         categories = pd.Index(pool.strings, dtype = object),
+                                         validate = False)
+
+    def to_pandas(self, offsets = False):
+        '''
+        Build the token dataframe, with the same columns the tokenized_df in
+        Data Load Script.py has. String columns are categoricals built from the
+        codes, so this doesn't create a string object per token.
+
+        Parameters
+        ----------
+        offsets : bool
+            also include each token's offset within its line.
+
+        Returns
+        -------
+        tokens : DataFrame
+            one row per token.
+
+        '''
+        line_index = np.frombuffer(self.line_index, dtype = np.int32)
+
+        # Lines are keyed by line_index, so map them through a line pool
+        line_pool = StringPool()
+        line_codes = {i: line_pool.add(line) for i, line in self.lines.items()}
+        unique_lines, line_positions = np.unique(line_index, return_inverse = True)
+        line_ids = np.array([line_codes[i] for i in unique_lines], dtype = np.int32)
+
+        tokens = pd.DataFrame({
+            'line_index': line_index,
+            'Essay': self._categorical(self.essay_ids, self.essays),
+            'Lines': pd.Categorical.from_codes(line_ids[line_positions],
+                                               categories = pd.Index(line_pool.strings, dtype = object),
+                                               validate = False),
+            'Word': self._categorical(self.word_ids, self.words),
+            'lemmatized_word': self._categorical(self.lemma_ids, self.lemmas),
+            'part_of_speech': self._categorical(self.pos_ids, self.tags)})
+
+        if offsets:
+            tokens['offset'] = np.frombuffer(self.offsets, dtype = np.int32)
+
+        return tokens
@@ -0,0 +1,251 @@
+##Topic Modeling - NMF and online LDA over the essays
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to find the themes the essays share (the
+# executive essays, the taxation essays, ...). We fit two topic models:
+#   1. NMF on the TF-IDF matrix, and
+#   2. online (minibatch) LDA on the raw count matrix, using every core.
+# Both are saved to Data/ so we can warm start from them: when new documents
+# come in, update_topics() nudges the existing topics with the new rows
+# (partial_fit for LDA, a few iterations from the previous factors for NMF)
+# instead of refitting from scratch. The per-essay topic mixtures are joined to
+# Author and Date so we can see who wrote about what, and when.
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.decomposition import NMF, LatentDirichletAllocation
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+
+import corpus
+
+
+TOPIC_MODEL_PATH = os.path.join(corpus.DATA_DIR, 'topic_model.pkl')
+
+METHODS = ('nmf', 'lda')
+
+
+# ----------------------------------------------------------------------------
+#                                 Fitting
+# ----------------------------------------------------------------------------
+def fit_topics(documents = None, n_topics = 10, max_df = 0.9, min_df = 2,
+               batch_size = 16, n_jobs = -1, random_state = 0):
+    '''
+    Fit NMF and online LDA topic models over the essays.
+
+    Parameters
+    ----------
+    documents : DataFrame, optional
+        'Essay' and cleaned 'lines' columns. Defaults to
+        corpus.essay_documents().
+    n_topics : int
+        number of topics for both models.
+    max_df, min_df :
+        passed to CountVectorizer; words in (nearly) every essay or in just one
+        don't help tell topics apart.
+    batch_size : int
+        documents per LDA minibatch.
+    n_jobs : int
+        cores for LDA's E-step (-1 for all of them).
+    random_state : int
+        seed, so the topics come out the same each run.
+
+    Returns
+    -------
+    model : dict
+        the vectorizers, both models, the count and TF-IDF matrices and the
+        essay of every row.
+
+    '''
+    if documents is None:
+        documents = corpus.essay_documents()
+
+    count_vectorizer = CountVectorizer(max_df = max_df, min_df = min_df)
+    counts = count_vectorizer.fit_transform(documents['lines'])
+
+    # NMF works on TF-IDF weights over the same vocabulary
+    tfidf_transformer = TfidfTransformer()
+    tfidf = tfidf_transformer.fit_transform(counts)
+
+    nmf = NMF(n_components = n_topics, init = 'nndsvda', max_iter = 500,
+              random_state = random_state)
+    nmf_weights = nmf.fit_transform(tfidf)
+
+    # total_samples is the corpus size online LDA scales each minibatch up to;
+    # left at sklearn's default of 1e6 a single new essay would swamp the topics
+    lda = LatentDirichletAllocation(n_components = n_topics,
+                                    learning_method = 'online',
+                                    batch_size = batch_size,
+                                    total_samples = counts.shape[0],
+                                    n_jobs = n_jobs,
+                                    random_state = random_state)
+    lda.fit(counts)
+
+    return {'count_vectorizer': count_vectorizer,
+            'tfidf_transformer': tfidf_transformer,
+            'nmf': nmf,
+            'lda': lda,
+            'counts': sp.csr_matrix(counts),
+            'tfidf': sp.csr_matrix(tfidf),
+            'nmf_weights': nmf_weights,
+            'essays': list(documents['Essay'])}
+
+
+def update_topics(model, documents, nmf_iterations = 50):
+    '''
+    Warm start both models with new documents instead of refitting.
+
+    New words that aren't in the saved vocabulary are ignored, as they would be
+    by any fitted vectorizer.
+
+    Parameters
+    ----------
+    model : dict
+        model from fit_topics() or load_topics().
+    documents : DataFrame
+        'Essay' and cleaned 'lines' columns for the new documents.
+    nmf_iterations : int
+        iterations of NMF to run from the previous factors.
+
+    Returns
+    -------
+    model : dict
+        the same model, updated in place.
+
+    '''
+    counts = model['count_vectorizer'].transform(documents['lines'])
+    tfidf = model['tfidf_transformer'].transform(counts)
+
+    # Online LDA: one more pass of variational updates on just the new rows,
+    # weighted as their share of the (now bigger) corpus
+    model['lda'].total_samples = len(model['essays']) + counts.shape[0]
+    model['lda'].partial_fit(counts)
+
+    # NMF: start from the current topics, with the new rows' weights from
+    # projecting them onto those topics, and run a few more iterations
+    nmf = model['nmf']
+    all_tfidf = sp.vstack([model['tfidf'], tfidf], format = 'csr')
+    weights = np.vstack([model['nmf_weights'], nmf.transform(tfidf)])
+
+    warm = NMF(n_components = nmf.n_components_, init = 'custom',
+               max_iter = nmf_iterations, random_state = nmf.random_state)
+    model['nmf_weights'] = warm.fit_transform(all_tfidf, W = weights, H = nmf.components_.copy())
+    model['nmf'] = warm
+
+    model['counts'] = sp.vstack([model['counts'], counts], format = 'csr')
+    model['tfidf'] = all_tfidf
+    model['essays'] = model['essays'] + list(documents['Essay'])
+
+    return model
+
+
+def save_topics(model, path = TOPIC_MODEL_PATH):
+    '''
+    Pickle a model built by fit_topics().
+    '''
+    with open(path, 'wb') as f:
+        pickle.dump(model, f, protocol = pickle.HIGHEST_PROTOCOL)
+
+
+def load_topics(path = TOPIC_MODEL_PATH):
+    '''
+    Load a model saved with save_topics().
+    '''
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+# ----------------------------------------------------------------------------
+#                                 Results
+# ----------------------------------------------------------------------------
+def top_words(model, method = 'nmf', n_words = 10):
+    '''
+    The highest weighted words in every topic.
+
+    Parameters
+    ----------
+    model : dict
+        model from fit_topics() or load_topics().
+    method : string
+        'nmf' or 'lda'.
+    n_words : int
+        words per topic.
+
+    Returns
+    -------
+    words : DataFrame
+        one row per topic with its top words, best first.
+
+    '''
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method!r}, pick one of {METHODS}")
+
+    vocab = model['count_vectorizer'].get_feature_names_out()
+    components = model[method].components_
+    top = np.argsort(-components, axis = 1)[:, :n_words]
+
+    return pd.DataFrame({'topic': range(len(components)),
+                         'words': [", ".join(vocab[row]) for row in top]})
+
+
+def topic_mixtures(model, method = 'nmf', authors = None):
+    '''
+    Per-essay topic mixtures joined to Author and Date.
+
+    Parameters
+    ----------
+    model : dict
+        model from fit_topics() or load_topics().
+    method : string
+        'nmf' or 'lda'.
+    authors : DataFrame, optional
+        'Essay', 'Author' and 'Date' columns. Defaults to
+        corpus.load_authorship().
+
+    Returns
+    -------
+    mixtures : DataFrame
+        Essay, Author, Date, a topic_<n> column per topic (each row sums to 1)
+        and the essay's dominant topic.
+
+    '''
+    if method == 'nmf':
+        weights = model['nmf_weights']
+    elif method == 'lda':
+        weights = model['lda'].transform(model['counts'])
+    else:
+        raise ValueError(f"Unknown method {method!r}, pick one of {METHODS}")
+
+    # NMF weights aren't proportions, so scale each row to sum to one
+    totals = weights.sum(axis = 1, keepdims = True)
+    weights = np.divide(weights, totals, out = np.zeros_like(weights), where = totals > 0)
+
+    mixtures = pd.DataFrame(weights, columns = [f"topic_{i}" for i in range(weights.shape[1])])
+    mixtures.insert(0, 'Essay', model['essays'])
+    mixtures['dominant_topic'] = weights.argmax(axis = 1)
+
+    if authors is None:
+        authors = corpus.load_authorship()
+
+    return mixtures.merge(authors[['Essay', 'Author', 'Date']], on = 'Essay', how = 'left') \
+        [['Essay', 'Author', 'Date'] + list(mixtures.columns[1:])]
+
+
+#%%
+if __name__ == '__main__':
+    if os.path.exists(TOPIC_MODEL_PATH):
+        fed_topics = load_topics()
+    else:
+        fed_topics = fit_topics()
+        save_topics(fed_topics)
+
+    for method in METHODS:
+        print(f"\n{method.upper()} topics")
+        print(top_words(fed_topics, method).to_string(index = False))
+
+        mixtures = topic_mixtures(fed_topics, method)
+        print(mixtures.groupby('Author')[[c for c in mixtures if c.startswith('topic_')]].mean().round(3))
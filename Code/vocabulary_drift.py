@@ -0,0 +1,254 @@
+##Vocabulary Drift - How the essays' vocabulary moves over the publication timeline
+
+# ----------------------------------------------------------------------------
+#                                Purpose
+# ----------------------------------------------------------------------------
+# The purpose of this module is to finally use the Date column that
+# Data Load Script.py parses and merges in. We put the essays in publication
+# order and look at how the vocabulary changes:
+#   1. rolling windows of essays, each compared (Jensen-Shannon and KL
+#      divergence) with the window just before it and with the whole corpus,
+#   2. per-author drift: how far each essay moves from the author's running
+#      vocabulary up to that point.
+#
+# The essay-by-term counts are turned into a cumulative sum once, so every
+# window's term distribution is a subtraction of two rows (O(vocab)) rather
+# than a fresh groupby.
+#
+# About 10 essays (the McLean's edition ones) have no date ('--' in the
+# authorship table, NaT after parsing). essay_timeline() handles them
+# explicitly, see its missing argument.
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+import corpus
+
+
+MISSING_DATES = ('by_number', 'last', 'drop')
+
+
+# ----------------------------------------------------------------------------
+#                                Loading
+# ----------------------------------------------------------------------------
+def load_tokens(csv_path = corpus.FULL_FEDPAPERS_CSV):
+    '''
+    Load the token, author and date columns from full_fedpapers.csv.
+
+    Returns
+    -------
+    tokens : DataFrame
+        Essay, Word, lemmatized_word, Author and Date columns (plus
+        line_index), in text order.
+
+    '''
+    tokens = corpus.load_tokens(csv_path, ['Essay', 'Word', 'lemmatized_word', 'Author', 'Date'])
+    tokens['Date'] = pd.to_datetime(tokens['Date'], errors = 'coerce')
+
+    return tokens
+
+
+def essay_timeline(tokens, missing = 'by_number'):
+    '''
+    Put the essays in publication order.
+
+    Parameters
+    ----------
+    tokens : DataFrame
+        needs Essay, Author and Date columns.
+    missing : string
+        what to do with essays that have no date:
+            'by_number' | slot them in after the dated essay just before them in
+                          essay number order (the numbering roughly follows
+                          publication order),
+            'last'      | put them after every dated essay, in number order,
+            'drop'      | leave them out.
+
+    Returns
+    -------
+    timeline : DataFrame
+        Essay, Author, Date, number and date_imputed columns, in order.
+
+    '''
+    if missing not in MISSING_DATES:
+        raise ValueError(f"Unknown missing-date policy {missing!r}, pick one of {MISSING_DATES}")
+
+    timeline = tokens[['Essay', 'Author', 'Date']].drop_duplicates('Essay').copy()
+    timeline['number'] = timeline['Essay'].str.extract(r'(\d+)', expand = False).astype(float)
+    timeline['date_imputed'] = timeline['Date'].isna()
+    timeline = timeline.sort_values('number', kind = 'stable')
+
+    if missing == 'drop':
+        timeline = timeline[~timeline['date_imputed']]
+        sort_date = timeline['Date']
+    elif missing == 'by_number':
+        # Borrow the date of the closest earlier dated essay (or the first date,
+        # if nothing before it has one)
+        sort_date = timeline['Date'].ffill().bfill()
+    else:
+        sort_date = timeline['Date'].fillna(pd.Timestamp.max)
+
+    return timeline.assign(_sort_date = sort_date) \
+        .sort_values(['_sort_date', 'number'], kind = 'stable') \
+        .drop(columns = '_sort_date') \
+        .reset_index(drop = True)
+
+
+def count_matrix(tokens, essays, column = 'lemmatized_word'):
+    '''
+    Essay-by-term counts, with rows in the given essay order.
+
+    Parameters
+    ----------
+    tokens : DataFrame
+        needs Essay and column.
+    essays : list
+        essays to keep, in row order.
+    column : string
+        which word column to count.
+
+    Returns
+    -------
+    counts : array
+        n_essays x n_terms int64 counts.
+    vocab : Index
+        the term of every column.
+
+    '''
+    tokens = tokens[tokens['Essay'].isin(essays)]
+    rows = pd.Categorical(tokens['Essay'], categories = essays).codes
+    cols, vocab = pd.factorize(tokens[column])
+
+    counts = sp.coo_matrix((np.ones(len(rows), dtype = np.int64), (rows, cols)),
+                           shape = (len(essays), len(vocab))).toarray()
+
+    return counts, vocab
+
+
+# ----------------------------------------------------------------------------
+#                               Divergences
+# ----------------------------------------------------------------------------
+def _distributions(counts, alpha):
+    # Add-alpha smoothing keeps KL finite when a word is missing from a window
+    smoothed = counts + alpha
+    return smoothed / smoothed.sum(axis = -1, keepdims = True)
+
+
+def kl_divergence(p, q):
+    '''
+    KL(p || q) in bits, row by row.
+    '''
+    return np.sum(p * np.log2(p / q), axis = -1)
+
+
+def js_divergence(p, q):
+    '''
+    Jensen-Shannon divergence in bits (0 to 1), row by row.
+    '''
+    m = (p + q) / 2
+    return (kl_divergence(p, m) + kl_divergence(q, m)) / 2
+
+
+def rolling_divergence(counts, timeline, window = 5, alpha = 0.01):
+    '''
+    Term distributions over a rolling window of essays, compared with the
+    window right before it and with the whole corpus.
+
+    Parameters
+    ----------
+    counts : array
+        essay-by-term counts in timeline order (see count_matrix()).
+    timeline : DataFrame
+        output of essay_timeline(), matching the rows of counts.
+    window : int
+        number of essays per window, from 1 to the number of essays.
+    alpha : float
+        add-alpha smoothing for the distributions.
+
+    Returns
+    -------
+    divergence : DataFrame
+        one row per window: first and last essay and date, JS and KL against
+        the previous (non-overlapping) window, and JS against the corpus.
+
+    '''
+    if not 1 <= window <= len(counts):
+        raise ValueError(f"window must be between 1 and the number of essays "
+                         f"({len(counts)}), got {window}")
+
+    # Every window sum is the difference of two cumulative rows
+    cumulative = np.zeros((len(counts) + 1, counts.shape[1]), dtype = np.int64)
+    np.cumsum(counts, axis = 0, out = cumulative[1:])
+    windows = cumulative[window:] - cumulative[:-window]
+
+    p = _distributions(windows, alpha)
+    corpus_p = _distributions(cumulative[-1], alpha)
+
+    # Window i is compared with window i - window, the one that ends just
+    # before it starts
+    js_previous = np.full(len(p), np.nan)
+    kl_previous = np.full(len(p), np.nan)
+    js_previous[window:] = js_divergence(p[window:], p[:-window])
+    kl_previous[window:] = kl_divergence(p[window:], p[:-window])
+
+    starts = np.arange(len(p))
+    ends = starts + window - 1
+
+    return pd.DataFrame({'first_essay': timeline['Essay'].to_numpy()[starts],
+                         'last_essay': timeline['Essay'].to_numpy()[ends],
+                         'start_date': timeline['Date'].to_numpy()[starts],
+                         'end_date': timeline['Date'].to_numpy()[ends],
+                         'js_previous': js_previous,
+                         'kl_previous': kl_previous,
+                         'js_corpus': js_divergence(p, corpus_p)})
+
+
+def author_drift(counts, timeline, alpha = 0.01):
+    '''
+    For each author, how far every essay's vocabulary is from everything that
+    author had published before it.
+
+    Parameters
+    ----------
+    counts : array
+        essay-by-term counts in timeline order.
+    timeline : DataFrame
+        output of essay_timeline(), matching the rows of counts.
+    alpha : float
+        add-alpha smoothing for the distributions.
+
+    Returns
+    -------
+    drift : DataFrame
+        Author, Essay, Date, date_imputed, js_to_prior (against the author's
+        earlier essays) and js_to_author (against all of the author's essays).
+
+    '''
+    results = []
+    for author, rows in timeline.groupby('Author', sort = False).indices.items():
+        author_counts = counts[rows]
+
+        # The author's running vocabulary before each essay
+        prior = np.cumsum(author_counts, axis = 0) - author_counts
+
+        p = _distributions(author_counts, alpha)
+        js_to_prior = js_divergence(p, _distributions(prior, alpha))
+        js_to_prior[0] = np.nan
+
+        results.append(timeline.iloc[rows][['Author', 'Essay', 'Date', 'date_imputed']]
+                       .assign(js_to_prior = js_to_prior,
+                               js_to_author = js_divergence(p, _distributions(author_counts.sum(axis = 0), alpha))))
+
+    return pd.concat(results).reset_index(drop = True)
+
+
+#%%
+if __name__ == '__main__':
+    fed_tokens = load_tokens()
+    fed_timeline = essay_timeline(fed_tokens, missing = 'by_number')
+    print(f"{fed_timeline['date_imputed'].sum()} essays have no date and were placed by essay number")
+
+    fed_counts, fed_vocab = count_matrix(fed_tokens, list(fed_timeline['Essay']))
+
+    print(rolling_divergence(fed_counts, fed_timeline, window = 5).round(4))
+    print(author_drift(fed_counts, fed_timeline).groupby('Author')[['js_to_prior', 'js_to_author']].mean())
@@ -0,0 +1,32 @@
+# The modules in Code/ import each other by name (the scripts are run from the
+# project root with Code/ on the path), so put Code/ on the path for the tests.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'Code'))
+
+import pytest
+
+
+@pytest.fixture
+def offline_tagging(monkeypatch):
+    '''
+    Stand-ins for the NLTK models the tagging code loads (Punkt and the
+    perceptron tagger need nltk.download()): an untrained Punkt splitter and a
+    lookup tagger with empty tables, which falls back on its suffix rules.
+    '''
+    from nltk.tokenize import NLTKWordTokenizer
+    from nltk.tokenize.punkt import PunktSentenceTokenizer
+
+    import pos_tagging
+    import sentences
+
+    tagger = pos_tagging.LookupSuffixTagger({}, {})
+    word_tokenizer = NLTKWordTokenizer()
+
+    monkeypatch.setattr(sentences, '_punkt', PunktSentenceTokenizer)
+    monkeypatch.setattr(pos_tagging, 'get_tagger', lambda backend = 'perceptron': tagger)
+    monkeypatch.setattr(pos_tagging, 'get_perceptron_tagger', lambda: tagger)
+    monkeypatch.setattr(pos_tagging.nltk, 'word_tokenize', word_tokenizer.tokenize)
+
+    return tagger
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import ann_index
+import corpus
+import similarity_service
+from ann_index import LSHIndex
+
+
+@pytest.fixture(scope = 'module')
+def model():
+    documents = corpus.essay_documents(stop = set(corpus.EXTRA_STOP_WORDS))
+    return similarity_service.build_model(documents, documents[['Essay']].assign(Author = 'Unknown'))
+
+
+@pytest.fixture(scope = 'module')
+def archive(model):
+    return ann_index.synthetic_archive(model['matrix'], 2000)
+
+
+def test_probing_every_bucket_is_exact(model, archive):
+    # One bit per table plus a probe on it covers both buckets, so every row
+    # is a candidate and the answer must be the exact one
+    index = LSHIndex(archive.shape[1], n_tables = 2, n_bits = 1, n_probes = 1)
+    index.add(archive)
+
+    ids, scores, n_candidates = index.query(model['matrix'][:10], k = 10)
+    exact = ann_index.exact_neighbors(archive, model['matrix'][:10], k = 10)
+
+    assert (n_candidates == archive.shape[0]).all()
+    assert all(list(a) == list(e) for a, e in zip(ids, exact))
+    assert np.allclose(scores[0], (archive[ids[0]] @ model['matrix'][0].T).toarray().ravel(), atol = 1e-5)
+
+
+def test_recall_with_fewer_candidates(model, archive):
+    index = LSHIndex(archive.shape[1], n_tables = 8, n_bits = 12, n_probes = 2)
+    index.add(archive)
+
+    ids, _, n_candidates = index.query(model['matrix'][:20], k = 10)
+    exact = ann_index.exact_neighbors(archive, model['matrix'][:20], k = 10)
+
+    assert n_candidates.mean() < archive.shape[0] / 2
+    assert ann_index.recall_at_k(ids, exact) >= 0.85
+
+
+def test_delta_buckets_answer_like_the_merged_tables(model, archive):
+    index = LSHIndex(archive.shape[1], n_tables = 8, n_bits = 10, n_probes = 1)
+    index.add(archive[:1500])
+    index.add(archive[1500:1600])
+    assert index._n_base == 1500 and len(index) == 1600
+
+    before = index.query(model['matrix'][:10], k = 5)
+    index.merge()
+    after = index.query(model['matrix'][:10], k = 5)
+
+    assert all(list(a) == list(b) for a, b in zip(before[0], after[0]))
+    assert (before[2] == after[2]).all()
+
+
+def test_exclude_self(model):
+    index = LSHIndex.from_model(model, n_tables = 2, n_bits = 1, n_probes = 1)
+
+    ids, _, _ = index.query(model['matrix'][:5], k = 3, exclude_self = True)
+
+    assert all(i not in row for i, row in enumerate(ids))
+
+
+def test_bad_arguments_are_rejected(archive):
+    with pytest.raises(ValueError):
+        LSHIndex(archive.shape[1], n_bits = 63)
+
+    with pytest.raises(ValueError):
+        LSHIndex(10).add(archive[:5])
@@ -0,0 +1,76 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import collocations
+from collocations import CooccurrenceCounter
+
+
+def naive_pairs(documents, window):
+    pairs = Counter()
+    for codes in documents:
+        for i, x in enumerate(codes):
+            for y in codes[i + 1:i + 1 + window]:
+                pairs[x, y] += 1
+    return pairs
+
+
+def documents(seed = 0, vocab_size = 30):
+    rng = np.random.default_rng(seed)
+    return [list(rng.integers(0, vocab_size, size = size)) for size in (1, 4, 57, 230)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 50, 1 << 20])
+def test_counts_match_naive_pairs(chunk_size):
+    docs = documents()
+    counter = CooccurrenceCounter(30, window = 4, chunk_size = chunk_size)
+    for codes in docs:
+        counter.add_document(codes)
+
+    counts = counter.matrix().todok()
+    expected = naive_pairs(docs, 4)
+
+    assert dict(counts.items()) == dict(expected)
+    assert list(counter.unigrams) == list(np.bincount(np.concatenate(docs), minlength = 30))
+
+
+def test_pairs_stay_within_a_document():
+    counter = CooccurrenceCounter(3, window = 5)
+    counter.add_document([0, 1])
+    counter.add_document([2])
+
+    assert counter.matrix()[1, 2] == 0
+    assert counter.matrix().sum() == 1
+
+
+def test_scores_match_the_formulas():
+    counter = CooccurrenceCounter(30, window = 4)
+    for codes in documents(seed = 1):
+        counter.add_document(codes)
+    counts = counter.matrix()
+
+    scores = collocations.association_scores(counts).set_index(['word_1', 'word_2'])
+    x, y = scores['count'].idxmax()
+    total = counts.sum()
+    observed = counts[x, y]
+    expected = counts[x].sum() * counts[:, y].sum() / total
+    pmi = math.log2(observed / expected)
+
+    assert scores.loc[(x, y), 'pmi'] == pytest.approx(pmi)
+    assert scores.loc[(x, y), 'npmi'] == pytest.approx(pmi / -math.log2(observed / total))
+    assert scores.loc[(x, y), 't_score'] == pytest.approx((observed - expected) / math.sqrt(observed))
+
+
+def test_top_collocations_per_author():
+    tokens = pd.DataFrame({'Essay': ['Essay 1'] * 6 + ['Essay 2'] * 6,
+                           'Author': ['Hamilton'] * 6 + ['Madison'] * 6,
+                           'lemmatized_word': ['common', 'defense', 'navy', 'common', 'defense', 'army',
+                                               'separate', 'power', 'union', 'separate', 'power', 'state']})
+
+    top = collocations.top_collocations(tokens, k = 1, window = 1, min_count = 2)
+
+    assert top[['Author', 'word_1', 'word_2']].values.tolist() == [['Hamilton', 'common', 'defense'],
+                                                                    ['Madison', 'separate', 'power']]
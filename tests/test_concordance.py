@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import concordance
+import corpus
+
+
+@pytest.fixture(scope = 'module')
+def tokens():
+    text_df = corpus.load_lines()
+    return concordance.tokens_from_lines(text_df[text_df['Essay'].isin(['Essay 1', 'Essay 10', 'Essay 51'])])
+
+
+@pytest.fixture(scope = 'module')
+def index(tokens):
+    return concordance.ConcordanceIndex(tokens)
+
+
+def brute_force_phrase(tokens, phrase):
+    words = tokens['lemmatized_word'].to_numpy()
+    essays = tokens['Essay'].to_numpy()
+    terms = phrase.split()
+    n = len(terms)
+
+    return [i for i in range(len(words) - n + 1)
+            if list(words[i:i + n]) == terms and essays[i] == essays[i + n - 1]]
+
+
+@pytest.mark.parametrize('term', ['the', 'faction', 'government', 'unknownword'])
+def test_positions_match_a_scan(tokens, index, term):
+    expected = np.flatnonzero(tokens['lemmatized_word'].to_numpy() == term)
+
+    assert list(index.positions(term)) == list(expected)
+    assert index.postings['lemma'].frequency(term) == len(expected)
+
+
+@pytest.mark.parametrize('phrase', ['the people', 'of the union', 'ambition must be made'])
+def test_phrases_match_a_scan(tokens, index, phrase):
+    assert list(index.phrase_positions(phrase)) == brute_force_phrase(tokens, phrase)
+
+
+def test_phrases_stop_at_essay_boundaries(tokens, index):
+    # The last word of one essay followed by the first word of the next
+    ends = np.flatnonzero(tokens['Essay'].to_numpy()[:-1] != tokens['Essay'].to_numpy()[1:])
+    words = tokens['lemmatized_word'].to_numpy()
+    phrase = f"{words[ends[0]]} {words[ends[0] + 1]}"
+
+    assert ends[0] not in index.phrase_positions(phrase)
+
+
+def test_concordance_context_stays_in_the_essay(tokens, index):
+    kwic = index.concordance('faction', width = 4)
+
+    assert len(kwic) == len(index.positions('faction'))
+    assert (kwic['keyword'].str.lower() == 'faction').all()
+    assert (kwic['left'].str.split().str.len() <= 4).all()
+
+
+def test_boolean_matches_set_logic(tokens, index):
+    vocab = tokens.groupby('Essay')['lemmatized_word'].agg(set)
+    expected = [essay for essay in index.essays
+                if 'faction' in vocab[essay] or ('senate' in vocab[essay] and 'king' not in vocab[essay])]
+
+    assert index.boolean('faction OR (senate AND NOT king)') == expected
+
+    with pytest.raises(ValueError):
+        index.boolean('(faction')
@@ -0,0 +1,26 @@
+import corpus
+
+
+STOP = set(corpus.EXTRA_STOP_WORDS)
+
+
+def test_essay_names():
+    assert corpus.essay_name('essay07.txt') == 'Essay 7'
+    assert corpus.essay_name('Data/essay85.txt') == 'Essay 85'
+    assert corpus.essay_name('letter_to_jay.txt') == 'letter_to_jay'
+
+
+def test_clean_text_lowercases_before_dropping_stop_words():
+    assert corpus.clean_text("The Union, it MUST be preserved; 1787!", stop = STOP) == 'union be preserved'
+
+
+def test_every_essay_is_loaded_in_order():
+    text_df = corpus.load_lines()
+    documents = corpus.essay_documents(stop = STOP)
+    numbers = [int(essay.split()[1]) for essay in documents['Essay']]
+
+    assert len(documents) == 85
+    assert numbers == sorted(numbers)
+    assert list(text_df['line_index']) == list(range(len(text_df)))
+    assert set(text_df['Essay']) == set(documents['Essay'])
+    assert not text_df['lines'].str.strip().eq('').any()
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import corpus
+from incremental import IncrementalCorpus
+
+
+STOP = set(corpus.EXTRA_STOP_WORDS)
+
+
+def essay_text(number):
+    return " ".join(corpus.read_essay_lines(os.path.join(corpus.DATA_DIR, f"essay{number:02d}.txt")))
+
+
+def brute_force_top(matrix, k):
+    similarity = (matrix @ matrix.T).toarray()
+    np.fill_diagonal(similarity, -np.inf)
+    return -np.sort(-similarity, axis = 1)[:, :k]
+
+
+def test_refresh_matches_tfidf_vectorizer():
+    fed_corpus = IncrementalCorpus.from_data_dir(stop = STOP)
+    documents = corpus.essay_documents(stop = STOP)
+
+    vectorizer = TfidfVectorizer(analyzer = str.split)
+    expected = vectorizer.fit_transform(documents['lines'])
+    columns = [fed_corpus.vocab[word] for word in vectorizer.get_feature_names_out()]
+
+    assert np.allclose(fed_corpus.matrix()[:, columns].toarray(), expected.toarray())
+    assert np.allclose(fed_corpus.top_scores, brute_force_top(fed_corpus.matrix(), fed_corpus.k))
+
+
+def test_adds_keep_top_k_exact():
+    fed_corpus = IncrementalCorpus.from_data_dir(stop = STOP, refresh_ratio = None)
+    for number in range(1, 11):
+        fed_corpus.add_document(f"Copy {number}", essay_text(number))
+
+    assert len(fed_corpus) == 95
+    assert np.allclose(fed_corpus.top_scores, brute_force_top(fed_corpus.matrix(), fed_corpus.k))
+    # An exact copy is its original's nearest neighbour
+    assert fed_corpus.similar('Copy 3')['Essay'][0] == 'Essay 3'
+
+    counts = fed_corpus.word_counts().set_index('Word')
+    assert counts['count'].sum() == sum(len(codes) for codes in fed_corpus.tokens)
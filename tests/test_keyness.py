@@ -0,0 +1,47 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import keyness
+
+
+TOKENS = pd.DataFrame({'Author': ['Hamilton'] * 6 + ['Madison'] * 6,
+                       'Word': ['court', 'court', 'court', 'jury', 'union', np.nan,
+                                'union', 'union', 'union', 'powers', 'court', 'jury']})
+
+
+def test_counts_leave_out_missing_words():
+    counts, groups, terms = keyness.group_term_matrix(TOKENS)
+    expected = TOKENS.groupby(['Author', 'Word']).size().unstack(fill_value = 0)
+
+    assert list(groups) == list(expected.index)
+    assert list(terms) == list(expected.columns)
+    assert (counts == expected.to_numpy()).all()
+
+
+def test_log_likelihood_matches_the_two_cell_formula():
+    counts, groups, terms = keyness.group_term_matrix(TOKENS)
+    scores = keyness.keyness_scores(counts)
+
+    # 'court' for Hamilton: 3 of his 5 words against 1 of Madison's 6
+    a, b, c, d = 3, 1, 5, 6
+    expected_a = c * (a + b) / (c + d)
+    expected_b = d * (a + b) / (c + d)
+    g2 = 2 * (a * math.log(a / expected_a) + b * math.log(b / expected_b))
+
+    row, col = list(groups).index('Hamilton'), list(terms).index('court')
+    assert scores['log_likelihood'][row, col] == pytest.approx(g2)
+
+
+def test_top_keywords():
+    top = keyness.top_keywords(TOKENS, k = 1, min_count = 2)
+
+    assert dict(zip(top['Author'], top['Word'])) == {'Hamilton': 'court', 'Madison': 'union'}
+
+
+@pytest.mark.parametrize('k', [0, -3])
+def test_k_below_one_is_rejected(k):
+    with pytest.raises(ValueError):
+        keyness.top_keywords(TOKENS, k = k)
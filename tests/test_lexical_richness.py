@@ -0,0 +1,84 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import lexical_richness
+from lexical_richness import RichnessAccumulator
+
+
+WINDOW = 20
+
+
+def naive_metrics(documents, window = WINDOW):
+    tokens = [code for codes in documents for code in codes]
+    counts = Counter(tokens)
+    n = len(tokens)
+    f = np.array(list(counts.values()))
+    ttrs = [len(set(codes[i - window:i])) / window
+            for codes in documents for i in range(window, len(codes) + 1)]
+
+    return {'n_tokens': n,
+            'n_types': len(counts),
+            'ttr': len(counts) / n,
+            'mattr': np.mean(ttrs) if ttrs else len(counts) / n,
+            'yules_k': 1e4 * ((f ** 2).sum() - n) / n ** 2,
+            'simpsons_d': (f * (f - 1)).sum() / (n * (n - 1)),
+            'hapax_ratio': (f == 1).sum() / len(counts),
+            'hapax_token_ratio': (f == 1).sum() / n,
+            'dis_ratio': (f == 2).sum() / len(counts)}
+
+
+def documents(seed = 0, vocab_size = 40):
+    rng = np.random.default_rng(seed)
+    # Skewed draws so there are plenty of repeats, hapaxes and dis legomena;
+    # one document is shorter than the window
+    return [list(rng.zipf(1.5, size = size) % vocab_size) for size in (150, 13, 97, 260)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 1 << 16])
+def test_chunked_updates_match_naive_counts(chunk_size):
+    docs = documents()
+    acc = RichnessAccumulator(40, WINDOW, chunk_size)
+    for codes in docs:
+        acc.update(codes)
+        acc.end_document()
+
+    result, expected = acc.metrics(), naive_metrics(docs)
+    for metric in lexical_richness.METRICS:
+        assert result[metric] == pytest.approx(expected[metric]), metric
+
+
+def test_token_at_a_time_matches_naive_counts():
+    docs = documents(seed = 1)
+    acc = RichnessAccumulator(40, WINDOW)
+    for codes in docs:
+        for code in codes:
+            acc.add(code)
+        acc.end_document()
+
+    result, expected = acc.metrics(), naive_metrics(docs)
+    for metric in lexical_richness.METRICS:
+        assert result[metric] == pytest.approx(expected[metric]), metric
+
+
+def test_short_document_falls_back_to_ttr():
+    acc = RichnessAccumulator(10, WINDOW)
+    acc.update([1, 2, 2, 3])
+
+    assert acc.metrics()['mattr'] == acc.metrics()['ttr'] == 0.75
+
+
+def test_stream_richness_pools_each_author():
+    docs = documents(seed = 2)
+    authors = ['Hamilton', 'Madison', 'Hamilton', 'Madison']
+
+    by_essay, by_author = lexical_richness.stream_richness(
+        ((f"Essay {i}", author, codes) for i, (author, codes) in enumerate(zip(authors, docs))),
+        40, WINDOW)
+
+    for i, codes in enumerate(docs):
+        assert by_essay.loc[i, 'mattr'] == pytest.approx(naive_metrics([codes])['mattr'])
+    hamilton = by_author.set_index('Author').loc['Hamilton']
+    assert hamilton['mattr'] == pytest.approx(naive_metrics([docs[0], docs[2]])['mattr'])
+    assert hamilton['n_tokens'] == len(docs[0]) + len(docs[2])
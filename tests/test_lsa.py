@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pytest
+
+import corpus
+import lsa
+import similarity_service
+
+
+STOP = set(corpus.EXTRA_STOP_WORDS)
+
+
+@pytest.fixture(scope = 'module')
+def documents():
+    return corpus.essay_documents(stop = STOP)
+
+
+@pytest.fixture(scope = 'module')
+def model(documents):
+    model = similarity_service.build_model(documents, documents[['Essay']].assign(Author = 'Unknown'))
+    return lsa.build_lsa(model, n_components = 20)
+
+
+def test_embeddings_are_unit_rows(model):
+    embeddings = model['embeddings']
+
+    assert embeddings.shape == (85, 20)
+    assert embeddings.dtype == np.float32 and embeddings.flags['C_CONTIGUOUS']
+    assert np.allclose(np.linalg.norm(embeddings, axis = 1), 1, atol = 1e-5)
+
+
+def test_essay_text_projects_onto_its_embedding(model):
+    texts = [" ".join(corpus.read_essay_lines(os.path.join(corpus.DATA_DIR, name)))
+             for name in corpus.list_essay_files()[:5]]
+
+    projected = lsa.embed_text(model, texts, stop = STOP)
+
+    assert np.allclose(projected, model['embeddings'][:5], atol = 1e-5)
+
+
+def test_lsa_queries_skip_the_essay_itself(model):
+    results = similarity_service.query_similar(model, essay = 'Essay 52', k = 5, stop = STOP, mode = 'lsa')
+
+    assert len(results) == 5
+    assert 'Essay 52' not in [r['essay'] for r in results]
+    assert [r['score'] for r in results] == sorted((r['score'] for r in results), reverse = True)
+
+
+def test_project_needs_the_svd(model):
+    without = {key: value for key, value in model.items() if key not in ('svd', 'embeddings')}
+
+    with pytest.raises(ValueError):
+        lsa.project(without, model['matrix'][:1])
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+import pipeline
+from pipeline import Pipeline, Stage
+
+
+def numbers():
+    return [1, 2, 3]
+
+
+def doubled(numbers):
+    return [2 * x for x in numbers]
+
+
+def total(numbers, doubled):
+    return sum(numbers) + sum(doubled)
+
+
+def build(tmp_path, executor = 'thread'):
+    return Pipeline([Stage('numbers', numbers, outputs = [tmp_path / 'numbers.pkl'],
+                           sources = [str(tmp_path / 'numbers.txt')]),
+                     Stage('doubled', doubled, inputs = ['numbers'], outputs = [tmp_path / 'doubled.pkl'],
+                           executor = executor),
+                     Stage('total', total, inputs = ['numbers', 'doubled'], outputs = [tmp_path / 'total.pkl'])])
+
+
+def test_order_puts_inputs_first(tmp_path):
+    stages = build(tmp_path)
+
+    assert stages.order() == ['numbers', 'doubled', 'total']
+    assert stages.order(['doubled']) == ['numbers', 'doubled']
+
+
+def test_cycles_and_unknown_stages_are_rejected(tmp_path):
+    stages = Pipeline([Stage('a', numbers, inputs = ['b']), Stage('b', numbers, inputs = ['a'])])
+    with pytest.raises(ValueError):
+        stages.order()
+
+    with pytest.raises(KeyError):
+        Pipeline([Stage('a', numbers, inputs = ['missing'])]).order()
+
+    with pytest.raises(ValueError):
+        stages.add(Stage('a', numbers))
+
+
+@pytest.mark.parametrize('executor', pipeline.EXECUTORS)
+def test_run_then_skip_when_up_to_date(tmp_path, executor):
+    stages = build(tmp_path, executor)
+
+    results, report = stages.run(verbose = False)
+    assert results['total'] == 18
+    assert list(report['status']) == ['ran'] * 3
+
+    results, report = stages.run(verbose = False)
+    assert results['total'] == 18
+    assert list(report['status']) == ['skipped'] * 3
+
+
+def test_changes_rerun_everything_downstream(tmp_path):
+    stages = build(tmp_path)
+    stages.run(verbose = False)
+
+    _, report = stages.run(force = ['doubled'], verbose = False)
+    assert list(report['status']) == ['skipped', 'ran', 'ran']
+
+    # A source newer than the outputs makes the stage (and what follows) stale
+    source = tmp_path / 'numbers.txt'
+    source.write_text('1 2 3')
+    later = os.path.getmtime(tmp_path / 'total.pkl') + 10
+    os.utime(source, (later, later))
+
+    assert stages.plan()['numbers'] == f"{os.path.relpath(source, pipeline.corpus.PROJECT_DIR)} changed"
+    assert all(stages.plan().values())
+
+
+def test_failing_stage_raises(tmp_path):
+    def broken(numbers):
+        raise RuntimeError('broken stage')
+
+    stages = Pipeline([Stage('numbers', numbers), Stage('broken', broken, inputs = ['numbers'])])
+
+    with pytest.raises(RuntimeError):
+        stages.run(verbose = False)
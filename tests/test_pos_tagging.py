@@ -0,0 +1,59 @@
+import os
+import pickle
+import shutil
+
+import pytest
+
+import corpus
+import pos_tagging
+
+
+STOP = set(corpus.EXTRA_STOP_WORDS)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    folder = tmp_path / 'Data'
+    folder.mkdir()
+    for number in range(1, 11):
+        shutil.copy(os.path.join(corpus.DATA_DIR, f"essay{number:02d}.txt"), folder)
+    return str(folder)
+
+
+def test_lookup_tagger_learns_most_frequent_tag():
+    tagger = pos_tagging.LookupSuffixTagger.train([[('The', 'DT'), ('union', 'NN')],
+                                                   [('union', 'NN'), ('union', 'VB')]])
+
+    assert tagger.tag(['the', 'union', 'quickly', 'governing']) == \
+        [('the', 'DT'), ('union', 'NN'), ('quickly', 'RB'), ('governing', 'VBG')]
+
+
+def test_lookup_cache_is_retrained_when_essays_change(offline_tagging, data_dir, tmp_path):
+    path = str(tmp_path / 'lookup_tagger.pkl')
+
+    pos_tagging.get_lookup_tagger(path, data_dir)
+    with open(path, 'rb') as f:
+        first_key = pickle.load(f)['key']
+
+    os.remove(os.path.join(data_dir, 'essay10.txt'))
+    pos_tagging.get_lookup_tagger.cache_clear()
+    pos_tagging.get_lookup_tagger(path, data_dir)
+    with open(path, 'rb') as f:
+        second_key = pickle.load(f)['key']
+
+    assert first_key != second_key
+    assert second_key == pos_tagging.training_key(corpus.load_lines(data_dir)['lines'])
+
+
+@pytest.mark.parametrize('sentence_tagging', [True, False])
+def test_backend_agrees_with_its_own_reference(offline_tagging, data_dir, tmp_path, sentence_tagging):
+    # A reference csv tagged by the same tagger, the same way, must agree fully
+    csv_path = str(tmp_path / 'full_fedpapers.csv')
+    pos_tagging.tag_corpus(data_dir = data_dir, stop = STOP, sentence_tagging = sentence_tagging) \
+        .to_pandas().to_csv(csv_path, index = False)
+
+    comparison = pos_tagging.compare_backends(csv_path = csv_path, backends = ('perceptron',), stop = STOP,
+                                              sentence_tagging = sentence_tagging, data_dir = data_dir)
+
+    assert comparison.loc[0, 'agreement'] == 1.0
+    assert comparison.loc[0, 'compared'] > 0
@@ -0,0 +1,55 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import corpus
+import pos_tagging
+import sentences
+
+
+STOP = set(corpus.EXTRA_STOP_WORDS)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for number in (1, 10, 51):
+        shutil.copy(os.path.join(corpus.DATA_DIR, f"essay{number:02d}.txt"), tmp_path)
+    return str(tmp_path)
+
+
+def test_paragraphs_number_lines_like_load_lines():
+    paragraphs = sentences.load_paragraphs()
+    line_index = np.concatenate(list(paragraphs['line_index']))
+
+    assert (line_index == corpus.load_lines()['line_index'].to_numpy()).all()
+
+
+def test_tagging_pass_returns_the_sentences(offline_tagging, data_dir):
+    tokens, fed_sentences = pos_tagging.tag_corpus(data_dir = data_dir, stop = STOP,
+                                                   return_sentences = True)
+    segmented = sentences.segment_corpus(data_dir)
+
+    assert list(fed_sentences['n_words']) == list(segmented['n_words'])
+    pd.testing.assert_frame_equal(sentences.stylometry_features(fed_sentences),
+                                  sentences.stylometry_features(segmented))
+
+    # Every kept token sits on the line its sentence says it came from
+    table = tokens.to_pandas()
+    text_df = corpus.load_lines(data_dir).set_index('line_index')
+    assert all(word in text_df.loc[line, 'lines']
+               for word, line in zip(table['Word'], table['line_index']))
+
+
+def test_pos_features_of_a_subset(offline_tagging, data_dir):
+    fed_sentences = sentences.segment_corpus(data_dir)
+    subset = fed_sentences[fed_sentences['Essay'] != 'Essay 1']
+
+    features = sentences.pos_sequence_features(subset)
+
+    assert sorted(features.index) == ['Essay 10', 'Essay 51']
+    pd.testing.assert_frame_equal(features, sentences.pos_sequence_features(subset.reset_index(drop = True)))
+    unigrams = sentences.pos_sequence_features(subset, n = 1, min_share = 0)
+    assert np.allclose(unigrams.sum(axis = 1), 1)
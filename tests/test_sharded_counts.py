@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+import corpus
+import sharded_counts
+
+
+STOP = set(corpus.EXTRA_STOP_WORDS)
+
+
+@pytest.fixture
+def fed_csv(tmp_path):
+    # A small stand-in for full_fedpapers.csv, with a stop word and a word
+    # pandas reads as missing ('NA'), both of which EDA.py's groupby drops
+    rows = [('Essay 1', 'Union'), ('Essay 1', 'union'), ('Essay 1', 'the'), ('Essay 1', 'NA'),
+            ('Essay 2', 'Union'), ('Essay 2', 'power'), ('Essay 10', 'power'), ('Essay 10', 'power'),
+            ('Essay 52', 'senate'), ('Essay 85', 'Union')]
+    path = tmp_path / 'full_fedpapers.csv'
+    pd.DataFrame(rows, columns = ['Essay', 'Word']).assign(Author = 'Hamilton').to_csv(path, index = False)
+
+    return str(path)
+
+
+def test_csv_counts_match_eda(fed_csv):
+    single = sharded_counts.count_single(csv_path = fed_csv)
+    sharded = sharded_counts.count_sharded(n_workers = 2, n_shards = 3, csv_path = fed_csv)
+
+    assert sharded_counts.check_identical(single, sharded)
+    assert sharded_counts.check_eda(single, fed_csv)
+
+    counts = sharded_counts.word_counts(single).set_index('Word')
+    assert counts.loc['Union', 'count'] == 3 and counts.loc['Union', 'doc_count'] == 3
+    assert counts.loc['power', 'count'] == 3 and counts.loc['power', 'doc_count'] == 2
+    assert 'the' not in counts.index and 'NA' not in counts.index
+
+
+def test_text_shards_match_single_process():
+    single = sharded_counts.count_single(stop = STOP)
+    sharded = sharded_counts.count_sharded(n_workers = 2, n_shards = 5, stop = STOP)
+
+    assert sharded_counts.check_identical(single, sharded)
+    assert len(single['essays']) == 85
+
+
+def test_reduce_dir_rejects_mixed_and_missing_shards(fed_csv, tmp_path):
+    out_dir = str(tmp_path / 'shards')
+    for shard in range(3):
+        sharded_counts.run_shard(shard, 3, out_dir = out_dir, csv_path = fed_csv)
+    assert sharded_counts.check_identical(sharded_counts.reduce_dir(out_dir),
+                                          sharded_counts.count_single(csv_path = fed_csv))
+
+    # A leftover from a two-shard run
+    sharded_counts.run_shard(0, 2, out_dir = out_dir, csv_path = fed_csv)
+    with pytest.raises(ValueError, match = 'shard counts'):
+        sharded_counts.reduce_dir(out_dir)
+
+    for name in ('part-0000-of-0002', 'part-0001-of-0003'):
+        (tmp_path / 'shards' / f"{name}.json").unlink()
+    with pytest.raises(ValueError, match = 'Missing shards'):
+        sharded_counts.reduce_dir(out_dir)
+
+
+def test_reduce_rejects_repeated_essays(fed_csv):
+    partial = sharded_counts.map_csv(fed_csv, ['Essay 1', 'Essay 2'], sharded_counts.EDA_STOP_WORDS)
+
+    with pytest.raises(ValueError, match = 'Essay 1'):
+        sharded_counts.reduce_counts([partial, partial])
@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+import corpus
+import similarity_service
+
+
+STOP = set(corpus.EXTRA_STOP_WORDS)
+
+
+@pytest.fixture(scope = 'module')
+def model():
+    documents = corpus.essay_documents(stop = STOP)
+    authors = documents[['Essay']].assign(Author = 'Unknown')
+    return similarity_service.build_model(documents, authors)
+
+
+def test_query_batch_matches_brute_force(model):
+    results = similarity_service.query_batch(model, [{'essay': 'Essay 52'}], k = 5, stop = STOP)[0]
+
+    row = model['essays'].index('Essay 52')
+    scores = (model['matrix'] @ model['matrix'][row].T).toarray().ravel()
+    scores[row] = -np.inf
+    expected = [model['essays'][i] for i in np.argsort(-scores, kind = 'stable')[:5]]
+
+    assert [r['essay'] for r in results] == expected
+
+
+def test_k_below_one_is_rejected(model):
+    with pytest.raises(ValueError):
+        similarity_service.query_batch(model, [{'essay': 'Essay 52'}], k = 0, stop = STOP)
+
+    service = similarity_service.SimilarityService(model, stop = STOP)
+    with pytest.raises(ValueError):
+        asyncio.run(service.query(essay = 'Essay 52', k = -1))
+
+
+def test_cancelled_query_does_not_break_the_batch(model):
+    service = similarity_service.SimilarityService(model, batch_window = 10, stop = STOP)
+
+    async def run():
+        gone = asyncio.ensure_future(service.query(essay = 'Essay 1'))
+        bad = asyncio.ensure_future(service.query(essay = 'Essay 999'))
+        kept = asyncio.ensure_future(service.query(text = 'the executive power', k = 3))
+        await asyncio.sleep(0)
+        gone.cancel()
+        bad.cancel()
+        await asyncio.sleep(0)
+        service._flush()
+        return await kept
+
+    assert len(asyncio.run(run())) == 3
+
+
+def request(model, raw):
+    '''
+    Send one raw HTTP request through the connection handler and return the
+    status code and decoded JSON body.
+    '''
+    service = similarity_service.SimilarityService(model, stop = STOP)
+
+    async def run():
+        server = await asyncio.start_server(
+            lambda r, w: similarity_service._handle_connection(service, r, w), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(raw)
+            if writer.can_write_eof():
+                writer.write_eof()
+            response = await reader.read()
+            writer.close()
+        return response
+
+    head, _, body = asyncio.run(run()).partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+def post(body, length = None):
+    length = len(body) if length is None else length
+    return (f"POST /similar HTTP/1.0\r\nContent-Length: {length}\r\n\r\n").encode('latin-1') + body
+
+
+def test_http_bad_requests_get_400(model):
+    assert request(model, b"GET /similar?essay=Essay%2052&k=0 HTTP/1.0\r\n\r\n")[0] == 400
+    assert request(model, post(b'[1]'))[0] == 400
+    assert request(model, post(b'{"essay": "Essay 52"}', length = 100))[0] == 400
+
+
+def test_http_query(model):
+    status, payload = request(model, post(b'{"essay": "Essay 52", "k": 2}'))
+
+    assert status == 200
+    assert len(payload['results']) == 2
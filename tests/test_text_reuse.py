@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+import concordance
+import corpus
+import text_reuse
+
+
+def essay_lines(essay):
+    text_df = corpus.load_lines()
+    return text_df[text_df['Essay'] == essay].reset_index(drop = True)
+
+
+def test_passages_cover_every_token():
+    essay_codes = np.repeat([0, 1, 2], [120, 30, 101])
+    passages = text_reuse.make_passages(essay_codes, passage_length = 50, step = 25)
+
+    covered = np.zeros(len(essay_codes), dtype = bool)
+    for essay, start, end in passages.itertuples(index = False):
+        assert (essay_codes[start:end] == essay).all()
+        covered[start:end] = True
+    assert covered.all()
+
+
+def test_single_essay_has_no_reuse():
+    tokens = concordance.tokens_from_lines(essay_lines('Essay 10'))
+
+    assert len(text_reuse.detect_reuse(tokens, cross_essay_only = False)) == 0
+
+
+def test_planted_passage_is_found():
+    first, second = essay_lines('Essay 1'), essay_lines('Essay 2')
+    planted = " ".join(first['lines'][3:6])
+    n_planted = len(planted.split())
+
+    lines = list(first['lines']) + list(second['lines'][:10]) + [planted] + list(second['lines'][10:])
+    text_df = pd.DataFrame({'line_index': range(len(lines)),
+                            'Essay': ['Essay 1'] * len(first) + ['Essay 2'] * (len(second) + 1),
+                            'lines': lines})
+
+    reuse = text_reuse.detect_reuse(concordance.tokens_from_lines(text_df))
+
+    assert n_planted >= 30
+    assert len(reuse) >= 1
+    assert (reuse['Essay_a'] == 'Essay 1').all() and (reuse['Essay_b'] == 'Essay 2').all()
+    assert reuse['words'].max() >= n_planted - 2
@@ -0,0 +1,35 @@
+import pandas as pd
+
+from token_table import StringPool, TokenTable
+
+
+def test_pool_interns_strings():
+    pool = StringPool()
+
+    assert pool.add('union') == pool.add('union') == 0
+    assert pool.add('states') == 1
+    assert len(pool) == 2 and pool[1] == 'states'
+
+
+def test_to_pandas_round_trips_the_tokens():
+    rows = [(0, 'Essay 1', 'The', 'the', 'DT', 0),
+            (0, 'Essay 1', 'union', 'union', 'NN', 1),
+            (5, 'Essay 2', 'The', 'the', 'DT', 0),
+            (5, 'Essay 2', 'states', 'state', 'NNS', 1)]
+    lines = {0: 'The union', 5: 'The states'}
+
+    table = TokenTable()
+    for line_index, line in lines.items():
+        table.add_line(line_index, line)
+    for row in rows:
+        table.append(*row)
+
+    tokens = table.to_pandas(offsets = True)
+    expected = pd.DataFrame(rows, columns = ['line_index', 'Essay', 'Word', 'lemmatized_word',
+                                             'part_of_speech', 'offset'])
+    expected['Lines'] = expected['line_index'].map(lines)
+
+    assert len(table) == 4
+    assert table.nbytes == 4 * 21
+    for column in expected.columns:
+        assert list(tokens[column].astype(object)) == list(expected[column])
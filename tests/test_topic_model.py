@@ -0,0 +1,23 @@
+import numpy as np
+
+import corpus
+import topic_model
+
+
+def test_one_essay_update_keeps_topics_stable():
+    # The extra stop list alone, so the test doesn't need the NLTK corpora
+    documents = corpus.essay_documents(stop = set(corpus.EXTRA_STOP_WORDS))
+    model = topic_model.fit_topics(documents.iloc[:80], n_jobs = 1)
+    before = model['lda'].components_.copy()
+
+    topic_model.update_topics(model, documents.iloc[80:81])
+    after = model['lda'].components_
+
+    # One essay out of 81 should add about its share of the mass, not swamp it
+    assert after.sum() < 1.1 * before.sum()
+
+    # and no topic's word distribution should be replaced outright
+    before = before / before.sum(axis = 1, keepdims = True)
+    after = after / after.sum(axis = 1, keepdims = True)
+    assert np.abs(after - before).sum(axis = 1).max() < 0.5
+    assert len(model['essays']) == 81
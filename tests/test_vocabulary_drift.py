@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import vocabulary_drift
+
+
+def test_undated_essays_keep_no_date(tmp_path):
+    csv_path = tmp_path / 'full_fedpapers.csv'
+    pd.DataFrame({'line_index': [0, 1, 2],
+                  'Essay': ['Essay 1', 'Essay 2', 'Essay 3'],
+                  'Word': ['union', 'states', 'power'],
+                  'lemmatized_word': ['union', 'state', 'power'],
+                  'Author': ['Hamilton', 'Madison', 'Jay'],
+                  'Date': ['1787-10-27', '', '1787-11-02']}).to_csv(csv_path, index = False)
+
+    tokens = vocabulary_drift.load_tokens(csv_path)
+    timeline = vocabulary_drift.essay_timeline(tokens, missing = 'by_number')
+
+    assert tokens['Date'].isna().tolist() == [False, True, False]
+    assert list(timeline['Essay']) == ['Essay 1', 'Essay 2', 'Essay 3']
+    assert list(timeline['date_imputed']) == [False, True, False]
+
+
+def test_rolling_windows_match_direct_sums():
+    rng = np.random.default_rng(0)
+    counts = rng.integers(0, 5, size = (12, 30))
+    timeline = pd.DataFrame({'Essay': [f"Essay {i}" for i in range(1, 13)],
+                             'Date': pd.date_range('1787-10-27', periods = 12)})
+    window = 4
+
+    divergence = vocabulary_drift.rolling_divergence(counts, timeline, window = window)
+
+    p = vocabulary_drift._distributions(
+        np.array([counts[i:i + window].sum(axis = 0) for i in range(len(counts) - window + 1)]), 0.01)
+    assert len(divergence) == len(p)
+    assert np.isnan(divergence['js_previous'][:window]).all()
+    assert np.allclose(divergence['js_previous'][window:],
+                       vocabulary_drift.js_divergence(p[window:], p[:-window]))
+    assert list(divergence['last_essay'][:1]) == ['Essay 4']
+
+
+@pytest.mark.parametrize('window', [0, -1, 13])
+def test_window_out_of_range_is_rejected(window):
+    counts = np.ones((12, 3), dtype = np.int64)
+    timeline = pd.DataFrame({'Essay': [f"Essay {i}" for i in range(1, 13)],
+                             'Date': pd.date_range('1787-10-27', periods = 12)})
+
+    with pytest.raises(ValueError):
+        vocabulary_drift.rolling_divergence(counts, timeline, window = window)